@@ -1,19 +1,832 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from matplotlib.patches import Rectangle
+import os
 import random
+import hashlib
+import json
+import time
+import weakref
+import cProfile
+import pstats
+from collections import Counter, deque
+from contextlib import contextmanager, nullcontext
+
+from tiled_pheromone import TiledPheromone
+
+
+# marks every anchor cell where a cart footprint would overlap an obstacle or leave the grid
+def build_cart_clearance(obstacles, cart_size):
+    h, w = obstacles.shape
+    cart_h, cart_w = cart_size
+    blocked = np.ones((h, w), dtype=bool)
+    if cart_h > h or cart_w > w:
+        return blocked
+
+    # summed-area table so each footprint sum is four lookups
+    sat = np.zeros((h + 1, w + 1), dtype=np.int64)
+    sat[1:, 1:] = obstacles.cumsum(axis=0).cumsum(axis=1)
+    rows = h - cart_h + 1
+    cols = w - cart_w + 1
+    counts = (sat[cart_h:, cart_w:] - sat[:rows, cart_w:]
+              - sat[cart_h:, :cols] + sat[:rows, :cols])
+    blocked[:rows, :cols] = counts > 0
+    return blocked
+
+
+# 8-connected moves in the order neighbors are offered to the ants
+DIRECTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1),
+              (-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+
+class NeighborTable:
+    # compiled adjacency over flat cell indices (y * width + x) in CSR form
+
+    def __init__(self, enterable):
+        h, w = enterable.shape
+        self.shape = (h, w)
+        self.width = w
+
+        # one column per direction, -1 where the move leaves the grid or hits a blocked cell
+        ys, xs = np.divmod(np.arange(h * w), w)
+        self.padded = self._moves(enterable, ys, xs)
+        self.enterable = enterable.reshape(-1)
+        self.size = h * w
+
+        valid = self.padded >= 0
+        self.indptr = np.zeros(h * w + 1, dtype=np.int32)
+        np.cumsum(valid.sum(axis=1), out=self.indptr[1:])
+        self.indices = self.padded[valid]
+
+        # plain lists make per-step slicing in the python walker cheap
+        self._indptr = self.indptr.tolist()
+        self._indices = self.indices.tolist()
+
+    # returns padded move rows for the cells at ys, xs
+    def _moves(self, enterable, ys, xs):
+        h, w = self.shape
+        padded = np.full((len(ys), len(DIRECTIONS)), -1, dtype=np.int32)
+        for k, (dy, dx) in enumerate(DIRECTIONS):
+            ny, nx = ys + dy, xs + dx
+            ok = (ny >= 0) & (ny < h) & (nx >= 0) & (nx < w)
+            ok[ok] = enterable[ny[ok], nx[ok]]
+            padded[ok, k] = ny[ok] * w + nx[ok]
+        return padded
+
+    # updates the table in place after enterable changed only inside rows y0:y1, columns x0:x1
+    def patch(self, enterable, y0, y1, x0, x1):
+        h, w = self.shape
+        self.enterable = enterable.reshape(-1)
+
+        # moves change for the window grown by one step, rebuild the flat span covering it
+        y0, y1, x0, x1 = max(y0 - 1, 0), min(y1 + 1, h), max(x0 - 1, 0), min(x1 + 1, w)
+        begin, end = y0 * w + x0, (y1 - 1) * w + x1
+        ys, xs = np.divmod(np.arange(begin, end), w)
+        rows = self._moves(enterable, ys, xs)
+        self.padded[begin:end] = rows
+
+        # splice the span into the CSR arrays and the walker's lists
+        valid = rows >= 0
+        counts = np.diff(self.indptr)
+        counts[begin:end] = valid.sum(axis=1)
+        lo, hi = self._indptr[begin], self._indptr[end]
+        self.indices = np.concatenate([self.indices[:lo], rows[valid], self.indices[hi:]])
+        np.cumsum(counts, out=self.indptr[1:])
+        self._indices[lo:hi] = rows[valid].tolist()
+        self._indptr = self.indptr.tolist()
+
+    # returns flat indices reachable in one step from flat index idx
+    def neighbors(self, idx):
+        return self._indices[self._indptr[idx]:self._indptr[idx + 1]]
+
+    # converts (y, x) position to flat index
+    def to_flat(self, pos):
+        return int(pos[0]) * self.width + int(pos[1])
+
+    # converts list of flat indices back to (y, x) positions
+    def to_positions(self, path):
+        ys, xs = np.divmod(np.asarray(path, dtype=np.int64), self.width)
+        return list(zip(ys.tolist(), xs.tolist()))
+
+    # wraps list or array of flat indices as a Route
+    def to_route(self, path):
+        return Route(path, self.width)
+
+
+class LayerStack:
+    # neighbor tables of several footprints stacked into one index space, layer k owns flat
+    # indices k * size up to (k + 1) * size, so one batch walk can move ants of every class
+
+    def __init__(self, tables):
+        self.size = tables[0].size
+        self.width = tables[0].width
+        self.padded = np.concatenate([np.where(t.padded >= 0, t.padded + k * self.size, -1)
+                                      for k, t in enumerate(tables)]).astype(np.int32)
+
+
+class Route:
+    # walked route stored as int32 flat cell indices (y * width + x)
+    # reads like a list of (y, x) tuples, np.asarray(route) gives an (n, 2) array for plotting
+
+    __slots__ = ('flat', 'width', '_yx')
+
+    def __init__(self, flat, width):
+        self.flat = np.asarray(flat, dtype=np.int32)
+        self.width = int(width)
+        self._yx = None
+
+    # builds a route from (y, x) positions
+    @classmethod
+    def from_positions(cls, positions, width):
+        yx = np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+        return cls(yx[:, 0] * width + yx[:, 1], width)
+
+    # joins consecutive legs into one route, dropping the repeated cell where legs meet
+    @classmethod
+    def join(cls, routes):
+        parts = [routes[0].flat] + [route.flat[1:] for route in routes[1:]]
+        return cls(np.concatenate(parts), routes[0].width)
+
+    # (n, 2) int32 array of (y, x) positions, computed on first use
+    @property
+    def yx(self):
+        if self._yx is None:
+            yx = np.empty((len(self.flat), 2), dtype=np.int32)
+            yx[:, 0], yx[:, 1] = np.divmod(self.flat, self.width)
+            self._yx = yx
+        return self._yx
+
+    def __len__(self):
+        return len(self.flat)
+
+    def __iter__(self):
+        return zip(*self.yx.T.tolist())
+
+    # an index gives a (y, x) tuple, a slice gives a Route sharing the same cells
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Route(self.flat[index], self.width)
+        y, x = divmod(int(self.flat[index]), self.width)
+        return (y, x)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.yx if dtype is None else self.yx.astype(dtype)
+
+    def __eq__(self, other):
+        if not isinstance(other, Route):
+            return NotImplemented
+        return self.width == other.width and np.array_equal(self.flat, other.flat)
+
+    def __hash__(self):
+        return hash((self.width, self.flat.tobytes()))
+
+    def __repr__(self):
+        return f'Route({len(self)} cells)'
+
+
+# returns route as a Route, converting lists of (y, x) positions
+def as_route(route, width):
+    return route if isinstance(route, Route) else Route.from_positions(route, width)
+
+
+# walks one ant from start to target (flat indices), returns visited cells or None on failure
+# heuristic is the flat per-target desirability field from FloorLayout.get_heuristic
+# rng is the random module or a random.Random instance giving the ant its own stream
+# stats is a Profiler counter dict that collects steps and failure reasons, None to skip
+def walk_leg(table, pheromone_map, heuristic, start, target, alpha, max_steps, rng=random,
+             stats=None):
+    pher = pheromone_map.reshape(-1)
+
+    path = [start]
+    visited = {start}
+    curr = start
+
+    for _ in range(max_steps):
+        if curr == target:
+            if stats is not None:
+                stats['steps'] += len(path) - 1
+            return path
+
+        nbrs = table.neighbors(curr)
+        if not nbrs:
+            if stats is not None:
+                stats['steps'] += len(path) - 1
+                stats['dead_ends'] += 1
+            return None
+
+        # pheromone and distance heuristic, zero weight for cells already visited
+        weights = []
+        for nbr in nbrs:
+            if nbr in visited:
+                weights.append(0)
+                continue
+            weights.append(pher[nbr] ** alpha * heuristic[nbr])
+
+        # every neighbor visited: pick uniformly
+        if sum(weights) == 0:
+            weights = None
+
+        curr = rng.choices(nbrs, weights=weights)[0]
+        path.append(curr)
+        visited.add(curr)
+
+    if stats is not None:
+        stats['steps'] += max_steps
+        stats['out_of_steps'] += 1
+    return None
+
+
+# advances num_ants ants together through the legs in targets (flat indices)
+# heuristics holds one flat heuristic field per leg
+# start may also give one cell per ant and targets one row of cells per leg, which lets a
+# LayerStack walk several vehicle classes at once
+# returns one int32 array of flat indices per ant, None for ants that failed
+# stats is a Profiler counter dict that collects steps and failure reasons, None to skip
+# one step costs about 2.1 us per ant with 50 ants, 0.58 with 500 and 0.39 with 2000 (warehouse),
+# but total time follows the number of ant steps: ants that fail wander up to max_steps, so a
+# warehouse iteration with 500 ants takes about 3x as long as one with 50; with the default 20
+# ants every numpy step moves only a few ants and the serial walker is about twice as fast
+def walk_batch(table, pheromone_map, heuristics, start, targets, num_ants, alpha, max_steps, rng,
+               stats=None):
+    if len(targets) == 0:
+        return [None] * num_ants
+
+    pher = pheromone_map.reshape(-1)
+    heur = np.stack(heuristics)
+    cells_per_leg = heur.shape[1]
+    heur = heur.reshape(-1)
+    size = table.size
+    layered = len(table.padded) > size # stacked class layers, visited is kept per layer cell
+    targets = np.asarray(targets, dtype=np.int64)
+    targets = np.broadcast_to(targets.reshape(len(targets), -1), (len(targets), num_ants))
+
+    pos = np.zeros(num_ants, dtype=np.int64)
+    pos[:] = start
+    starts = pos.copy()
+    leg = np.zeros(num_ants, dtype=np.int64)
+    steps = np.zeros(num_ants, dtype=np.int64)
+    active = np.ones(num_ants, dtype=bool)
+    reached = np.zeros(num_ants, dtype=bool)
+    # visited is kept per layer cell, an ant never leaves the layer it started on
+    visited = np.zeros((num_ants, size), dtype=bool)
+    visited[np.arange(num_ants), starts % size] = True
+    seen = visited.reshape(-1) # flat view, one 1d gather per step is cheaper than a 2d one
+
+    # every move is logged as (ant, cell) and regrouped into paths at the end
+    moved_ants = []
+    moved_to = []
+
+    while True:
+        ants = np.flatnonzero(active)
+
+        # ants out of steps on their current leg fail
+        out = steps[ants] >= max_steps
+        active[ants[out]] = False
+        ants = ants[~out]
+        if stats is not None:
+            stats['out_of_steps'] += int(out.sum())
+
+        # ants standing on their target start the next leg with a fresh visited set
+        arrived = ants[pos[ants] == targets[leg[ants], ants]]
+        while len(arrived):
+            leg[arrived] += 1
+            finished = leg[arrived] == len(targets)
+            reached[arrived[finished]] = True
+            active[arrived[finished]] = False
+            arrived = arrived[~finished]
+            visited[arrived] = False
+            visited[arrived, pos[arrived] % size] = True
+            steps[arrived] = 0
+            arrived = arrived[pos[arrived] == targets[leg[arrived], arrived]]
+
+        ants = np.flatnonzero(active)
+        if len(ants) == 0:
+            break
+
+        nbrs = table.padded[pos[ants]]
+        valid = nbrs >= 0
+        cells = np.where(valid, nbrs, 0)
+
+        # pheromone and distance heuristic, zero weight for cells already visited
+        weights = pher[cells]
+        if alpha != 1:
+            weights = weights ** alpha
+        weights = weights * heur[leg[ants][:, None] * cells_per_leg + cells]
+        local = cells % size if layered else cells
+        weights *= valid & ~seen[ants[:, None] * size + local]
+        cum = np.cumsum(weights, axis=1)
+
+        # every neighbor visited: pick uniformly, no neighbor at all: a dead end fails
+        stuck = cum[:, -1] == 0
+        if stuck.any():
+            cum[stuck] = np.cumsum(valid[stuck], axis=1)
+            dead = cum[:, -1] == 0
+            if dead.any():
+                if stats is not None:
+                    stats['dead_ends'] += int(dead.sum())
+                active[ants[dead]] = False
+                ants, nbrs, cum = ants[~dead], nbrs[~dead], cum[~dead]
+                if len(ants) == 0:
+                    continue
+
+        # one uniform draw per ant against the cumulative weights, kept below the total so
+        # rounding can never push the choice past the last neighbor with weight
+        total = cum[:, -1]
+        draws = np.minimum(rng.random(len(ants)) * total, np.nextafter(total, 0))
+        choice = (cum <= draws[:, None]).sum(axis=1)
+        nxt = nbrs[np.arange(len(ants)), choice]
+
+        pos[ants] = nxt
+        seen[ants * size + (nxt % size if layered else nxt)] = True
+        steps[ants] += 1
+        moved_ants.append(ants)
+        moved_to.append(nxt)
+
+    if stats is not None:
+        stats['steps'] += sum(len(moved) for moved in moved_ants)
+
+    paths = [None] * num_ants
+    if not reached.any():
+        return paths
+
+    if moved_ants:
+        ant_ids = np.concatenate(moved_ants)
+        cells = np.concatenate(moved_to)[np.argsort(ant_ids, kind='stable')].astype(np.int32)
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(ant_ids, minlength=num_ants)))).tolist()
+    else:
+        cells = np.zeros(0, dtype=np.int32)
+        bounds = [0] * (num_ants + 1)
+
+    for i in np.flatnonzero(reached).tolist():
+        paths[i] = np.insert(cells[bounds[i]:bounds[i + 1]], 0, starts[i])
+    return paths
+
+
+# removes loops from a leg of flat indices: whenever a cell is revisited, everything walked
+# since its first visit is dropped
+def erase_loops(cells):
+    out = []
+    index = {}
+    for cell in cells:
+        k = index.get(cell)
+        if k is None:
+            index[cell] = len(out)
+            out.append(cell)
+        else:
+            for dropped in out[k + 1:]:
+                del index[dropped]
+            del out[k + 1:]
+    return out
+
+
+# shortens a loop-free leg by jumping from each cell to the furthest later cell of the
+# leg that is one step away, moves come from table so cart clearance is respected
+def shortcut_adjacent(table, cells):
+    cells = np.asarray(cells, dtype=np.int32)
+    if len(cells) < 3:
+        return cells
+
+    order = np.argsort(cells)
+    ordered = cells[order]
+    nbrs = table.padded[cells]
+    slot = np.minimum(np.searchsorted(ordered, nbrs), len(cells) - 1)
+    on_leg = (ordered[slot] == nbrs) & (nbrs >= 0)
+    furthest = np.where(on_leg, order[slot], -1).max(axis=1)
+    furthest = np.maximum(furthest, np.arange(len(cells)) + 1).tolist()
+
+    keep = [0]
+    i = 0
+    while i < len(cells) - 1:
+        i = furthest[i]
+        keep.append(i)
+    return cells[keep]
+
+
+# replaces stretches of a leg with straight lines where every cell on the line is enterable
+# and the line takes fewer steps, looking at most window cells ahead
+def pull_string(table, cells, window=32):
+    cells = np.asarray(cells, dtype=np.int32)
+    if len(cells) < 3:
+        return cells
+
+    ys, xs = np.divmod(cells.astype(np.int64), table.width)
+    t = np.arange(window + 1)
+    out = [cells[:1]]
+    i = 0
+    while i < len(cells) - 1:
+        j = np.arange(i + 2, min(i + window, len(cells) - 1) + 1)
+        dy, dx = ys[j] - ys[i], xs[j] - xs[i]
+        steps = np.maximum(np.abs(dy), np.abs(dx))
+        better = steps < j - i
+        if better.any():
+            j, dy, dx, steps = j[better], dy[better], dx[better], steps[better]
+            # cells of each straight line, padded with its end cell up to window steps
+            frac = np.minimum(t[None, :], steps[:, None]) / steps[:, None]
+            line = ((ys[i] + np.rint(dy[:, None] * frac)) * table.width
+                    + xs[i] + np.rint(dx[:, None] * frac)).astype(np.int64)
+            clear = np.flatnonzero(table.enterable[line].all(axis=1))
+            if clear.size:
+                k = clear[-1]
+                out.append(line[k, 1:steps[k] + 1].astype(np.int32))
+                i = j[k]
+                continue
+        out.append(cells[i + 1:i + 2])
+        i += 1
+    return np.concatenate(out)
+
+
+# evaporates pheromone in place, clamps it to floor, then deposits along every route
+# each route spreads deposit / len(route) over its cells in a single scatter-add
+def update_pheromone_grid(pheromone, routes, evaporation_rate, deposit, floor=0.1):
+    if isinstance(pheromone, TiledPheromone):
+        pheromone.evaporate(evaporation_rate)
+    else:
+        pheromone *= (1 - evaporation_rate)
+        np.maximum(pheromone, floor, out=pheromone)
+
+    routes = [route for route in routes if route]
+    if not routes:
+        return
+
+    routes = [as_route(route, pheromone.shape[1]) for route in routes]
+    lengths = np.array([len(route) for route in routes])
+    cells = np.concatenate([route.flat for route in routes])
+    amounts = np.repeat(deposit / lengths, lengths)
+    if isinstance(pheromone, TiledPheromone):
+        pheromone.deposit(cells, amounts)
+    else:
+        np.add.at(pheromone.reshape(-1), cells, amounts)
+
+
+# grows a boolean mask by one cell in all 8 directions
+def dilate8(mask):
+    grown = mask.copy()
+    grown[1:, :] |= mask[:-1, :]
+    grown[:-1, :] |= mask[1:, :]
+    out = grown.copy()
+    out[:, 1:] |= grown[:, :-1]
+    out[:, :-1] |= grown[:, 1:]
+    return out
+
+
+# shrinks obstacles by factor, a coarse cell is blocked if any of its cells is blocked
+def downsample_obstacles(obstacles, factor):
+    h, w = obstacles.shape
+    padded = np.zeros((-(-h // factor) * factor, -(-w // factor) * factor), dtype=bool)
+    padded[:h, :w] = obstacles
+    return padded.reshape(padded.shape[0] // factor, factor, -1, factor).any(axis=(1, 3))
+
+
+# returns footprint for a grid shrunk by factor with downsample_obstacles, None stays None
+# conservative: the coarse footprint covers the fine one anywhere up to a coarse cell past its
+# anchor, so every coarse move has a fine path inside the two coarse footprints and the coarse
+# grid never opens a passage the footprint cannot use; narrow aisles may close instead,
+# run_coarse_to_fine falls back to the full floor then
+def downsample_footprint(footprint, factor):
+    if not footprint:
+        return None
+    return tuple(-(-size // factor) + 1 for size in footprint)
+
+
+# blows up a coarse grid by factor and crops it to shape
+def upsample_grid(grid, factor, shape):
+    return np.repeat(np.repeat(grid, factor, axis=0), factor, axis=1)[:shape[0], :shape[1]]
+
+
+# settings farms share with the coarse copies built for coarse to fine solving
+FARM_SETTINGS = ('num_ants', 'evaporation_rate', 'pheromone_deposit', 'alpha', 'beta',
+                 'sequential', 'return_to_start', 'segment_by_segment', 'engine', 'rng',
+                 'workers', 'heuristic', 'post_optimize')
+
+
+# straight-line distance from every cell to target
+def euclidean_distance(shape, target):
+    ys, xs = np.indices(shape)
+    return np.sqrt((ys - target[0])**2 + (xs - target[1])**2)
+
+
+# walking distance in 8-connected steps from every cell to target, inf where target is unreachable
+# a cell counts as reached when an ant standing there could step towards target through enterable cells
+def geodesic_distance(enterable, target):
+    dist = np.full(enterable.shape, np.inf)
+    seen = np.zeros(enterable.shape, dtype=bool)
+    seen[target] = True
+    dist[target] = 0
+
+    # only enterable cells can be stepped onto on the way to target
+    frontier = np.zeros(enterable.shape, dtype=bool)
+    frontier[target] = enterable[target]
+
+    steps = 0
+    while frontier.any():
+        steps += 1
+        reached = dilate8(frontier) & ~seen
+        dist[reached] = steps
+        seen |= reached
+        frontier = reached & enterable
+    return dist
+
+
+# grows a breadth-first tree over table from flat index source, every move costs one step
+# so this gives exact shortest paths (Dijkstra and A* reduce to it on this grid)
+# returns int32 steps from source (-1 where unreachable) and parent cells (-1 at the root)
+def shortest_path_tree(table, source):
+    size = len(table.padded)
+    dist = np.full(size, -1, dtype=np.int32)
+    parent = np.full(size, -1, dtype=np.int32)
+    dist[source] = 0
+
+    frontier = np.array([source], dtype=np.int32)
+    steps = 0
+    while frontier.size:
+        steps += 1
+        nbrs = table.padded[frontier].reshape(-1)
+        came_from = np.repeat(frontier, len(DIRECTIONS))
+        new = nbrs >= 0
+        new[new] = dist[nbrs[new]] < 0
+        # the first parent listed wins when several frontier cells reach the same cell
+        cells, first = np.unique(nbrs[new], return_index=True)
+        dist[cells] = steps
+        parent[cells] = came_from[new][first]
+        frontier = cells.astype(np.int32)
+    return dist, parent
+
+
+# follows parent links back from target, returns int32 flat indices from the tree root
+# to target, None if target is unreachable
+def trace_path(dist, parent, target):
+    if dist[target] < 0:
+        return None
+    path = np.empty(dist[target] + 1, dtype=np.int32)
+    cell = target
+    for k in range(dist[target], -1, -1):
+        path[k] = cell
+        cell = parent[cell]
+    return path
+
+
+# returns steps of visiting stops in order (indices into dist, 0 is the start)
+def order_length(dist, order, return_to_start=False):
+    points = [0] + list(order) + ([0] if return_to_start else [])
+    return sum(dist[a, b] for a, b in zip(points[:-1], points[1:]))
+
+
+# returns the order (indices 1..n into dist) visiting every stop in the fewest steps
+# dist[i, j] is the leg cost from point i to point j, point 0 is the start
+# up to exact_limit stops are solved exactly, longer lists start from nearest neighbor
+# and are improved with 2-opt and Or-opt moves
+def solve_visit_order(dist, return_to_start=False, exact_limit=10):
+    n = len(dist) - 1
+    if n <= 1:
+        return list(range(1, n + 1))
+    if n <= exact_limit:
+        return held_karp_order(dist, return_to_start)
+    return improve_order(dist, nearest_neighbor_order(dist), return_to_start)
+
+
+# exact shortest visiting order by dynamic programming over subsets of stops (Held-Karp)
+def held_karp_order(dist, return_to_start=False):
+    n = len(dist) - 1
+    full = 1 << n
+    stops = dist[1:, 1:]
+    cost = np.full((full, n), np.inf)
+    parent = np.full((full, n), -1, dtype=np.int64)
+    for k in range(n):
+        cost[1 << k, k] = dist[0, k + 1]
+
+    for mask in range(1, full):
+        row = cost[mask]
+        if not np.isfinite(row).any():
+            continue
+        # cheapest way to extend the visited set mask with each stop k
+        step = row[:, None] + stops
+        best_from = step.argmin(axis=0)
+        best = step[best_from, np.arange(n)]
+        for k in range(n):
+            bit = 1 << k
+            if not mask & bit and best[k] < cost[mask | bit, k]:
+                cost[mask | bit, k] = best[k]
+                parent[mask | bit, k] = best_from[k]
+
+    final = cost[full - 1] + (dist[1:, 0] if return_to_start else 0)
+    if not np.isfinite(final).any():
+        return list(range(1, n + 1))
+
+    order = []
+    mask, k = full - 1, int(final.argmin())
+    while k >= 0:
+        order.append(k + 1)
+        mask, k = mask & ~(1 << k), int(parent[mask, k])
+    return order[::-1]
+
+
+# greedy order that always walks to the closest stop not visited yet
+def nearest_neighbor_order(dist):
+    left = list(range(1, len(dist)))
+    order = []
+    current = 0
+    while left:
+        current = min(left, key=lambda k: dist[current, k])
+        left.remove(current)
+        order.append(current)
+    return order
+
+
+# improves order until neither reversing a stretch (2-opt) nor moving a run of
+# up to three stops elsewhere (Or-opt) makes it shorter
+def improve_order(dist, order, return_to_start=False):
+    order = list(order)
+    best = order_length(dist, order, return_to_start)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(len(order) - 1):
+            for j in range(i + 1, len(order)):
+                candidate = order[:i] + order[i:j + 1][::-1] + order[j + 1:]
+                length = order_length(dist, candidate, return_to_start)
+                if length < best:
+                    order, best, improved = candidate, length, True
+
+        for size in (1, 2, 3):
+            for i in range(len(order) - size + 1):
+                run, rest = order[i:i + size], order[:i] + order[i + size:]
+                for j in range(len(rest) + 1):
+                    candidate = rest[:j] + run + rest[j:]
+                    length = order_length(dist, candidate, return_to_start)
+                    if length < best:
+                        order, best, improved = candidate, length, True
+                        break
+    return order
+
+
+class RouteSink:
+    # counts successful routes without keeping them, so memory stays flat on long runs
+    # len() gives the number of routes tested, iterating gives the routes that were kept
+
+    def __init__(self):
+        self.count = 0
+
+    def append(self, route):
+        self.count += 1
+
+    def extend(self, routes):
+        for route in routes:
+            self.append(route)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(())
+
+    def close(self):
+        pass
+
+
+class RecentRoutes(RouteSink):
+    # keeps the last size routes in a ring buffer
+
+    def __init__(self, size=1000):
+        super().__init__()
+        self.routes = deque(maxlen=size)
+
+    def append(self, route):
+        self.count += 1
+        self.routes.append(route)
+
+    def __iter__(self):
+        return iter(self.routes)
 
-class AntFarm:
-    def __init__(self, grid_size=(50, 50), cart_size=None):
+
+class SampledRoutes(RouteSink):
+    # keeps a uniform random sample of size routes out of all routes seen (reservoir sampling)
+
+    def __init__(self, size=1000, rng=random):
+        super().__init__()
+        self.size = size
+        self.rng = rng
+        self.routes = []
+
+    def append(self, route):
+        self.count += 1
+        if len(self.routes) < self.size:
+            self.routes.append(route)
+        else:
+            slot = self.rng.randrange(self.count)
+            if slot < self.size:
+                self.routes[slot] = route
+
+    def __iter__(self):
+        return iter(self.routes)
+
+
+class RouteWriter(RouteSink):
+    # streams every route to a file as one json list of [y, x] per line, keeps nothing in memory
+
+    def __init__(self, filename):
+        super().__init__()
+        self.filename = filename
+        self.file = open(filename, 'w')
+        self._finalizer = weakref.finalize(self, self.file.close)
+
+    def append(self, route):
+        self.count += 1
+        self.file.write(json.dumps(np.asarray(route).tolist()) + '\n')
+
+    # iterates the routes written so far by reading the file back
+    def __iter__(self):
+        self.file.flush()
+        with open(self.filename) as fh:
+            for line in fh:
+                yield [tuple(pos) for pos in json.loads(line)]
+
+    def close(self):
+        self._finalizer()
+
+
+# returns npz arrays holding routes (None allowed) under name: all cells in one int32 array
+# plus the length of each route, -1 for a missing one
+def pack_routes(name, routes):
+    flats = [route.flat for route in routes if route]
+    return {
+        f'{name}_cells': np.concatenate(flats) if flats else np.zeros(0, dtype=np.int32),
+        f'{name}_lengths': np.array([len(route) if route else -1 for route in routes], dtype=np.int64),
+    }
+
+
+# returns routes stored by pack_routes under name as a list of Route or None
+def unpack_routes(state, name, width):
+    cells = state[f'{name}_cells']
+    routes = []
+    begin = 0
+    for length in state[f'{name}_lengths']:
+        if length < 0:
+            routes.append(None)
+            continue
+        routes.append(Route(cells[begin:begin + length], width))
+        begin += length
+    return routes
+
+
+# bytes a python list holds per int: the pointer plus an int object above the small int cache
+LIST_INT_BYTES = 8 + 32
+
+
+# returns estimated bytes a farm needs on a grid_size floor before anything is allocated, as a
+# dict of parts plus 'total'; targets counts the distinct stops ants head for and classes the
+# vehicle classes (people and each cart footprint); open floors reach the estimate, racks leave
+# fewer moves to store
+def estimate_memory(grid_size, targets=1, classes=1, num_ants=50, dtype=np.float64,
+                    engine='serial', heuristic='euclidean', pheromone_tile=None, workers=1):
+    cells = int(grid_size[0]) * int(grid_size[1])
+    item = np.dtype(dtype).itemsize
+    if pheromone_tile:
+        # tiles are allocated where the ants go, only the tile index is known up front
+        pheromone = -(-cells // pheromone_tile ** 2) * 8
+    else:
+        pheromone = cells * item
+
+    # padded and CSR int32 moves plus the python lists the serial walker slices
+    table = cells * (8 * 4 + 8 * 4 + 4 + 8 * LIST_INT_BYTES + LIST_INT_BYTES)
+    # a heuristic per target and class over the distance field, which is shared by all
+    # classes for straight-line distance and per class for walking distance; walking
+    # distance heuristics stay float64 whatever dtype is
+    if heuristic == 'geodesic':
+        fields = targets * cells * classes * (8 + item)
+    else:
+        fields = targets * cells * item * (classes + 1)
+    # every worker process builds its own tables and fields from the shared grids
+    per_worker = classes * (table + cells) + fields + cells
+
+    estimate = {
+        'obstacles': cells,
+        'pheromone': classes * pheromone,
+        'clearance': classes * cells,
+        'neighbor_tables': classes * table,
+        'heuristics': fields,
+        'batch_walk': classes * num_ants * cells if engine == 'batch' else 0,
+        'workers': workers * per_worker if engine == 'process' else 0,
+    }
+    estimate['total'] = sum(estimate.values())
+    return estimate
+
+
+class FloorLayout:
+    # obstacle grid shared by the farms plus lookup tables derived from it
+    # the farms supply run_iteration, current_best_length, pheromone_maps, apply_visit_order,
+    # coarse_copy, checkpoint_state and restore_state, a bare FloorLayout only walks ants
+
+    # dtype of pheromone, heuristic and distance grids, np.float32 halves their memory
+    # (geodesic heuristics stay float64, see get_heuristic)
+    def __init__(self, grid_size=(50, 50), cart_size=None, dtype=np.float64):
         self.grid_size = grid_size
-        self.pheromone = np.ones(grid_size) * 0.1
         self.obstacles = np.zeros(grid_size, dtype=bool)
+        self.dtype = np.dtype(dtype)
+
+        # cart dimensions (height, width) for collision detection
+        self.cart_size = cart_size if cart_size else (1, 1)
+
+        # stops and colony settings the farms share, the walkers and heuristics read them here
         self.start = None
         self.ends = []
-        self.ants = []
-        self.best_paths = {}
-        self.best_path_lengths = {}
         # Adjust num_ants for accuracy vs speed
         # Lower values (10-20) = faster but less accurate
         # Higher values (50-100) = slower but more accurate
@@ -25,24 +838,647 @@ class AntFarm:
         self.sequential = True # set to True to have the ants visits enpoints in order.
         self.return_to_start = True #set to True to return to start point.
         self.segment_by_segment = False # set to True to optimize each leg independently
+        self.engine = 'serial' # 'batch' advances all ants together with numpy, 'process' spreads ants over cores
+        self.rng = np.random.default_rng() # random stream used by the batch and process engines
+        self.workers = None # worker processes for the process engine, None = one per core
+        self.heuristic = 'euclidean' # 'geodesic' steers ants by walking distance around obstacles
+        self.post_optimize = True # remove loops and shortcut detours from ant routes before scoring them
+        self.optimize_order = False # visit ends in the shortest order instead of the given one (sequential mode)
+        self._visit_order_key = None
+        self.convergence = None # ConvergenceMonitor that ends runs once routes stop improving
+        self.stop_reason = None # why the convergence monitor stopped the run
+        self.iteration = 0 # iterations run so far, carried over by checkpoints
+
+        # tables derived from the obstacle grid, rebuilt after layout changes
+        self._layout_cache = {}
+        self.layout_version = 0
+
+        # worker processes for engine = 'process', started on first use
+        self._pool = None
+
+        # LegCache that keeps best legs between runs, None to always start from scratch
+        self.leg_cache = None
+        self.refine_cached_legs = False # True keeps sending ants over cached legs so a later run can shorten them
+
+        # steps an ant may take on one leg before it gives up, None for one per grid cell
+        self.max_steps = None
+
+        # Profiler that times the phases of each iteration and counts ants, None keeps it off
+        self.profiler = None
+
+    # returns pheromone grid at its starting level for the whole floor
+    def new_pheromone_grid(self):
+        return np.full(self.grid_size, 0.1, dtype=self.dtype)
+
+    # returns distinct stops ants head for, each one gets its own heuristic field
+    def heuristic_targets(self):
+        targets = set(map(tuple, self.ends))
+        if self.return_to_start and self.start is not None:
+            targets.add(tuple(self.start))
+        return len(targets)
+
+    # returns estimate_memory for this floor with classes vehicle classes and the farm settings
+    def memory_estimate(self, classes=1, pheromone_tile=None):
+        return estimate_memory(self.grid_size, max(self.heuristic_targets(), 1), classes,
+                               self.num_ants, self.dtype, self.engine, self.heuristic,
+                               pheromone_tile, self.workers or os.cpu_count())
+
+    # switches pheromone, heuristic and distance grids to dtype, np.float32 halves them
+    # heuristic fields are rebuilt in the new dtype on next use
+    def set_dtype(self, dtype):
+        self.dtype = np.dtype(dtype)
+        for key in list(self._layout_cache):
+            if key[0] in ('heuristic', 'geodesic', 'euclidean'):
+                del self._layout_cache[key]
+
+    # returns context that times phase name on self.profiler, does nothing while profiling is off
+    def timed(self, name):
+        return self.profiler.phase(name) if self.profiler is not None else nullcontext()
+
+    # returns counter dict the walkers add steps and failures to, None while profiling is off
+    def walk_stats(self):
+        return self.profiler.counts if self.profiler is not None else None
+
+    # adds ants walked and how many of them arrived to self.profiler
+    def count_walks(self, routes):
+        if self.profiler is not None:
+            self.profiler.count_ants(len(routes), sum(route is not None for route in routes))
+
+    # returns steps an ant may take on one leg
+    def step_limit(self):
+        return self.max_steps if self.max_steps else self.grid_size[0] * self.grid_size[1]
+
+    # returns (height, width) each routed class moves as, (0, 0) for people; checkpoints store
+    # it so routes are never restored for a cart they do not fit
+    def route_footprints(self):
+        return [self.footprint(True)]
+
+    # returns hash of the obstacle grid, identical layouts give identical fingerprints
+    def layout_fingerprint(self):
+        key = ('fingerprint',)
+        if key not in self._layout_cache:
+            digest = hashlib.sha1(repr(self.obstacles.shape).encode())
+            digest.update(np.packbits(self.obstacles).tobytes())
+            self._layout_cache[key] = digest.hexdigest()
+        return self._layout_cache[key]
+
+    # returns best path of every (start, target) leg found in self.leg_cache, None where missing
+    def cached_legs(self, legs, check_cart):
+        if self.leg_cache is None:
+            return [None] * len(legs)
+        return [self.leg_cache.get(self, start, target, check_cart) for start, target in legs]
+
+    # asks self.leg_cache for the legs whose entry in cached is None (not asked yet) and fills
+    # segments and lengths in place; legs that already hold a route, e.g. restored from a
+    # checkpoint, keep it, the cache only fills the gaps
+    def fill_cached_legs(self, legs, segments, lengths, cached, check_cart):
+        for i, asked in enumerate(cached):
+            if asked is not None:
+                continue
+            route = self.cached_legs([legs[i]], check_cart)[0] if segments[i] is None else None
+            if route is not None:
+                segments[i] = route
+                lengths[i] = len(route)
+            cached[i] = route is not None
+
+    # writes best paths of (start, target) legs to self.leg_cache, skipping missing ones
+    # the cache keeps whichever path is shorter, so legs that beat a cached one replace it
+    def store_legs(self, legs, routes, check_cart):
+        if self.leg_cache is None:
+            return
+        for (start, target), route in zip(legs, routes):
+            if route:
+                self.leg_cache.put(self, start, target, check_cart, route)
+
+    # drops cached clearance data, call after editing self.obstacles directly
+    def invalidate_layout_cache(self):
+        self._layout_cache = {}
+        self.layout_version += 1
+
+    # adds rectangular obstacle to the grid
+    def add_obstacle(self, top_left, bottom_right):
+        self.edit_obstacles(top_left, bottom_right, True)
+
+    # clears a rectangle of the grid back to open floor, e.g. to move a rack elsewhere
+    def remove_obstacle(self, top_left, bottom_right):
+        self.edit_obstacles(top_left, bottom_right, False)
+
+    # sets a rectangle to obstacle or open floor and patches the derived tables around it
+    # instead of rebuilding them, then lets the farm drop results the edit made stale
+    def edit_obstacles(self, top_left, bottom_right, blocked):
+        y1, x1 = top_left
+        y2 = min(bottom_right[0], self.obstacles.shape[0])
+        x2 = min(bottom_right[1], self.obstacles.shape[1])
+        if (self.obstacles[y1:y2, x1:x2] == blocked).all():
+            return
+
+        # enterable cells of every footprint with a compiled table, before the edit
+        before = {key[1]: table.enterable.copy() for key, table in self._layout_cache.items()
+                  if key[0] == 'neighbors'}
+        self.obstacles[y1:y2, x1:x2] = blocked
+
+        cache = {}
+        for key, value in self._layout_cache.items():
+            if key[0] == 'clearance':
+                # anchors whose footprint overlaps the rectangle
+                ay, ax = self.edit_window((y1, y2, x1, x2), key[1])
+                patch = build_cart_clearance(self.obstacles[ay.start:y2 + key[1][0] - 1,
+                                                            ax.start:x2 + key[1][1] - 1], key[1])
+                value[ay, ax] = patch[:ay.stop - ay.start, :ax.stop - ax.start]
+                cache[key] = value
+            elif key[0] == 'euclidean' or key[:2] == ('heuristic', 'euclidean'):
+                # straight-line distances do not depend on obstacles
+                cache[key] = value
+
+        changed = {}
+        for footprint, old in before.items():
+            table = self._layout_cache[('neighbors', footprint)]
+            enterable = self.get_enterable(footprint or False)
+            changed[footprint] = np.flatnonzero(enterable.reshape(-1) != old)
+            if changed[footprint].size:
+                ys, xs = np.divmod(changed[footprint], table.width)
+                table.patch(enterable, ys.min(), ys.max() + 1, xs.min(), xs.max() + 1)
+            cache[('neighbors', footprint)] = table
+
+        # distance fields and trees stay valid when the edit left their footprint alone or
+        # only blocked cells they never reached
+        for key, value in self._layout_cache.items():
+            if key[0] in ('geodesic', 'tree') and key[2] in changed:
+                dist = value if key[0] == 'geodesic' else value[0]
+                reached = np.isfinite(dist) if key[0] == 'geodesic' else dist >= 0
+                cells = changed[key[2]]
+                if not cells.size or (blocked and not reached.reshape(-1)[cells].any()):
+                    cache[key] = value
+        for key, value in self._layout_cache.items():
+            if key[:2] == ('heuristic', 'geodesic') and ('geodesic', key[2], key[3]) in cache:
+                cache[key] = value
+
+        self._layout_cache = cache
+        self.layout_version += 1
+        self.layout_edited((y1, y2, x1, x2))
+
+    # returns (rows, cols) slices of anchor cells whose footprint overlaps region (y1, y2, x1, x2)
+    def edit_window(self, region, check_cart):
+        y1, y2, x1, x2 = region
+        h, w = self.footprint(check_cart) or (1, 1)
+        return slice(max(y1 - h + 1, 0), y2), slice(max(x1 - w + 1, 0), x2)
+
+    # called after edit_obstacles changed region (y1, y2, x1, x2), farms drop stale results here
+    def layout_edited(self, region):
+        pass
+
+    # returns boolean grid that is True where the cart cannot be placed
+    def get_cart_clearance(self, cart_size=None):
+        cart_size = tuple(cart_size) if cart_size else tuple(self.cart_size)
+        key = ('clearance', cart_size)
+        if key not in self._layout_cache:
+            self._layout_cache[key] = build_cart_clearance(self.obstacles, cart_size)
+        return self._layout_cache[key]
+
+    # checks if cart at position would collide with obstacles
+    def check_cart_collision(self, pos):
+        y, x = pos
+        if not (0 <= y < self.grid_size[0] and 0 <= x < self.grid_size[1]):
+            return True
+        return bool(self.get_cart_clearance()[y, x])
+
+    # returns footprint (height, width) an ant has to clear, None for people
+    # check_cart is True for self.cart_size, False for people, or any (height, width) footprint
+    def footprint(self, check_cart):
+        if isinstance(check_cart, (tuple, list, np.ndarray)):
+            return (int(check_cart[0]), int(check_cart[1]))
+        return tuple(self.cart_size) if check_cart else None
+
+    # returns boolean grid of cells an ant may step onto
+    def get_enterable(self, check_cart=True):
+        enterable = ~self.obstacles
+        footprint = self.footprint(check_cart)
+        if footprint:
+            enterable &= ~self.get_cart_clearance(footprint)
+        return enterable
+
+    # returns compiled neighbor table for people (check_cart=False) or for a cart footprint
+    def get_neighbor_table(self, check_cart=True):
+        key = ('neighbors', self.footprint(check_cart))
+        if key not in self._layout_cache:
+            with self.timed('layout_tables'):
+                self._layout_cache[key] = NeighborTable(self.get_enterable(check_cart))
+        return self._layout_cache[key]
+
+    # returns flat heuristic field towards target, cached per layout, target and cart size
+    # 'euclidean' uses (1 / (distance + 1)) ** beta on straight-line distance
+    # 'geodesic' uses exp(-beta * steps) on walking distance, so every step towards
+    # the target is favored by the same factor no matter how far away it is
+    def get_heuristic(self, target, check_cart=True):
+        target = (int(target[0]), int(target[1]))
+        key = ('heuristic', self.heuristic, target, self.footprint(check_cart), self.beta)
+        if key not in self._layout_cache:
+            with self.timed('layout_tables'):
+                dist = self.get_distance_field(target, check_cart)
+                if self.heuristic == 'geodesic':
+                    # the field always stays float64: float32 underflows after about 40
+                    # steps at beta 2, and capping the decay to fit it stops steering ants
+                    # flatten the decay on huge floors so far cells do not underflow to zero
+                    finite = dist[np.isfinite(dist)]
+                    rate = self.beta
+                    limit = np.log(np.finfo(np.float64).max) - 10
+                    if finite.size and rate * finite.max() > limit:
+                        rate = limit / finite.max()
+                    heur = np.exp(-rate * dist.astype(np.float64))
+                    dtype = np.float64
+                else:
+                    heur = (1.0 / (dist + 1)) ** self.beta
+                    dtype = self.dtype
+                self._layout_cache[key] = heur.reshape(-1).astype(dtype, copy=False)
+        return self._layout_cache[key]
+
+    # returns distance grid to target used by the heuristic, cached per layout
+    def get_distance_field(self, target, check_cart=True):
+        target = (int(target[0]), int(target[1]))
+        if self.heuristic == 'geodesic':
+            key = ('geodesic', target, self.footprint(check_cart))
+            if key not in self._layout_cache:
+                dist = geodesic_distance(self.get_enterable(check_cart), target)
+                self._layout_cache[key] = dist.astype(self.dtype, copy=False)
+        else:
+            key = ('euclidean', target)
+            if key not in self._layout_cache:
+                dist = euclidean_distance(self.obstacles.shape, target)
+                self._layout_cache[key] = dist.astype(self.dtype, copy=False)
+        return self._layout_cache[key]
+
+    # returns valid neighboring positions including diagonals
+    def get_neighbors(self, pos, check_cart=True):
+        table = self.get_neighbor_table(check_cart)
+        return table.to_positions(table.neighbors(table.to_flat(pos)))
+
+    # returns (dist, parent) breadth-first tree grown from source, cached per layout
+    def get_distance_tree(self, source, check_cart=True):
+        source = (int(source[0]), int(source[1]))
+        key = ('tree', source, self.footprint(check_cart))
+        if key not in self._layout_cache:
+            table = self.get_neighbor_table(check_cart)
+            self._layout_cache[key] = shortest_path_tree(table, table.to_flat(source))
+        return self._layout_cache[key]
+
+    # returns exact shortest path from start to target as a Route, None if target is unreachable
+    def shortest_path(self, start, target, check_cart=True):
+        table = self.get_neighbor_table(check_cart)
+        dist, parent = self.get_distance_tree(start, check_cart)
+        path = trace_path(dist, parent, table.to_flat(target))
+        return table.to_route(path) if path is not None else None
+
+    # returns route through all targets in order with every leg exact, None if a leg is unreachable
+    def shortest_route(self, start, targets, check_cart=True):
+        legs = []
+        for target in targets:
+            leg = self.shortest_path(start, target, check_cart)
+            if leg is None:
+                return None
+            legs.append(leg)
+            start = target
+        return Route.join(legs) if legs else None
+
+    # returns matrix of exact leg steps between every pair of points, inf where unreachable
+    def leg_cost_matrix(self, points, check_cart=True):
+        table = self.get_neighbor_table(check_cart)
+        cells = [table.to_flat(p) for p in points]
+        matrix = np.full((len(points), len(points)), np.inf)
+        for i, point in enumerate(points):
+            steps = self.get_distance_tree(point, check_cart)[0][cells].astype(float)
+            steps[steps < 0] = np.inf
+            matrix[i] = steps
+        return matrix
+
+    # returns ends reordered into the shortest visiting order from start, with leg costs
+    # added up over every check_cart in checks
+    def shortest_visit_order(self, start, ends, checks=(True,), return_to_start=False):
+        points = [start] + list(ends)
+        dist = sum(self.leg_cost_matrix(points, check) for check in checks)
+        order = solve_visit_order(dist, return_to_start)
+        return [ends[k - 1] for k in order]
+
+    # lays amount of pheromone along each route, spread over its cells like an ant deposit
+    def seed_pheromone(self, pheromone_map, routes, amount):
+        for route in routes:
+            if route:
+                route = as_route(route, pheromone_map.shape[1])
+                if isinstance(pheromone_map, TiledPheromone):
+                    pheromone_map.deposit(route.flat, np.full(len(route), amount / len(route)))
+                else:
+                    np.add.at(pheromone_map.reshape(-1), route.flat, amount / len(route))
+
+    # walks one ant from start to target, returns Route or None
+    def walk_path(self, start, target, check_cart, pheromone_map, rng=random):
+        table = self.get_neighbor_table(check_cart)
+        max_steps = self.step_limit()
+        path = walk_leg(table, pheromone_map, self.get_heuristic(target, check_cart),
+                        table.to_flat(start), table.to_flat(target), self.alpha, max_steps, rng,
+                        self.walk_stats())
+        return table.to_route(path) if path else None
+
+    # walks one ant through all targets in order, returns joined route or None
+    def walk_route(self, start, targets, check_cart, pheromone_map, rng=random):
+        table = self.get_neighbor_table(check_cart)
+        max_steps = self.step_limit()
+        full_route = []
+        curr = table.to_flat(start)
+
+        for target in targets:
+            path = walk_leg(table, pheromone_map, self.get_heuristic(target, check_cart),
+                            curr, table.to_flat(target), self.alpha, max_steps, rng,
+                            self.walk_stats())
+            if path is None:
+                return None
+            if full_route:
+                path = path[1:]
+            full_route.extend(path)
+            curr = full_route[-1]
+
+        return table.to_route(full_route) if full_route else None
+
+    # feeds the finished iteration to self.convergence, returns True when the run should stop
+    def check_convergence(self):
+        if self.convergence is None:
+            return False
+        if self.convergence.update(self):
+            self.stop_reason = self.convergence.stop_reason
+            return True
+        return False
+
+    # evaporates pheromone_map and deposits pheromone from all successful routes
+    def update_pheromone(self, pheromone_map, routes):
+        with self.timed('pheromone'):
+            update_pheromone_grid(pheromone_map, routes, self.evaporation_rate, self.pheromone_deposit)
+
+    # removes loops and detours from each leg of route, targets are the waypoints it visits in order
+    # pull also straightens legs along clear lines of sight, which costs more
+    def post_optimize_route(self, route, targets, check_cart, pull=False):
+        table = self.get_neighbor_table(check_cart)
+        flat = route.flat
+        legs = []
+        begin = 0
+        for target in targets:
+            end = begin + int(np.flatnonzero(flat[begin:] == table.to_flat(target))[0])
+            leg = shortcut_adjacent(table, erase_loops(flat[begin:end + 1].tolist()))
+            if pull:
+                leg = shortcut_adjacent(table, erase_loops(pull_string(table, leg).tolist()))
+            legs.append(table.to_route(leg))
+            begin = end
+        return Route.join(legs)
+
+    # post-optimizes freshly walked routes when self.post_optimize is set
+    # every route is cleaned up, only the shortest of the batch is also string-pulled
+    def post_optimize_routes(self, routes, targets, check_cart):
+        if not self.post_optimize:
+            return routes
+        with self.timed('post_optimize'):
+            routes = [self.post_optimize_route(r, targets, check_cart) if r else None for r in routes]
+            found = [i for i, r in enumerate(routes) if r]
+            if found:
+                best = min(found, key=lambda i: len(routes[i]))
+                routes[best] = self.post_optimize_route(routes[best], targets, check_cart, pull=True)
+        return routes
+
+    # walks count ants from start to target, one Route (or None) per ant
+    def walk_paths(self, start, target, count, check_cart, pheromone_map):
+        with self.timed('walk'):
+            if self.engine == 'batch':
+                paths = self.walk_batch(start, [target], count, check_cart, pheromone_map)
+            elif self.engine == 'process':
+                paths = self.walk_pool(start, [target], count, check_cart, pheromone_map)
+            else:
+                paths = [self.walk_path(start, target, check_cart, pheromone_map) for _ in range(count)]
+        self.count_walks(paths)
+        return self.post_optimize_routes(paths, [target], check_cart)
+
+    # walks count ants through all targets in order, one joined route (or None) per ant
+    def walk_routes(self, start, targets, count, check_cart, pheromone_map):
+        with self.timed('walk'):
+            if self.engine == 'batch':
+                routes = self.walk_batch(start, targets, count, check_cart, pheromone_map)
+            elif self.engine == 'process':
+                routes = self.walk_pool(start, targets, count, check_cart, pheromone_map)
+            else:
+                routes = [self.walk_route(start, targets, check_cart, pheromone_map) for _ in range(count)]
+        self.count_walks(routes)
+        return self.post_optimize_routes(routes, targets, check_cart)
+
+    # advances count ants in lockstep with numpy, drawing from self.rng
+    def walk_batch(self, start, targets, count, check_cart, pheromone_map):
+        table = self.get_neighbor_table(check_cart)
+        max_steps = self.step_limit()
+        heuristics = [self.get_heuristic(t, check_cart) for t in targets]
+        paths = walk_batch(table, pheromone_map, heuristics, table.to_flat(start),
+                           [table.to_flat(t) for t in targets], count,
+                           self.alpha, max_steps, self.rng, self.walk_stats())
+        return [table.to_route(p) if p is not None else None for p in paths]
+
+    # walks count ants on worker processes, each ant with a random stream seeded from self.rng
+    # so results only depend on the seed, not on the number of workers
+    def walk_pool(self, start, targets, count, check_cart, pheromone_map):
+        if self._pool is None:
+            from ant_pool import AntPool
+            self._pool = AntPool(self.workers)
+        seeds = self.rng.integers(2**63, size=count).tolist()
+        return self._pool.walk(self, start, targets, check_cart, pheromone_map, seeds,
+                               self.walk_stats())
+
+    # shuts down the worker processes started by engine = 'process'
+    def close_pool(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    # copies obstacles, stops and settings shrunk by factor into coarse, a farm built on the
+    # coarse grid; stops are kept open even where their coarse cell holds an obstacle
+    def scale_into(self, coarse, factor):
+        for name in FARM_SETTINGS:
+            setattr(coarse, name, getattr(self, name))
+        coarse.obstacles = downsample_obstacles(self.obstacles, factor)
+        start = (self.start[0] // factor, self.start[1] // factor)
+        ends = [(e[0] // factor, e[1] // factor) for e in self.ends]
+        coarse.set_start_end(start, ends, self.sequential, self.return_to_start)
+        for y, x in [start] + ends:
+            coarse.obstacles[y, x] = False
+        coarse.invalidate_layout_cache()
+        return coarse
+
+    # returns what the visiting order depends on, apply_visit_order solves again when it changes
+    def visit_order_key(self):
+        return (tuple(sorted(self.ends)), self.start, self.return_to_start, self.layout_version)
+
+    # solves a copy of the floor shrunk by factor first, then refines on the full grid
+    # ants on the full grid only walk a corridor margin coarse cells wide around the coarse
+    # routes, starting from the coarse pheromone blown up to full size
+    # history, if given, is a dict that receives the best length after every coarse iteration
+    # (in coarse steps) under 'coarse' and after every fine iteration under 'fine'
+    # returns the coarse farm
+    def run_coarse_to_fine(self, factor=4, coarse_iterations=50, fine_iterations=20, margin=2,
+                           log=None, history=None):
+        if history is None:
+            history = {}
+        history['coarse'], history['fine'] = [], []
+        if self.optimize_order and self.sequential:
+            self.apply_visit_order()
+        coarse = self.coarse_copy(factor)
+        try:
+            for i in range(coarse_iterations):
+                coarse.run_iteration()
+                history['coarse'].append(coarse.current_best_length())
+                if log:
+                    log(f"coarse iteration {i + 1}/{coarse_iterations}: "
+                        f"best {coarse.current_best_length()}")
+        finally:
+            coarse.close_pool()
+
+        # corridor of cells the coarse routes and their footprints cover, grown by margin
+        shape = self.obstacles.shape
+        corridor = None
+        if coarse.current_best_length() != float('inf'):
+            mask = np.zeros(coarse.obstacles.shape, dtype=bool)
+            for route, check_cart in coarse.found_routes():
+                cells = np.zeros(mask.size, dtype=bool)
+                cells[route.flat] = True
+                cells = cells.reshape(mask.shape)
+                fh, fw = coarse.footprint(check_cart) or (1, 1)
+                for dy in range(fh):
+                    for dx in range(fw):
+                        mask[dy:, dx:] |= cells[:cells.shape[0] - dy, :cells.shape[1] - dx]
+            for _ in range(margin):
+                mask = dilate8(mask)
+            corridor = upsample_grid(mask, factor, shape)
+        elif log:
+            log("coarse routes incomplete, refining on the whole floor")
+
+        for fine_map, coarse_map in zip(self.pheromone_maps(), coarse.pheromone_maps()):
+            grid = upsample_grid(coarse_map, factor, shape)
+            if corridor is not None:
+                grid[~corridor] = 0.1
+            fine_map[...] = grid
+
+        # confine the ants by walling off everything outside the corridor for the refinement,
+        # an ant gives up after one step per corridor cell instead of one per grid cell
+        # the visiting order solved on the full floor above is kept, the corridor walls would
+        # otherwise make apply_visit_order solve it again on the narrowed layout
+        obstacles, leg_cache, max_steps = self.obstacles, self.leg_cache, self.max_steps
+        order_solved = self._visit_order_key == self.visit_order_key()
+        if corridor is not None:
+            self.obstacles = obstacles | ~corridor
+            self.leg_cache = None
+            self.max_steps = int(corridor.sum())
+            self.invalidate_layout_cache()
+            if order_solved:
+                self._visit_order_key = self.visit_order_key()
+        try:
+            history['fine'] += self.refine(fine_iterations, log)
+        finally:
+            if corridor is not None:
+                self.obstacles, self.leg_cache, self.max_steps = obstacles, leg_cache, max_steps
+                self.invalidate_layout_cache()
+                if order_solved:
+                    self._visit_order_key = self.visit_order_key()
+
+        # the corridor may miss a passage the coarse grid could not show, retry on the whole floor
+        if corridor is not None and self.current_best_length() == float('inf'):
+            if log:
+                log("no complete route inside the corridor, refining on the whole floor")
+            if self.convergence is not None:
+                self.convergence.reset()
+            history['fine'] += self.refine(fine_iterations, log)
+        return coarse
+
+    # runs up to iterations fine iterations of run_coarse_to_fine, stops early on convergence
+    # returns the best length after each iteration run
+    def refine(self, iterations, log=None):
+        lengths = []
+        for i in range(iterations):
+            self.run_iteration()
+            lengths.append(self.current_best_length())
+            if log:
+                log(f"fine iteration {i + 1}/{iterations}: best {lengths[-1]}")
+            if self.check_convergence():
+                break
+        return lengths
+
+    # writes the optimizer state to a compressed .npz file: pheromone, best routes, stops,
+    # iteration count and the random streams, everything load_checkpoint needs to resume
+    def save_checkpoint(self, filename):
+        state = self.checkpoint_state()
+        state['fingerprint'] = np.array(self.layout_fingerprint())
+        state['footprints'] = np.array(self.route_footprints(), dtype=np.int64).reshape(-1, 2)
+        state['iteration'] = np.array(self.iteration)
+        state['rng_state'] = np.array(json.dumps(self.rng.bit_generator.state))
+        state['random_state'] = np.array(json.dumps(random.getstate()))
+        np.savez_compressed(filename, **state)
+
+    # restores a checkpoint written by save_checkpoint for the same layout
+    # warm_start only takes over the pheromone field, so a new run starts where an old one
+    # left off, even with other stops or a slightly edited layout of the same size
+    def load_checkpoint(self, filename, warm_start=False):
+        with np.load(filename) as data:
+            state = dict(data)
+
+        if warm_start:
+            self.restore_state(state, warm_start=True)
+            return
+        if str(state['fingerprint']) != self.layout_fingerprint():
+            raise ValueError(f"{filename} was saved for a different layout")
+        footprints = [tuple(int(v) for v in fp) for fp in state.get('footprints', [])]
+        if footprints != self.route_footprints():
+            raise ValueError(f"{filename} was saved for cart footprints {footprints}, "
+                             f"not {self.route_footprints()}")
+
+        self.restore_state(state)
+        self.iteration = int(state['iteration'])
+        self.rng.bit_generator.state = json.loads(str(state['rng_state']))
+        version, internal, gauss = json.loads(str(state['random_state']))
+        random.setstate((version, tuple(internal), gauss))
+
+
+# pheromone grid attribute stored in store and allocated on first read
+def _lazy_pheromone(store):
+    def get(self):
+        if getattr(self, store) is None:
+            setattr(self, store, self.new_pheromone_grid())
+        return getattr(self, store)
+    return property(get, lambda self, value: setattr(self, store, value))
+
+
+class AntFarm(FloorLayout):
+    # pheromone_tile stores the pheromone as a TiledPheromone with tiles of that size,
+    # so memory follows the explored area on huge floors, None for a dense grid (faster
+    # wherever it fits in memory, tiled reads cost more)
+    def __init__(self, grid_size=(50, 50), cart_size=None, pheromone_tile=None, dtype=np.float64):
+        super().__init__(grid_size, cart_size, dtype)
+        if pheromone_tile:
+            self.pheromone = TiledPheromone(grid_size, tile=pheromone_tile, dtype=self.dtype)
+        else:
+            self.pheromone = self.new_pheromone_grid()
+        self.ants = []
+        self.best_paths = {}
+        self.best_path_lengths = {}
         self.best_route = None
         self.best_route_length = float('inf')
         self.best_segments = [] # stores best path for each segment independently
         self.best_segment_lengths = [] # stores length of each best segment
-
-        # cart dimensions (height, width) for collision detection
-        self.cart_size = cart_size if cart_size else (1, 1)
-        self.all_routes = []
-
-        # separate pheromones and best paths for people vs carts
-        self.pheromone_people = np.ones(grid_size) * 0.1
-        self.pheromone_carts = np.ones(grid_size) * 0.1
+        self.cached_segments = [] # True for segments taken from leg_cache, ants skip those, None until asked
+        self.all_routes = RouteSink() # routes tested, swap in RecentRoutes/SampledRoutes/RouteWriter to keep them
+        self.last_routes = [] # successful routes of the last iteration, one list per leg or endpoint
+
+        # separate pheromones and best paths for people vs carts, the grids are only
+        # allocated once a mode reads them (DualPathFarm routes both classes)
+        self._pheromone_people = None
+        self._pheromone_carts = None
         self.best_route_people = None
         self.best_route_carts = None
         self.best_route_length_people = float('inf')
         self.best_route_length_carts = float('inf')
-        self.all_routes_people = []
-        self.all_routes_carts = []
+        self.all_routes_people = RouteSink()
+        self.all_routes_carts = RouteSink()
+
+    pheromone_people = _lazy_pheromone('_pheromone_people')
+    pheromone_carts = _lazy_pheromone('_pheromone_carts')
     
     # sets single start point and one or more end points
     def set_start_end(self, start, end, sequential=False, return_to_start=False):
@@ -60,183 +1496,58 @@ class AntFarm:
                 self.best_paths[e] = None
                 self.best_path_lengths[e] = float('inf')
     
-    # adds rectangular obstacle to the grid
-    def add_obstacle(self, top_left, bottom_right):
-        y1, x1 = top_left
-        y2, x2 = bottom_right
-        self.obstacles[y1:y2, x1:x2] = True
-    
     # loads layout from array where 0 = free, 1 = obstacle, 2 = start, 3 = ends
     def load_custom_layout(self, layout_array):
         self.obstacles = (layout_array == 1)
+        self.invalidate_layout_cache()
         start_pos = np.where(layout_array == 2)
         
         if len(start_pos[0]) > 0:
-            self.start = (start_pos[0][0], start_pos[1][0])
+            self.start = (int(start_pos[0][0]), int(start_pos[1][0]))
         
         self.ends = []
         for val in range(3, 10):
             end_pos = np.where(layout_array == val)
             if len(end_pos[0]) > 0:
                 for i in range(len(end_pos[0])):
-                    self.ends.append((end_pos[0][i], end_pos[1][i]))
+                    self.ends.append((int(end_pos[0][i]), int(end_pos[1][i])))
         
         if not self.sequential:
             for e in self.ends:
                 self.best_paths[e] = None
                 self.best_path_lengths[e] = float('inf')
     
-    # checks if cart at position would collide with obstacles
-    def check_cart_collision(self, pos):
-        y, x = pos
-        cart_h, cart_w = self.cart_size
-
-        # check if cart footprint extends beyond grid
-        if (y + cart_h > self.grid_size[0] or
-            x + cart_w > self.grid_size[1]):
-            return True
-
-        # check if any part of cart overlaps with obstacle
-        cart_footprint = self.obstacles[y:y+cart_h, x:x+cart_w]
-        return np.any(cart_footprint)
-
-    # returns valid neighboring positions including diagonals
-    def get_neighbors(self, pos, check_cart=True):
-        y, x = pos
-        nbrs = []
-        dirs = [(-1, 0), (1, 0), (0, -1), (0, 1),
-                (-1, -1), (-1, 1), (1, -1), (1, 1)]
-
-        for dy, dx in dirs:
-            ny, nx = y + dy, x + dx
-            if (0 <= ny < self.grid_size[0] and
-                0 <= nx < self.grid_size[1] and
-                not self.obstacles[ny, nx]):
-                if check_cart:
-                    if not self.check_cart_collision((ny, nx)):
-                        nbrs.append((ny, nx))
-                else:
-                    nbrs.append((ny, nx))
-        return nbrs
-
-    # calculates movement probability to each neighbor based on pheromone and distance heuristic
-    def calculate_probability(self, current, nbrs, visited, target, pheromone_map=None):
-        probs = []
-        if pheromone_map is None:
-            pheromone_map = self.pheromone
-
-        for nbr in nbrs:
-            if nbr in visited:
-                probs.append(0)
-                continue
-
-            pher = pheromone_map[nbr] ** self.alpha
-            dist = np.sqrt((nbr[0] - target[0])**2 + (nbr[1] - target[1])**2)
-            heur = (1.0 / (dist + 1)) ** self.beta
-            probs.append(pher * heur)
-
-        total = sum(probs)
-        if total == 0:
-            return [1/len(nbrs)] * len(nbrs) if nbrs else []
-        return [p/total for p in probs]
-    
     # executes single ant pathfinding to specified target endpoint
     def run_ant(self, target, start_override=None, check_cart=True, pheromone_map=None):
         start_pos = start_override if start_override is not None else self.start
         if pheromone_map is None:
             pheromone_map = self.pheromone
-
-        path = [start_pos]
-        visited = set([start_pos])
-        curr = start_pos
-        max_steps = self.grid_size[0] * self.grid_size[1]
-
-        for _ in range(max_steps):
-            if curr == target:
-                return path
-
-            nbrs = self.get_neighbors(curr, check_cart=check_cart)
-            if not nbrs:
-                break
-
-            probs = self.calculate_probability(curr, nbrs, visited, target, pheromone_map=pheromone_map)
-
-            if sum(probs) == 0:
-                break
-
-            next_pos = random.choices(nbrs, weights=probs)[0]
-            path.append(next_pos)
-            visited.add(next_pos)
-            curr = next_pos
-
-        return None
+        return self.walk_path(start_pos, target, check_cart, pheromone_map)
     
     # executes single ant through sequential route visiting all endpoints in order
     def run_ant_sequential(self, start_pos, targets, check_cart=True, pheromone_map=None):
-        full_route = []
-        curr_start = start_pos
-
-        for target in targets:
-            path = [curr_start]
-            visited = set([curr_start])
-            curr = curr_start
-            max_steps = self.grid_size[0] * self.grid_size[1]
-
-            for _ in range(max_steps):
-                if curr == target:
-                    if len(full_route) > 0:
-                        path = path[1:]
-                    full_route.extend(path)
-                    curr_start = target
-                    break
-
-                nbrs = self.get_neighbors(curr, check_cart=check_cart)
-                if not nbrs:
-                    return None
-
-                probs = self.calculate_probability(curr, nbrs, visited, target, pheromone_map=pheromone_map)
-
-                if sum(probs) == 0:
-                    return None
-
-                next_pos = random.choices(nbrs, weights=probs)[0]
-                path.append(next_pos)
-                visited.add(next_pos)
-                curr = next_pos
-            else:
-                return None
-
-        return full_route if full_route else None
+        if pheromone_map is None:
+            pheromone_map = self.pheromone
+        return self.walk_route(start_pos, targets, check_cart, pheromone_map)
     
     # applies pheromone evaporation and deposits new pheromones from successful paths
     def update_pheromones(self, paths_by_target):
-        self.pheromone *= (1 - self.evaporation_rate)
-        self.pheromone = np.maximum(self.pheromone, 0.1)
+        self.update_pheromone(self.pheromone, [path for paths in paths_by_target.values() for path in paths])
         
         for target, paths in paths_by_target.items():
             for path in paths:
-                if path:
-                    deposit = self.pheromone_deposit / len(path)
-                    for pos in path:
-                        self.pheromone[pos] += deposit
-                    
-                    if len(path) < self.best_path_lengths[target]:
-                        self.best_path_lengths[target] = len(path)
-                        self.best_paths[target] = path
+                if path and len(path) < self.best_path_lengths[target]:
+                    self.best_path_lengths[target] = len(path)
+                    self.best_paths[target] = path
     
     # applies pheromone evaporation and deposits for sequential routes
     def update_pheromones_sequential(self, routes):
-        self.pheromone *= (1 - self.evaporation_rate)
-        self.pheromone = np.maximum(self.pheromone, 0.1)
+        self.update_pheromone(self.pheromone, routes)
 
         for route in routes:
             if route:
                 self.all_routes.append(route)
 
-                deposit = self.pheromone_deposit / len(route)
-                for pos in route:
-                    self.pheromone[pos] += deposit
-
                 if len(route) < self.best_route_length:
                     self.best_route_length = len(route)
                     self.best_route = route
@@ -247,42 +1558,42 @@ class AntFarm:
         if self.return_to_start:
             targets.append(self.start)
 
-        # initialize segment storage if needed
+        legs = list(zip([self.start] + self.ends, targets))
+
+        # initialize segment storage if needed, legs found in the leg cache are done already
         if not self.best_segments:
-            self.best_segments = [None] * len(targets)
-            self.best_segment_lengths = [float('inf')] * len(targets)
+            self.best_segments = [None] * len(legs)
+            self.best_segment_lengths = [float('inf')] * len(legs)
+            self.cached_segments = [None] * len(legs)
+        self.fill_cached_legs(legs, self.best_segments, self.best_segment_lengths,
+                              self.cached_segments, True)
+        self.last_routes = []
 
         # optimize each segment independently
-        for seg_idx, target in enumerate(targets):
-            start_pos = self.start if seg_idx == 0 else self.ends[seg_idx - 1]
+        for seg_idx, (start_pos, target) in enumerate(legs):
+            if self.cached_segments[seg_idx] and not self.refine_cached_legs:
+                continue
 
             # run ants for this segment only
-            segment_paths = []
-            for _ in range(self.num_ants):
-                path = self.run_ant(target, start_override=start_pos)
-                segment_paths.append(path)
+            segment_paths = self.walk_paths(start_pos, target, self.num_ants, True, self.pheromone)
 
             # update pheromones for this segment
-            self.pheromone *= (1 - self.evaporation_rate)
-            self.pheromone = np.maximum(self.pheromone, 0.1)
+            self.update_pheromone(self.pheromone, segment_paths)
+            found = [path for path in segment_paths if path]
+            self.all_routes.extend(found)
+            self.last_routes.append(found)
 
             for path in segment_paths:
-                if path:
-                    deposit = self.pheromone_deposit / len(path)
-                    for pos in path:
-                        self.pheromone[pos] += deposit
+                if path and len(path) < self.best_segment_lengths[seg_idx]:
+                    self.best_segment_lengths[seg_idx] = len(path)
+                    self.best_segments[seg_idx] = path
 
-                    if len(path) < self.best_segment_lengths[seg_idx]:
-                        self.best_segment_lengths[seg_idx] = len(path)
-                        self.best_segments[seg_idx] = path
+        # also covers legs set by solve_exact or a checkpoint that beat the cached ones
+        self.store_legs(legs, self.best_segments, True)
 
         # combine best segments into full route
         if all(seg is not None for seg in self.best_segments):
-            full_route = []
-            for seg in self.best_segments:
-                if len(full_route) > 0:
-                    seg = seg[1:]  # skip first point to avoid duplication
-                full_route.extend(seg)
+            full_route = Route.join(self.best_segments)
             self.best_route = full_route
             self.best_route_length = len(full_route)
 
@@ -290,33 +1601,450 @@ class AntFarm:
 
     # executes one complete iteration of ant colony optimization for all endpoints
     def run_iteration(self):
+        if self.profiler is not None and not self.profiler.active:
+            return self.profiler.run(self)
+        self.iteration += 1
+        if self.sequential and self.optimize_order:
+            self.apply_visit_order()
+
         if self.segment_by_segment and self.sequential:
             return self.run_iteration_segment_by_segment()
         elif self.sequential:
-            routes = []
             targets = self.ends.copy()
             if self.return_to_start:
                 targets.append(self.start)
 
-            for _ in range(self.num_ants):
-                route = self.run_ant_sequential(self.start, targets)
-                routes.append(route)
+            routes = self.walk_routes(self.start, targets, self.num_ants, True, self.pheromone)
 
             self.update_pheromones_sequential(routes)
+            self.last_routes = [[route for route in routes if route]]
             return routes
         else:
             paths_by_target = {e: [] for e in self.ends}
 
             for target in self.ends:
-                for _ in range(self.num_ants):
-                    path = self.run_ant(target)
-                    paths_by_target[target].append(path)
-                    if path:
-                        self.all_routes.append(path)
+                paths = self.walk_paths(self.start, target, self.num_ants, True, self.pheromone)
+                paths_by_target[target] = paths
+                self.all_routes.extend(path for path in paths if path)
 
             self.update_pheromones(paths_by_target)
+            self.last_routes = [[path for path in paths if path] for paths in paths_by_target.values()]
             return paths_by_target
 
+    # reorders self.ends into the shortest visiting order, dropping routes found for the old order
+    # only solves again when the stops or the layout change, returns True if the order changed
+    def apply_visit_order(self):
+        key = self.visit_order_key()
+        if self._visit_order_key == key:
+            return False
+        self._visit_order_key = key
+
+        order = self.shortest_visit_order(self.start, self.ends, (True,), self.return_to_start)
+        if order == self.ends:
+            return False
+        self.ends = order
+        self.best_route = None
+        self.best_route_length = float('inf')
+        self.best_segments = []
+        self.best_segment_lengths = []
+        return True
+
+    # returns best total length found so far, inf until every endpoint has a route
+    def current_best_length(self):
+        if self.sequential:
+            return self.best_route_length
+        lengths = [self.best_path_lengths[e] for e in self.ends]
+        return sum(lengths) if lengths else float('inf')
+
+    # returns pheromone grids the colony is optimizing
+    def pheromone_maps(self):
+        return [self.pheromone]
+
+    # returns (route, check_cart) for every best route, leg and path found so far
+    def found_routes(self):
+        routes = [self.best_route] + list(self.best_segments) + list(self.best_paths.values())
+        return [(route, True) for route in routes if route]
+
+    # returns an AntFarm on the floor shrunk by factor with the same stops and settings
+    def coarse_copy(self, factor):
+        shape = (-(-self.grid_size[0] // factor), -(-self.grid_size[1] // factor))
+        cart_size = downsample_footprint(self.cart_size, factor)
+        return self.scale_into(AntFarm(grid_size=shape, cart_size=cart_size, dtype=self.dtype), factor)
+
+    def set_dtype(self, dtype):
+        super().set_dtype(dtype)
+        if isinstance(self.pheromone, TiledPheromone):
+            self.pheromone = TiledPheromone.from_dense(np.asarray(self.pheromone), self.pheromone.floor,
+                                                       self.pheromone.tile, self.dtype)
+        else:
+            self.pheromone = self.pheromone.astype(self.dtype)
+        for store in ('_pheromone_people', '_pheromone_carts'):
+            if getattr(self, store) is not None:
+                setattr(self, store, getattr(self, store).astype(self.dtype))
+
+    def memory_estimate(self):
+        tile = self.pheromone.tile if isinstance(self.pheromone, TiledPheromone) else None
+        return super().memory_estimate(1, tile)
+
+    # drops best routes crossing cells the edit blocked and resets the pheromone around region,
+    # legs and paths the edit did not touch keep their results
+    def layout_edited(self, region):
+        self.pheromone[self.edit_window(region, True)] = 0.1
+        if self.convergence is not None:
+            self.convergence.reset()
+        self.stop_reason = None
+        if not (self.best_route or any(self.best_segments) or any(self.best_paths.values())):
+            return
+
+        enterable = self.get_enterable(True).reshape(-1)
+        if self.best_route and not enterable[self.best_route.flat].all():
+            self.best_route = None
+            self.best_route_length = float('inf')
+        for i, seg in enumerate(self.best_segments):
+            if seg and not enterable[seg.flat].all():
+                self.best_segments[i] = None
+                self.best_segment_lengths[i] = float('inf')
+                self.cached_segments[i] = None # the edited layout may have the leg cached
+        for e, path in self.best_paths.items():
+            if path and not enterable[path.flat].all():
+                self.best_paths[e] = None
+                self.best_path_lengths[e] = float('inf')
+
+    # returns arrays save_checkpoint writes for this farm
+    def checkpoint_state(self):
+        state = {
+            'pheromone': np.asarray(self.pheromone),
+            'start': np.array(self.start),
+            'ends': np.array(self.ends, dtype=np.int64).reshape(-1, 2),
+        }
+        state.update(pack_routes('best_route', [self.best_route]))
+        state.update(pack_routes('best_segments', self.best_segments))
+        state.update(pack_routes('best_paths', [self.best_paths.get(e) for e in self.ends]))
+        return state
+
+    # takes over arrays written by checkpoint_state, only the pheromone with warm_start
+    def restore_state(self, state, warm_start=False):
+        if 'pheromone' not in state:
+            raise ValueError("checkpoint was not saved by an AntFarm")
+        if state['pheromone'].shape != self.pheromone.shape:
+            raise ValueError(f"checkpoint grid {state['pheromone'].shape} does not match "
+                             f"{self.pheromone.shape}")
+        self.pheromone[...] = state['pheromone']
+        if warm_start:
+            return
+
+        width = self.grid_size[1]
+        self.start = tuple(int(v) for v in state['start'])
+        self.ends = [tuple(int(v) for v in e) for e in state['ends']]
+        self.best_route = unpack_routes(state, 'best_route', width)[0]
+        self.best_route_length = len(self.best_route) if self.best_route else float('inf')
+        self.best_segments = unpack_routes(state, 'best_segments', width)
+        self.best_segment_lengths = [len(seg) if seg else float('inf') for seg in self.best_segments]
+        self.cached_segments = [None] * len(self.best_segments)
+        paths = unpack_routes(state, 'best_paths', width)
+        self.best_paths = dict(zip(self.ends, paths))
+        self.best_path_lengths = {e: len(path) if path else float('inf')
+                                  for e, path in self.best_paths.items()}
+
+    # returns exact shortest routes for the current mode, {end: Route} in parallel mode,
+    # otherwise the optimal leg to each stop in visiting order (None where unreachable)
+    def exact_routes(self):
+        if not self.sequential:
+            return {e: self.shortest_path(self.start, e) for e in self.ends}
+        targets = self.ends.copy()
+        if self.return_to_start:
+            targets.append(self.start)
+        legs = []
+        start = self.start
+        for target in targets:
+            legs.append(self.shortest_path(start, target))
+            start = target
+        return legs
+
+    # returns shortest possible total length in the current mode, the ground truth for
+    # current_best_length(), inf if a stop cannot be reached
+    def optimal_length(self):
+        exact = self.exact_routes()
+        routes = list(exact.values()) if not self.sequential else exact
+        if not routes or any(route is None for route in routes):
+            return float('inf')
+        if not self.sequential:
+            return sum(len(route) for route in routes)
+        return len(Route.join(routes))
+
+    # fills the best routes with the exact solution without running any ants
+    def solve_exact(self):
+        exact = self.exact_routes()
+        if not self.sequential:
+            for e, path in exact.items():
+                self.best_paths[e] = path
+                self.best_path_lengths[e] = len(path) if path else float('inf')
+            return exact
+
+        if self.segment_by_segment:
+            self.best_segments = exact
+            self.best_segment_lengths = [len(leg) if leg else float('inf') for leg in exact]
+            self.cached_segments = [False] * len(exact)
+            targets = self.ends + [self.start] if self.return_to_start else self.ends
+            self.store_legs(list(zip([self.start] + self.ends, targets)), exact, True)
+        if exact and all(leg is not None for leg in exact):
+            self.best_route = Route.join(exact)
+            self.best_route_length = len(self.best_route)
+        return self.best_route
+
+    # lays pheromone along the exact routes so the colony starts out on the optimum
+    # strength is in units of one ant's deposit
+    def seed_pheromone_exact(self, strength=1.0):
+        exact = self.exact_routes()
+        if not self.sequential:
+            routes = list(exact.values())
+        elif self.segment_by_segment or any(leg is None for leg in exact):
+            routes = exact
+        else:
+            routes = [Route.join(exact)] if exact else []
+        self.seed_pheromone(self.pheromone, routes, strength * self.pheromone_deposit)
+
+
+class ConvergenceMonitor:
+    # decides when a run has stopped improving and records why
+    # patience: iterations without a shorter best route before stopping
+    # min_entropy: stop once normalized pheromone entropy (0-1) over the visited cells drops
+    #              below this, None to skip
+    # min_diversity: stop once route_diversity (0-1), how little the ants' routes overlap,
+    #                drops below this, None to skip
+
+    def __init__(self, patience=20, min_entropy=None, min_diversity=None, min_iterations=5):
+        self.patience = patience
+        self.min_entropy = min_entropy
+        self.min_diversity = min_diversity
+        self.min_iterations = min_iterations
+        self.reset()
+
+    # clears history so the monitor can watch a new run
+    def reset(self):
+        self.iterations = 0
+        self.best_length = float('inf')
+        self.since_improvement = 0
+        self.stop_reason = None
+
+    # records one finished iteration of farm, returns True when the run should stop
+    def update(self, farm):
+        self.iterations += 1
+        length = farm.current_best_length()
+        if length < self.best_length:
+            self.best_length = length
+            self.since_improvement = 0
+        elif self.best_length != float('inf'):
+            self.since_improvement += 1
+
+        if self.iterations < self.min_iterations:
+            return False
+
+        if self.patience and self.since_improvement >= self.patience:
+            self.stop_reason = f"no improvement in best length for {self.since_improvement} iterations"
+        elif self.min_entropy is not None:
+            entropy = max(pheromone_entropy(pher, farm.obstacles) for pher in farm.pheromone_maps())
+            if entropy < self.min_entropy:
+                self.stop_reason = f"pheromone entropy {entropy:.3f} below {self.min_entropy}"
+        if self.stop_reason is None and self.min_diversity is not None:
+            diversity = route_diversity(farm.last_routes)
+            if diversity is not None and diversity < self.min_diversity:
+                self.stop_reason = f"route diversity {diversity:.3f} below {self.min_diversity}"
+
+        return self.stop_reason is not None
+
+
+# functions Profiler(detail=True) reports from cProfile, label -> (file, function, cumulative)
+# the walker's weight loop is inline, so its own time in walk_leg is the probability work
+PROFILE_FUNCTIONS = {
+    'neighbors': ('ant_farm.py', 'neighbors', False),
+    'probability': ('ant_farm.py', 'walk_leg', False),
+    'choice': ('random.py', 'choices', True),
+    'batch_step': ('ant_farm.py', 'walk_batch', False),
+    'post_optimize_route': ('ant_farm.py', 'post_optimize_route', True),
+}
+
+
+class Profiler:
+    # times the phases of every iteration and counts ants, steps and why ants failed
+    # turn it on with farm.profiler = Profiler(), it costs nothing while farm.profiler is None
+    # callback(stats) is called with the stats dict of each finished iteration
+    # detail also runs cProfile during iterations to split walking into neighbor lookups,
+    # probability weights and random choices; the run gets noticeably slower with it
+
+    def __init__(self, callback=None, detail=False):
+        self.callback = callback
+        self.detail = detail
+        self.history = [] # stats of every finished iteration
+        self.active = False # True while an iteration runs under the profiler
+        self._reset()
+
+    # clears counters and phase times collected since the last iteration
+    def _reset(self):
+        self.counts = Counter(ants=0, arrived=0, steps=0, dead_ends=0, out_of_steps=0)
+        self.phases = {}
+        self.calls = Counter()
+        self._open = [] # time spent in nested phases, one entry per open phase
+
+    # adds ants that set out and how many of them arrived
+    def count_ants(self, ants, arrived):
+        self.counts['ants'] += ants
+        self.counts['arrived'] += arrived
+
+    # times the block as phase name, time spent in nested phases is only counted there
+    @contextmanager
+    def phase(self, name):
+        nested = [0.0]
+        self._open.append(nested)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self._open.pop()
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed - nested[0]
+            self.calls[name] += 1
+            if self._open:
+                self._open[-1][0] += elapsed
+
+    # runs one iteration of farm under the profiler, returns what run_iteration returned
+    def run(self, farm):
+        self._reset()
+        profile = cProfile.Profile() if self.detail else None
+        self.active = True
+        started = time.perf_counter()
+        try:
+            if profile is not None:
+                profile.enable()
+            result = farm.run_iteration()
+        finally:
+            if profile is not None:
+                profile.disable()
+            self.active = False
+        stats = self.iteration_stats(farm, time.perf_counter() - started, profile)
+        self.history.append(stats)
+        if self.callback is not None:
+            self.callback(stats)
+        return result
+
+    # returns stats dict of the iteration that just ran
+    def iteration_stats(self, farm, seconds, profile=None):
+        phases = dict(self.phases)
+        phases['other'] = max(seconds - sum(phases.values()), 0.0)
+        stats = {'iteration': farm.iteration, 'seconds': seconds, 'phases': phases,
+                 'calls': dict(self.calls), 'best_length': farm.current_best_length()}
+        stats.update(self.counts)
+        stats.update(rates(self.counts, seconds))
+        if profile is not None:
+            stats['functions'] = profiled_functions(profile)
+        return stats
+
+    # returns totals over all profiled iterations in the same form as one iteration's stats
+    def summary(self):
+        seconds = sum(stats['seconds'] for stats in self.history)
+        counts = Counter()
+        phases = Counter()
+        calls = Counter()
+        functions = {}
+        for stats in self.history:
+            counts.update({key: stats[key] for key in self.counts})
+            phases.update(stats['phases'])
+            calls.update(stats['calls'])
+            for label, (spent, count) in stats.get('functions', {}).items():
+                before = functions.get(label, (0.0, 0))
+                functions[label] = (before[0] + spent, before[1] + count)
+        summary = {'iterations': len(self.history), 'seconds': seconds,
+                   'seconds_per_iteration': seconds / len(self.history) if self.history else None,
+                   'phases': dict(phases), 'calls': dict(calls)}
+        summary.update(counts)
+        summary.update(rates(counts, seconds))
+        if functions:
+            summary['functions'] = functions
+        return summary
+
+    # returns readable report of summary() as one string
+    def report(self):
+        summary = self.summary()
+        if not summary['iterations']:
+            return "no iterations profiled"
+        seconds = summary['seconds']
+        lines = [f"profile of {summary['iterations']} iterations, "
+                 f"{summary['seconds_per_iteration']:.3f}s per iteration",
+                 f"{'phase':<22}{'seconds':>10}{'share':>8}{'calls':>10}"]
+        for name, spent in sorted(summary['phases'].items(), key=lambda item: -item[1]):
+            share = spent / seconds if seconds else 0
+            lines.append(f"{name:<22}{spent:>10.3f}{share:>8.1%}{summary['calls'].get(name, ''):>10}")
+        if 'functions' in summary:
+            lines.append("functions (cProfile, part of the phases above)")
+            for label, (spent, count) in sorted(summary['functions'].items(), key=lambda item: -item[1][0]):
+                share = spent / seconds if seconds else 0
+                lines.append(f"  {label:<20}{spent:>10.3f}{share:>8.1%}{count:>10}")
+
+        ants = summary['ants']
+        if ants:
+            lines.append(f"ants {ants}, arrived {summary['arrived']} ({summary['success_rate']:.1%}), "
+                         f"out of steps {summary['out_of_steps']}, dead ends {summary['dead_ends']}")
+            lines.append(f"steps {summary['steps']}, {summary['steps_per_ant']:.0f} per ant, "
+                         f"{summary['ants_per_second']:.1f} ants/s, "
+                         f"{summary['steps_per_second']:.0f} steps/s")
+        return '\n'.join(lines)
+
+
+# returns success rate and throughput for profiler counts over seconds
+def rates(counts, seconds):
+    ants = counts['ants']
+    return {
+        'failed': ants - counts['arrived'],
+        'success_rate': counts['arrived'] / ants if ants else None,
+        'steps_per_ant': counts['steps'] / ants if ants else None,
+        'ants_per_second': ants / seconds if seconds else None,
+        'steps_per_second': counts['steps'] / seconds if seconds else None,
+    }
+
+
+# returns label -> (seconds, calls) of PROFILE_FUNCTIONS found in a finished cProfile run
+def profiled_functions(profile):
+    found = {}
+    for (filename, _, function), (_, calls, own, cumulative, _) in pstats.Stats(profile).stats.items():
+        for label, (file, name, use_cumulative) in PROFILE_FUNCTIONS.items():
+            if function == name and os.path.basename(filename) == file:
+                spent, count = found.get(label, (0.0, 0))
+                found[label] = (spent + (cumulative if use_cumulative else own), count + calls)
+    return found
+
+
+# spread of pheromone above the floor value over the cells ants have marked, 1 = even,
+# 0 = a single cell; cells never visited do not count, so the value falls as the colony
+# piles its pheromone onto fewer corridors instead of staying near 1 on large floors
+def pheromone_entropy(pheromone, obstacles, floor=0.1):
+    pheromone = np.asarray(pheromone)
+    excess = np.clip(pheromone[~obstacles] - floor, 0, None)
+    excess = excess[excess > 0]
+    if excess.size < 2:
+        return 1.0
+    p = excess / excess.sum()
+    return float(-(p * np.log(p)).sum() / np.log(excess.size))
+
+
+# how little the routes of each leg overlap, averaged over legs: 0 when every ant walked the
+# same corridor, 1 when no two ants shared any of it. Routes are compared by the block x
+# block squares they pass, so equally short staircases a cell apart count as one corridor.
+# returns None when no leg had at least two successful ants
+def route_diversity(route_groups, block=3):
+    shares = []
+    for group in route_groups:
+        if len(group) < 2:
+            continue
+        # squares of each route, then how many routes pass each square
+        squares = [np.unique((route.flat // route.width // block) * route.width
+                             + route.flat % route.width // block) for route in group]
+        _, counts = np.unique(np.concatenate(squares), return_counts=True)
+        n = len(squares)
+        # squares two routes share on average, relative to the squares one route passes
+        shared = (counts * (counts - 1)).sum() / (n * (n - 1))
+        shares.append(1 - shared / np.mean([len(s) for s in squares]))
+    return float(np.mean(shares)) if shares else None
+
 
 # creates sample production floor layout with multiple endpoints
 def create_template_layout():
@@ -365,122 +2093,82 @@ def split_route_into_segments(route, waypoints):
     return segments
 
 # visualizes ant colony optimization with animated pathfinding
-def visualize_ant_farm(farm, iterations=150):
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 8))
+# the floor and stops are drawn once, frames only update the route artists and blit them
+# the colony runs in a background thread, frames show its newest iteration every interval ms
+# iterations_per_frame=K lets the colony get at most K iterations ahead of the window
+def visualize_ant_farm(farm, iterations=150, iterations_per_frame=None, interval=50):
+    # matplotlib is imported here so the optimizer also runs on machines without it
+    import matplotlib.pyplot as plt
+    from optimizer_thread import OptimizerThread, animate
+    from route_artists import (SEGMENT_COLORS, RoutePanel, route_waypoints, set_legs, set_route,
+                               set_routes)
 
-    iter_count = [0]
-    colors = ['red', 'blue', 'green', 'orange', 'purple', 'cyan', 'magenta', 'yellow']
-    
-    def update(frame):
-        if frame >= iterations:
-            return
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 8))
+    if farm.sequential and farm.optimize_order:
+        # settle the visiting order first so the stop numbers drawn below stay right
+        farm.apply_visit_order()
 
-        result = farm.run_iteration()
-        iter_count[0] = frame + 1
-        
-        ax1.clear()
-        ax2.clear()
-        
-        ax1.imshow(farm.obstacles, cmap='Greys', alpha=0.3)
-        
+    if farm.sequential:
+        mode_str = 'Segment-by-Segment' if farm.segment_by_segment else 'Sequential'
+        tested = RoutePanel(ax1, farm.obstacles, f'{mode_str} Routes', fontsize=14, grid_alpha=0.3)
+        candidates = tested.add_routes('b', alpha=0.3, linewidth=0.5)
+        tested.draw_stops(farm.start, farm.ends, 15, 12, end_label=lambda idx: f'Stop {idx+1}')
+        tested.legend(fontsize=10)
+
+        best = RoutePanel(ax2, farm.obstacles, 'Best Route', fontsize=14, grid_alpha=0.3)
+        waypoints = route_waypoints(farm.ends, farm.start, farm.return_to_start)
+        legs = best.add_legs(len(waypoints))
+        best.draw_stops(farm.start, farm.ends, 15, 12, offset=1, return_to_start=farm.return_to_start)
+        best.legend(fontsize=10)
+    else:
+        tested = RoutePanel(ax1, farm.obstacles, 'Ant Paths', fontsize=14, grid_alpha=0.3)
+        candidates = [tested.add_routes(SEGMENT_COLORS[idx % len(SEGMENT_COLORS)], alpha=0.3, linewidth=0.5)
+                      for idx in range(len(farm.ends))]
+        tested.draw_stops(farm.start, farm.ends, 15, 12, end_colors=SEGMENT_COLORS,
+                          end_label=lambda idx: f'End {idx+1}')
+        tested.legend(fontsize=10)
+
+        best = RoutePanel(ax2, farm.obstacles, 'Best Paths', fontsize=14, grid_alpha=0.3)
+        paths = [best.add_route(SEGMENT_COLORS[idx % len(SEGMENT_COLORS)], 3, f'Path {idx+1}')
+                 for idx in range(len(farm.ends))]
+        best.draw_stops(farm.start, farm.ends, 15, 12, end_colors=SEGMENT_COLORS, start_label=None)
+        best.legend(fontsize=10)
+
+    artists = tested.artists + best.artists
+    plt.tight_layout()
+
+    # runs in the optimizer thread after each iteration, copies what a frame shows
+    def capture(result):
         if farm.sequential:
-            mode_str = 'Segment-by-Segment' if farm.segment_by_segment else 'Sequential'
-            ax1.set_title(f'Iteration {iter_count[0]}: {mode_str} Routes', fontsize=14)
-
-            if farm.segment_by_segment:
-                # show individual segments being optimized
-                for seg in result:
-                    if seg:
-                        sa = np.array(seg)
-                        ax1.plot(sa[:, 1], sa[:, 0], 'b-', alpha=0.3, linewidth=0.5)
-            else:
-                for route in result:
-                    if route:
-                        ra = np.array(route)
-                        ax1.plot(ra[:, 1], ra[:, 0], 'b-', alpha=0.3, linewidth=0.5)
-            
-            ax1.plot(farm.start[1], farm.start[0], 'go', markersize=15, label='Start')
-            for idx, e in enumerate(farm.ends):
-                ax1.plot(e[1], e[0], 'ro', markersize=12, label=f'Stop {idx+1}')
-            ax1.legend()
-            ax1.grid(True, alpha=0.3)
-
-            ax2.imshow(farm.obstacles, cmap='Greys', alpha=0.3)
-            ax2.set_title(f'Best Route: {farm.best_route_length:.0f} steps', fontsize=14)
-
-            if farm.best_route:
-                # split route into colored segments
-                waypoints = farm.ends.copy()
-                if farm.return_to_start:
-                    waypoints.append(farm.start)
-                segments = split_route_into_segments(farm.best_route, waypoints)
-
-                for seg_idx, segment in enumerate(segments):
-                    if len(segment) > 1:
-                        seg_array = np.array(segment)
-                        color = colors[seg_idx % len(colors)]
-                        ax2.plot(seg_array[:, 1], seg_array[:, 0], color=color,
-                                linewidth=3, label=f'Segment {seg_idx+1}')
-
-                for idx in range(len(farm.ends)):
-                    if idx < len(farm.ends):
-                        e = farm.ends[idx]
-                        ax2.plot(e[1], e[0], 'ro', markersize=12)
-                        ax2.text(e[1]+1, e[0]+1, str(idx+1), color='white',
-                                fontsize=12, fontweight='bold')
-
-            ax2.plot(farm.start[1], farm.start[0], 'go', markersize=15, label='Start')
-            if farm.return_to_start:
-                ax2.text(farm.start[1]+1, farm.start[0]+1, 'S/E', color='white',
-                        fontsize=12, fontweight='bold')
-            ax2.legend()
-            ax2.grid(True, alpha=0.3)
-            
+            # segment by segment returns the best segments, otherwise the routes just walked
+            return {'iteration': farm.iteration, 'candidates': list(result),
+                    'best_route': farm.best_route, 'best_length': farm.best_route_length}
+        return {'iteration': farm.iteration,
+                'candidates': {k: list(v) for k, v in result.items()},
+                'best_paths': dict(farm.best_paths), 'best_lengths': dict(farm.best_path_lengths)}
+
+    def draw(snapshot):
+        tested.set_status(f"Iteration {snapshot['iteration']}")
+        if farm.sequential:
+            set_routes(candidates, snapshot['candidates'])
+            set_legs(legs, snapshot['best_route'], waypoints)
+            best.set_status(f"{snapshot['best_length']:.0f} steps")
         else:
-            ax1.set_title(f'Iteration {iter_count[0]}: Ant Paths', fontsize=14)
-            
-            for idx, (target, paths) in enumerate(result.items()):
-                c = colors[idx % len(colors)]
-                for path in paths:
-                    if path:
-                        pa = np.array(path)
-                        ax1.plot(pa[:, 1], pa[:, 0], c=c, alpha=0.3, linewidth=0.5)
-            
-            ax1.plot(farm.start[1], farm.start[0], 'go', markersize=15, label='Start')
-            for idx, e in enumerate(farm.ends):
-                c = colors[idx % len(colors)]
-                ax1.plot(e[1], e[0], 'o', color=c, markersize=12, label=f'End {idx+1}')
-            ax1.legend()
-            ax1.grid(True, alpha=0.3)
-
-            ax2.imshow(farm.obstacles, cmap='Greys', alpha=0.3)
-            
-            total_len = sum([farm.best_path_lengths[e] for e in farm.ends if farm.best_path_lengths[e] != float('inf')])
-            ax2.set_title(f'Total Best: {total_len:.0f} steps', fontsize=14)
-            
-            for idx, e in enumerate(farm.ends):
-                if farm.best_paths[e]:
-                    c = colors[idx % len(colors)]
-                    ba = np.array(farm.best_paths[e])
-                    ax2.plot(ba[:, 1], ba[:, 0], c=c, linewidth=3, 
-                            label=f'Path {idx+1}: {farm.best_path_lengths[e]:.0f}')
-            
-            ax2.plot(farm.start[1], farm.start[0], 'go', markersize=15)
-            for idx, e in enumerate(farm.ends):
-                c = colors[idx % len(colors)]
-                ax2.plot(e[1], e[0], 'o', color=c, markersize=12)
-            ax2.legend()
-            ax2.grid(True, alpha=0.3)
-        
-        plt.tight_layout()
-    
-    anim = animation.FuncAnimation(fig, update, frames=iterations, 
-                                  interval=100, repeat=False)
-    plt.show()
+            best_paths, best_lengths = snapshot['best_paths'], snapshot['best_lengths']
+            for lines, e in zip(candidates, farm.ends):
+                set_routes(lines, snapshot['candidates'][e])
+            for line, e in zip(paths, farm.ends):
+                set_route(line, best_paths[e])
+            found = [best_lengths[e] for e in farm.ends if best_lengths[e] != float('inf')]
+            lengths = ', '.join(f'{idx+1}: {best_lengths[e]:.0f}'
+                                for idx, e in enumerate(farm.ends) if best_paths[e])
+            best.set_status(f'Total Best: {sum(found):.0f} steps' + (f' ({lengths})' if lengths else ''))
+
+    worker = OptimizerThread(farm, iterations, capture, iterations_per_frame)
+    animate(fig, artists, worker, draw, interval)
     
     return farm
 
-
 if __name__ == "__main__":
     # Set number of iterations here
     # Lower values (10-50) = faster but less optimized
@@ -496,6 +2184,8 @@ if __name__ == "__main__":
     farm = visualize_ant_farm(farm, iterations=ITERATIONS)
     
     print("\nResults")
+    if farm.stop_reason:
+        print(f"Stopped early: {farm.stop_reason}")
     if farm.sequential:
         print(f"Best sequential route: {farm.best_route_length:.0f} steps")
         if farm.best_route:
@@ -0,0 +1,155 @@
+# Process pool that walks ants on several cores
+#
+# The obstacle grid and the current pheromone snapshot are placed in shared memory so
+# workers read them directly instead of receiving pickled copies for every batch.
+# Each ant gets its own seeded random stream, so a run gives the same routes no matter
+# how many workers it is spread over.
+
+import os
+import random
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from ant_farm import FloorLayout, Profiler, Route
+
+
+# shared memory blocks attached by this worker, keyed by role ('obstacles' or 'pheromone')
+_attached = {}
+# layout rebuilt inside this worker from the shared obstacle grid
+_worker_layout = [None, None]
+
+
+# returns numpy view onto a shared block, reattaching when the parent replaced it
+def _attach(role, name, shape, dtype):
+    if role in _attached and _attached[role][0] == name:
+        return _attached[role][2]
+    if role in _attached:
+        _attached[role][1].close()
+    shm = shared_memory.SharedMemory(name=name)
+    view = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    _attached[role] = (name, shm, view)
+    return view
+
+
+# returns worker side layout for the job, rebuilding lookup tables only when the obstacles change
+def _get_layout(job):
+    name, shape = job['obstacles']
+    key = (name, job['cart_size'], job['dtype'])
+    if _worker_layout[0] != key:
+        layout = FloorLayout(grid_size=shape, cart_size=job['cart_size'], dtype=job['dtype'])
+        layout.obstacles = _attach('obstacles', name, shape, bool)
+        _worker_layout[0] = key
+        _worker_layout[1] = layout
+
+    # the parent farm's walk settings replace the FloorLayout defaults
+    layout = _worker_layout[1]
+    layout.alpha = job['alpha']
+    layout.beta = job['beta']
+    layout.heuristic = job['heuristic']
+    layout.max_steps = job['max_steps']
+    layout.profiler = Profiler() if job['profile'] else None
+    return layout
+
+
+# walks a chunk of ants inside a worker, returns one int32 flat index array or None per ant
+# plus the steps and failure counts of all of them, None while the parent is not profiling
+def _walk_chunk(job, seeds):
+    layout = _get_layout(job)
+    name, shape, dtype = job['pheromone']
+    pheromone_map = _attach('pheromone', name, shape, dtype)
+
+    routes = []
+    for seed in seeds:
+        route = layout.walk_route(job['start'], job['targets'], job['check_cart'],
+                                  pheromone_map, random.Random(seed))
+        routes.append(route.flat if route else None)
+    stats = layout.walk_stats()
+    return routes, dict(stats) if stats is not None else None
+
+
+# closes and unlinks shared memory blocks owned by the parent process
+def _release(blocks):
+    for shm in blocks.values():
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+    blocks.clear()
+
+
+class AntPool:
+    # worker processes plus the shared memory blocks they read the grids from
+
+    def __init__(self, workers=None):
+        self.workers = workers if workers else os.cpu_count()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self._blocks = {'obstacles': None, 'pheromone': None}
+        self._meta = {}
+        self._obstacles_version = None
+        self._finalizer = weakref.finalize(self, _release, self._blocks)
+
+    # frees the shared block for role
+    def _drop(self, role):
+        shm = self._blocks[role]
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+        self._blocks[role] = None
+
+    # copies array into the shared block for role, replacing the block if shape or dtype changed
+    def _share(self, role, array):
+        if self._blocks[role] is None or self._meta.get(role) != (array.shape, array.dtype):
+            self._drop(role)
+            self._blocks[role] = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            self._meta[role] = (array.shape, array.dtype)
+        shm = self._blocks[role]
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+        return shm.name
+
+    # walks one ant per seed and returns Routes (or None) in seed order
+    # stats is a Profiler counter dict that collects the workers' steps and failure reasons, None to skip
+    def walk(self, layout, start, targets, check_cart, pheromone_map, seeds, stats=None):
+        if self._obstacles_version != layout.layout_version or self._blocks['obstacles'] is None:
+            # a fresh block per layout version, so workers know to rebuild their tables
+            self._drop('obstacles')
+            self._share('obstacles', layout.obstacles)
+            self._obstacles_version = layout.layout_version
+
+        pheromone_map = np.ascontiguousarray(pheromone_map)
+        job = {
+            'obstacles': (self._blocks['obstacles'].name, layout.obstacles.shape),
+            'pheromone': (self._share('pheromone', pheromone_map), pheromone_map.shape,
+                          pheromone_map.dtype),
+            'cart_size': tuple(layout.cart_size),
+            'dtype': layout.dtype.str,
+            'alpha': layout.alpha,
+            'beta': layout.beta,
+            'heuristic': layout.heuristic,
+            'max_steps': layout.max_steps,
+            'start': (int(start[0]), int(start[1])),
+            'targets': [(int(t[0]), int(t[1])) for t in targets],
+            'check_cart': check_cart,
+            'profile': stats is not None,
+        }
+
+        # a few chunks per worker keeps them busy when some ants wander longer than others
+        size = max(1, -(-len(seeds) // (self.workers * 4)))
+        chunks = [seeds[i:i + size] for i in range(0, len(seeds), size)]
+        futures = [self.executor.submit(_walk_chunk, job, chunk) for chunk in chunks]
+
+        width = layout.obstacles.shape[1]
+        routes = []
+        for future in futures:
+            chunk, counts = future.result()
+            for route in chunk:
+                routes.append(Route(route, width) if route is not None else None)
+            if stats is not None:
+                for key in ('steps', 'dead_ends', 'out_of_steps'):
+                    stats[key] += counts[key]
+        return routes
+
+    # stops the workers and frees the shared memory
+    def close(self):
+        self.executor.shutdown()
+        self._finalizer()
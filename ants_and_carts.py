@@ -1,10 +1,11 @@
 # Dual pathfinding simulation for people (small ants) vs carts
 
+import os
+
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from matplotlib.patches import Rectangle
-import random
+from ant_farm import (ConvergenceMonitor, FloorLayout, LayerStack, Route, RouteSink,
+                      downsample_footprint, pack_routes, unpack_routes, walk_batch)
+from leg_cache import LegCache
 
 
 # splits route into segments between waypoints
@@ -31,39 +32,50 @@ def split_route_into_segments(route, waypoints):
     return segments
 
 
-class DualPathFarm:
-    # Ant farm with separate pathfinding for people and carts
+class FleetFarm(FloorLayout):
+    # Ant farm that routes several vehicle classes over one floor
+    # every class has its own footprint and its own layer in the (N, H, W) pheromone stack,
+    # with the batch engine all classes are walked together in one numpy pass
 
-    def __init__(self, grid_size=(50, 50), cart_size=None):
-        self.grid_size = grid_size
-        self.obstacles = np.zeros(grid_size, dtype=bool)
-        self.start = None
-        self.ends = []
-        self.num_ants = 50
-        self.evaporation_rate = 0.1
-        self.pheromone_deposit = 100
-        self.alpha = 1.0
-        self.beta = 2.0
-        self.sequential = True
-        self.return_to_start = True
+    def __init__(self, grid_size=(50, 50), vehicles=None, dtype=np.float64):
+        super().__init__(grid_size, dtype=dtype)
+        # num_ants counts ants per vehicle class, optimize_order finds the order shortest for the whole fleet
         self.segment_by_segment = True # optimize each leg independently
-
-        # cart dimensions
-        self.cart_size = cart_size if cart_size else (1, 1)
-
-        # separate tracking for people and carts
-        self.pheromone_people = np.ones(grid_size) * 0.1
-        self.pheromone_carts = np.ones(grid_size) * 0.1
-        self.best_route_people = None
-        self.best_route_carts = None
-        self.best_route_length_people = float('inf')
-        self.best_route_length_carts = float('inf')
-        self.all_routes_people = []
-        self.all_routes_carts = []
-        self.best_segments_people = []
-        self.best_segments_carts = []
-        self.best_segment_lengths_people = []
-        self.best_segment_lengths_carts = []
+        self.last_routes = [] # successful routes of the last iteration, one list per leg and class
+        self.last_class_routes = {} # the same routes gathered per class, keyed by vehicle name
+
+        # per class tracking, keyed by vehicle name
+        self.vehicles = {} # name -> footprint (height, width), None for people
+        self.pheromone_stack = np.zeros((0,) + tuple(grid_size), dtype=self.dtype)
+        self.best_routes = {}
+        self.best_route_lengths = {}
+        self.best_segments = {}
+        self.best_segment_lengths = {}
+        self.cached_segments = {} # True for segments taken from leg_cache, ants skip those, None until asked
+        self.all_routes = {} # routes tested per class, swap in RecentRoutes/SampledRoutes/RouteWriter to keep them
+
+        for name, footprint in (vehicles or []):
+            self.add_vehicle(name, footprint)
+
+    # adds a vehicle class, footprint is (height, width) in grid units or None for people
+    def add_vehicle(self, name, footprint=None):
+        self.vehicles[name] = tuple(footprint) if footprint else None
+        layer = self.new_pheromone_grid()[None]
+        self.pheromone_stack = np.concatenate([self.pheromone_stack, layer])
+        self.best_routes[name] = None
+        self.best_route_lengths[name] = float('inf')
+        self.best_segments[name] = []
+        self.best_segment_lengths[name] = []
+        self.cached_segments[name] = []
+        self.all_routes[name] = RouteSink()
+
+    # returns pheromone grid of one vehicle class, a view into the stack
+    def pheromone_layer(self, name):
+        return self.pheromone_stack[list(self.vehicles).index(name)]
+
+    # returns check_cart argument for a vehicle class, False for people
+    def vehicle_check(self, name):
+        return self.vehicles[name] or False
 
     def set_start_end(self, start, end, sequential=False, return_to_start=False):
         self.start = start
@@ -75,237 +87,323 @@ class DualPathFarm:
         else:
             self.ends = [end]
 
-    def add_obstacle(self, top_left, bottom_right):
-        y1, x1 = top_left
-        y2, x2 = bottom_right
-        self.obstacles[y1:y2, x1:x2] = True
-
-    def check_cart_collision(self, pos):
-        y, x = pos
-        cart_h, cart_w = self.cart_size
-
-        if (y + cart_h > self.grid_size[0] or x + cart_w > self.grid_size[1]):
-            return True
-
-        cart_footprint = self.obstacles[y:y+cart_h, x:x+cart_w]
-        return np.any(cart_footprint)
-
-    def get_neighbors(self, pos, check_cart=True):
-        y, x = pos
-        nbrs = []
-        dirs = [(-1, 0), (1, 0), (0, -1), (0, 1),
-                (-1, -1), (-1, 1), (1, -1), (1, 1)]
-
-        for dy, dx in dirs:
-            ny, nx = y + dy, x + dx
-            if (0 <= ny < self.grid_size[0] and
-                0 <= nx < self.grid_size[1] and
-                not self.obstacles[ny, nx]):
-                if check_cart:
-                    if not self.check_cart_collision((ny, nx)):
-                        nbrs.append((ny, nx))
-                else:
-                    nbrs.append((ny, nx))
-        return nbrs
-
-    def calculate_probability(self, current, nbrs, visited, target, pheromone_map):
-        probs = []
-
-        for nbr in nbrs:
-            if nbr in visited:
-                probs.append(0)
-                continue
+    # returns stops in visiting order, ending at the start when return_to_start is set
+    def route_targets(self):
+        targets = self.ends.copy()
+        if self.return_to_start:
+            targets.append(self.start)
+        return targets
+
+    def visit_order_key(self):
+        return super().visit_order_key() + (tuple(self.vehicles.items()),)
+
+    # reorders self.ends into the visiting order shortest summed over all classes, dropping
+    # routes found for the old order, returns True if the order changed
+    def apply_visit_order(self):
+        key = self.visit_order_key()
+        if self._visit_order_key == key:
+            return False
+        self._visit_order_key = key
+
+        checks = [self.vehicle_check(name) for name in self.vehicles]
+        order = self.shortest_visit_order(self.start, self.ends, checks, self.return_to_start)
+        if order == self.ends:
+            return False
+        self.ends = order
+        for name in self.vehicles:
+            self.best_routes[name] = None
+            self.best_route_lengths[name] = float('inf')
+            self.best_segments[name] = []
+            self.best_segment_lengths[name] = []
+            self.cached_segments[name] = []
+        return True
+
+    # walks num_ants ants of every class in names (default all) from start through targets
+    # returns {name: routes}
+    def walk_fleet(self, start, targets, names=None):
+        names = list(self.vehicles) if names is None else list(names)
+        if self.engine != 'batch' or not names:
+            return {name: self.walk_routes(start, targets, self.num_ants, self.vehicle_check(name),
+                                           self.pheromone_layer(name))
+                    for name in names}
+
+        # one batch walk over the stacked tables, ants of the k-th class live on layer k
+        checks = [self.vehicle_check(name) for name in names]
+        layers = [list(self.vehicles).index(name) for name in names]
+        pheromone = self.pheromone_stack[layers] if len(layers) < len(self.vehicles) else self.pheromone_stack
+        tables = [self.get_neighbor_table(check) for check in checks]
+        key = ('stack', tuple(self.footprint(check) for check in checks))
+        if key not in self._layout_cache:
+            self._layout_cache[key] = LayerStack(tables)
+        stack = self._layout_cache[key]
+
+        offsets = np.repeat(np.arange(len(names)) * stack.size, self.num_ants)
+        flat_targets = np.array([tables[0].to_flat(t) for t in targets])
+        heuristics = [np.concatenate([self.get_heuristic(t, check) for check in checks])
+                      for t in targets]
+        max_steps = self.step_limit()
+        with self.timed('walk'):
+            paths = walk_batch(stack, pheromone, heuristics,
+                               tables[0].to_flat(start) + offsets, flat_targets[:, None] + offsets,
+                               len(offsets), self.alpha, max_steps, self.rng, self.walk_stats())
+        self.count_walks(paths)
+
+        routes = {}
+        for k, name in enumerate(names):
+            own = paths[k * self.num_ants:(k + 1) * self.num_ants]
+            own = [tables[k].to_route(p - k * stack.size) if p is not None else None for p in own]
+            routes[name] = self.post_optimize_routes(own, targets, checks[k])
+        return routes
+
+    # records successful routes of one class, returns the shortest
+    def _record(self, name, routes):
+        found = [route for route in routes if route]
+        self.all_routes[name].extend(found)
+        self.last_routes.append(found)
+        self.last_class_routes.setdefault(name, []).extend(found)
+        return min(found, key=len) if found else None
+
+    # runs one iteration for every vehicle class
+    # returns {name: best segments} segment by segment, else {name: routes walked this iteration}
+    def run_iteration(self):
+        if self.profiler is not None and not self.profiler.active:
+            return self.profiler.run(self)
+        self.iteration += 1
+        if self.optimize_order:
+            self.apply_visit_order()
+        targets = self.route_targets()
+        self.last_routes = []
+        self.last_class_routes = {}
 
-            pher = pheromone_map[nbr] ** self.alpha
-            dist = np.sqrt((nbr[0] - target[0])**2 + (nbr[1] - target[1])**2)
-            heur = (1.0 / (dist + 1)) ** self.beta
-            probs.append(pher * heur)
+        if self.segment_by_segment:
+            legs = list(zip([self.start] + targets[:-1], targets))
+            for name in self.vehicles:
+                # legs found in the leg cache are done already
+                if not self.best_segments[name]:
+                    self.best_segments[name] = [None] * len(legs)
+                    self.best_segment_lengths[name] = [float('inf')] * len(legs)
+                    self.cached_segments[name] = [None] * len(legs)
+                self.fill_cached_legs(legs, self.best_segments[name], self.best_segment_lengths[name],
+                                      self.cached_segments[name], self.vehicle_check(name))
+
+            for seg_idx, (start_pos, target) in enumerate(legs):
+                names = [name for name in self.vehicles
+                         if self.refine_cached_legs or not self.cached_segments[name][seg_idx]]
+                walked = self.walk_fleet(start_pos, [target], names)
+                for name, paths in walked.items():
+                    self.update_pheromone(self.pheromone_layer(name), paths)
+                    best = self._record(name, paths)
+                    if best and len(best) < self.best_segment_lengths[name][seg_idx]:
+                        self.best_segment_lengths[name][seg_idx] = len(best)
+                        self.best_segments[name][seg_idx] = best
+
+            # also covers legs set by solve_exact or a checkpoint that beat the cached ones
+            for name, segments in self.best_segments.items():
+                self.store_legs(legs, segments, self.vehicle_check(name))
 
-        total = sum(probs)
-        if total == 0:
-            return [1/len(nbrs)] * len(nbrs) if nbrs else []
-        return [p/total for p in probs]
+            # combine best segments
+            for name, segments in self.best_segments.items():
+                if all(seg is not None for seg in segments):
+                    self.best_routes[name] = Route.join(segments)
+                    self.best_route_lengths[name] = len(self.best_routes[name])
+            return {name: self.best_segments[name] for name in self.vehicles}
+
+        walked = self.walk_fleet(self.start, targets)
+        for k, (name, routes) in enumerate(walked.items()):
+            self.update_pheromone(self.pheromone_stack[k], routes)
+            best = self._record(name, routes)
+            if best and len(best) < self.best_route_lengths[name]:
+                self.best_route_lengths[name] = len(best)
+                self.best_routes[name] = best
+        return walked
+
+    # returns combined best length of all classes, inf until every class has a route
+    def current_best_length(self):
+        return sum(self.best_route_lengths.values())
+
+    # returns pheromone grids the colony is optimizing, one per class
+    def pheromone_maps(self):
+        return list(self.pheromone_stack)
+
+    # returns (route, check_cart) for every best route and leg of every class found so far
+    def found_routes(self):
+        found = []
+        for name in self.vehicles:
+            check = self.vehicle_check(name)
+            found += [(route, check) for route in [self.best_routes[name]] + self.best_segments[name]
+                      if route]
+        return found
+
+    # returns a FleetFarm on the floor shrunk by factor with the same classes, stops and settings
+    def coarse_copy(self, factor):
+        shape = (-(-self.grid_size[0] // factor), -(-self.grid_size[1] // factor))
+        vehicles = [(name, downsample_footprint(fp, factor)) for name, fp in self.vehicles.items()]
+        return self.scale_into(FleetFarm(shape, vehicles, self.dtype), factor)
+
+    def set_dtype(self, dtype):
+        super().set_dtype(dtype)
+        self.pheromone_stack = self.pheromone_stack.astype(self.dtype)
+
+    def memory_estimate(self):
+        return super().memory_estimate(len(self.vehicles))
+
+    # drops best routes and legs of each class that cross cells the edit blocked for its footprint
+    # and resets that class's pheromone around region, untouched legs keep their results
+    def layout_edited(self, region):
+        if self.convergence is not None:
+            self.convergence.reset()
+        self.stop_reason = None
+        for name in self.vehicles:
+            check = self.vehicle_check(name)
+            self.pheromone_layer(name)[self.edit_window(region, check)] = 0.1
+            if not (self.best_routes[name] or any(self.best_segments[name])):
+                continue
 
-    def run_ant(self, target, start_override=None, check_cart=True, pheromone_map=None):
-        start_pos = start_override if start_override is not None else self.start
+            enterable = self.get_enterable(check).reshape(-1)
+            route = self.best_routes[name]
+            if route and not enterable[route.flat].all():
+                self.best_routes[name] = None
+                self.best_route_lengths[name] = float('inf')
+            for i, seg in enumerate(self.best_segments[name]):
+                if seg and not enterable[seg.flat].all():
+                    self.best_segments[name][i] = None
+                    self.best_segment_lengths[name][i] = float('inf')
+                    self.cached_segments[name][i] = None # the edited layout may have the leg cached
+
+    def route_footprints(self):
+        return [self.footprint(self.vehicle_check(name)) or (0, 0) for name in self.vehicles]
+
+    # returns arrays save_checkpoint writes for this farm, routes are stored per class
+    def checkpoint_state(self):
+        state = {
+            'vehicles': np.array(list(self.vehicles)),
+            'pheromone_stack': self.pheromone_stack,
+            'start': np.array(self.start),
+            'ends': np.array(self.ends, dtype=np.int64).reshape(-1, 2),
+        }
+        for name in self.vehicles:
+            state.update(pack_routes(f'best_route_{name}', [self.best_routes[name]]))
+            state.update(pack_routes(f'best_segments_{name}', self.best_segments[name]))
+        return state
+
+    # takes over arrays written by checkpoint_state, only the pheromone with warm_start
+    def restore_state(self, state, warm_start=False):
+        if 'vehicles' not in state:
+            raise ValueError("checkpoint was not saved by a fleet farm")
+        if state['vehicles'].tolist() != list(self.vehicles):
+            raise ValueError(f"checkpoint vehicles {state['vehicles'].tolist()} do not match "
+                             f"{list(self.vehicles)}")
+        if state['pheromone_stack'].shape != self.pheromone_stack.shape:
+            raise ValueError(f"checkpoint grid {state['pheromone_stack'].shape[1:]} does not match "
+                             f"{self.pheromone_stack.shape[1:]}")
+        self.pheromone_stack[...] = state['pheromone_stack']
+        if warm_start:
+            return
 
-        path = [start_pos]
-        visited = set([start_pos])
-        curr = start_pos
-        max_steps = self.grid_size[0] * self.grid_size[1]
+        width = self.grid_size[1]
+        self.start = tuple(int(v) for v in state['start'])
+        self.ends = [tuple(int(v) for v in e) for e in state['ends']]
+        for name in self.vehicles:
+            route = unpack_routes(state, f'best_route_{name}', width)[0]
+            self.best_routes[name] = route
+            self.best_route_lengths[name] = len(route) if route else float('inf')
+            segments = unpack_routes(state, f'best_segments_{name}', width)
+            self.best_segments[name] = segments
+            self.best_segment_lengths[name] = [len(seg) if seg else float('inf') for seg in segments]
+            self.cached_segments[name] = [None] * len(segments)
+
+    # returns optimal leg to each stop in visiting order, per vehicle class
+    def exact_routes(self):
+        targets = self.route_targets()
+        exact = {}
+        for name in self.vehicles:
+            legs = []
+            start = self.start
+            for target in targets:
+                legs.append(self.shortest_path(start, target, self.vehicle_check(name)))
+                start = target
+            exact[name] = legs
+        return exact
+
+    # returns shortest possible combined length of all classes, inf if a stop is unreachable
+    def optimal_length(self):
+        total = 0
+        for legs in self.exact_routes().values():
+            if not legs or any(leg is None for leg in legs):
+                return float('inf')
+            total += len(Route.join(legs))
+        return total
+
+    # fills the best routes of every class with the exact solution without running any ants
+    def solve_exact(self):
+        exact = self.exact_routes()
+        targets = self.route_targets()
+        for name, legs in exact.items():
+            self.best_segments[name] = legs
+            self.best_segment_lengths[name] = [len(leg) if leg else float('inf') for leg in legs]
+            self.cached_segments[name] = [False] * len(legs)
+            self.store_legs(list(zip([self.start] + targets[:-1], targets)), legs, self.vehicle_check(name))
+            if legs and all(leg is not None for leg in legs):
+                self.best_routes[name] = Route.join(legs)
+                self.best_route_lengths[name] = len(self.best_routes[name])
+        return exact
+
+    # lays pheromone along the exact routes so every class starts out on its optimum
+    # strength is in units of one ant's deposit
+    def seed_pheromone_exact(self, strength=1.0):
+        exact = self.exact_routes()
+        for k, legs in enumerate(exact.values()):
+            if self.segment_by_segment or any(leg is None for leg in legs):
+                routes = legs
+            else:
+                routes = [Route.join(legs)] if legs else []
+            self.seed_pheromone(self.pheromone_stack[k], routes, strength * self.pheromone_deposit)
 
-        for _ in range(max_steps):
-            if curr == target:
-                return path
 
-            nbrs = self.get_neighbors(curr, check_cart=check_cart)
-            if not nbrs:
-                break
+# exposes one entry of a per class dictionary as a plain attribute
+def _class_attribute(store, name):
+    return property(lambda self: getattr(self, store)[name],
+                    lambda self, value: getattr(self, store).__setitem__(name, value))
 
-            probs = self.calculate_probability(curr, nbrs, visited, target, pheromone_map)
 
-            if sum(probs) == 0:
-                break
+class DualPathFarm(FleetFarm):
+    # Ant farm with separate pathfinding for people and carts
 
-            next_pos = random.choices(nbrs, weights=probs)[0]
-            path.append(next_pos)
-            visited.add(next_pos)
-            curr = next_pos
+    def __init__(self, grid_size=(50, 50), cart_size=None, dtype=np.float64):
+        super().__init__(grid_size, dtype=dtype)
+        self.cart_size = cart_size if cart_size else (1, 1)
+        self.add_vehicle('people', None)
+        self.add_vehicle('carts', self.cart_size)
+
+    best_route_people = _class_attribute('best_routes', 'people')
+    best_route_carts = _class_attribute('best_routes', 'carts')
+    best_route_length_people = _class_attribute('best_route_lengths', 'people')
+    best_route_length_carts = _class_attribute('best_route_lengths', 'carts')
+    best_segments_people = _class_attribute('best_segments', 'people')
+    best_segments_carts = _class_attribute('best_segments', 'carts')
+    best_segment_lengths_people = _class_attribute('best_segment_lengths', 'people')
+    best_segment_lengths_carts = _class_attribute('best_segment_lengths', 'carts')
+    all_routes_people = _class_attribute('all_routes', 'people')
+    all_routes_carts = _class_attribute('all_routes', 'carts')
+
+    @property
+    def pheromone_people(self):
+        return self.pheromone_stack[0]
+
+    @property
+    def pheromone_carts(self):
+        return self.pheromone_stack[1]
 
-        return None
+    def run_ant(self, target, start_override=None, check_cart=True, pheromone_map=None):
+        start_pos = start_override if start_override is not None else self.start
+        return self.walk_path(start_pos, target, check_cart, pheromone_map)
 
     def run_ant_sequential(self, start_pos, targets, check_cart=True, pheromone_map=None):
-        full_route = []
-        curr_start = start_pos
-
-        for target in targets:
-            path = [curr_start]
-            visited = set([curr_start])
-            curr = curr_start
-            max_steps = self.grid_size[0] * self.grid_size[1]
-
-            for _ in range(max_steps):
-                if curr == target:
-                    if len(full_route) > 0:
-                        path = path[1:]
-                    full_route.extend(path)
-                    curr_start = target
-                    break
-
-                nbrs = self.get_neighbors(curr, check_cart=check_cart)
-                if not nbrs:
-                    return None
-
-                probs = self.calculate_probability(curr, nbrs, visited, target, pheromone_map)
-
-                if sum(probs) == 0:
-                    return None
-
-                next_pos = random.choices(nbrs, weights=probs)[0]
-                path.append(next_pos)
-                visited.add(next_pos)
-                curr = next_pos
-            else:
-                return None
-
-        return full_route if full_route else None
+        return self.walk_route(start_pos, targets, check_cart, pheromone_map)
 
     def run_iteration_dual(self):
         # Run pathfinding for both people and carts
-        targets = self.ends.copy()
-        if self.return_to_start:
-            targets.append(self.start)
-
-        if self.segment_by_segment:
-            # segment by segment optimization
-            if not self.best_segments_people:
-                self.best_segments_people = [None] * len(targets)
-                self.best_segment_lengths_people = [float('inf')] * len(targets)
-                self.best_segments_carts = [None] * len(targets)
-                self.best_segment_lengths_carts = [float('inf')] * len(targets)
-
-            # optimize each segment for people
-            for seg_idx, target in enumerate(targets):
-                start_pos = self.start if seg_idx == 0 else self.ends[seg_idx - 1]
-                segment_paths = []
-                for _ in range(self.num_ants):
-                    path = self.run_ant(target, start_override=start_pos, check_cart=False,
-                                      pheromone_map=self.pheromone_people)
-                    segment_paths.append(path)
-
-                self.pheromone_people *= (1 - self.evaporation_rate)
-                self.pheromone_people = np.maximum(self.pheromone_people, 0.1)
-                for path in segment_paths:
-                    if path:
-                        deposit = self.pheromone_deposit / len(path)
-                        for pos in path:
-                            self.pheromone_people[pos] += deposit
-                        if len(path) < self.best_segment_lengths_people[seg_idx]:
-                            self.best_segment_lengths_people[seg_idx] = len(path)
-                            self.best_segments_people[seg_idx] = path
-
-            # optimize each segment for carts
-            for seg_idx, target in enumerate(targets):
-                start_pos = self.start if seg_idx == 0 else self.ends[seg_idx - 1]
-                segment_paths = []
-                for _ in range(self.num_ants):
-                    path = self.run_ant(target, start_override=start_pos, check_cart=True,
-                                      pheromone_map=self.pheromone_carts)
-                    segment_paths.append(path)
-
-                self.pheromone_carts *= (1 - self.evaporation_rate)
-                self.pheromone_carts = np.maximum(self.pheromone_carts, 0.1)
-                for path in segment_paths:
-                    if path:
-                        deposit = self.pheromone_deposit / len(path)
-                        for pos in path:
-                            self.pheromone_carts[pos] += deposit
-                        if len(path) < self.best_segment_lengths_carts[seg_idx]:
-                            self.best_segment_lengths_carts[seg_idx] = len(path)
-                            self.best_segments_carts[seg_idx] = path
-
-            # combine best segments
-            if all(seg is not None for seg in self.best_segments_people):
-                full_route = []
-                for seg in self.best_segments_people:
-                    if len(full_route) > 0:
-                        seg = seg[1:]
-                    full_route.extend(seg)
-                self.best_route_people = full_route
-                self.best_route_length_people = len(full_route)
-
-            if all(seg is not None for seg in self.best_segments_carts):
-                full_route = []
-                for seg in self.best_segments_carts:
-                    if len(full_route) > 0:
-                        seg = seg[1:]
-                    full_route.extend(seg)
-                self.best_route_carts = full_route
-                self.best_route_length_carts = len(full_route)
-
-            return {'people': self.best_segments_people, 'carts': self.best_segments_carts}
-
-        else:
-            # traditional sequential optimization
-            routes_people = []
-            for _ in range(self.num_ants):
-                route = self.run_ant_sequential(self.start, targets,
-                                              check_cart=False,
-                                              pheromone_map=self.pheromone_people)
-                routes_people.append(route)
-
-            routes_carts = []
-            for _ in range(self.num_ants):
-                route = self.run_ant_sequential(self.start, targets,
-                                              check_cart=True,
-                                              pheromone_map=self.pheromone_carts)
-                routes_carts.append(route)
-
-            self.pheromone_people *= (1 - self.evaporation_rate)
-            self.pheromone_people = np.maximum(self.pheromone_people, 0.1)
-            for route in routes_people:
-                if route:
-                    self.all_routes_people.append(route)
-                    deposit = self.pheromone_deposit / len(route)
-                    for pos in route:
-                        self.pheromone_people[pos] += deposit
-                    if len(route) < self.best_route_length_people:
-                        self.best_route_length_people = len(route)
-                        self.best_route_people = route
-
-            self.pheromone_carts *= (1 - self.evaporation_rate)
-            self.pheromone_carts = np.maximum(self.pheromone_carts, 0.1)
-            for route in routes_carts:
-                if route:
-                    self.all_routes_carts.append(route)
-                    deposit = self.pheromone_deposit / len(route)
-                    for pos in route:
-                        self.pheromone_carts[pos] += deposit
-                    if len(route) < self.best_route_length_carts:
-                        self.best_route_length_carts = len(route)
-                        self.best_route_carts = route
-
-            return {'people': routes_people, 'carts': routes_carts}
+        return self.run_iteration()
 
 
 def create_warehouse_dual(scale=2):
@@ -315,10 +413,10 @@ def create_warehouse_dual(scale=2):
     cart_h = 3 * scale
     cart_w = 5 * scale
 
-    print(f"\nDual Pathfinding Warehouse:")
+    print("\nDual Pathfinding Warehouse:")
     print(f"Grid: {h} x {w}")
     print(f"Cart size: {cart_h} x {cart_w} units (3ft x 5ft)")
-    print(f"People: no size constraints")
+    print("People: no size constraints")
 
     farm = DualPathFarm(grid_size=(h, w), cart_size=(cart_h, cart_w))
     # Adjust num_ants for accuracy vs speed
@@ -326,6 +424,13 @@ def create_warehouse_dual(scale=2):
     # Higher values (50-100) = slower but more accurate
     farm.num_ants = 50
 
+    add_warehouse_floor(farm)
+    return farm
+
+
+# sets stops and racks of the 120 x 180 warehouse used by the dual and fleet examples
+def add_warehouse_floor(farm):
+    h, w = farm.grid_size
     start_pos = (10, 10)
     endpoints = [(100, 160), (50, 160), (100, 80)]
     farm.set_start_end(start=start_pos, end=endpoints, sequential=True, return_to_start=True)
@@ -343,135 +448,110 @@ def create_warehouse_dual(scale=2):
     farm.add_obstacle((0, 0), (h, 2))
     farm.add_obstacle((0, w-2), (h, w))
 
+
+def create_warehouse_fleet(scale=2):
+    # Create warehouse layout comparing a whole fleet of vehicle classes
+    h = 120
+    w = 180
+    vehicles = [
+        ('people', None),
+        ('cart', (3 * scale, 5 * scale)),
+        ('pallet_jack', (4 * scale, 5 * scale)),
+        ('forklift', (5 * scale, 5 * scale)),
+    ]
+
+    print("\nFleet Pathfinding Warehouse:")
+    print(f"Grid: {h} x {w}")
+    for name, footprint in vehicles:
+        print(f"{name}: {f'{footprint[0]} x {footprint[1]} units' if footprint else 'no size constraints'}")
+
+    farm = FleetFarm(grid_size=(h, w), vehicles=vehicles)
+    farm.num_ants = 20
+    farm.engine = 'batch' # all classes walk in the same numpy pass
+    add_warehouse_floor(farm)
     return farm
 
 
-def visualize_dual_paths(farm, iterations=150):
+def visualize_dual_paths(farm, iterations=150, iterations_per_frame=None, interval=50):
     # Visualize both people and cart paths
-    fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(18, 14))
-    iter_count = [0]
-    colors = ['red', 'blue', 'green', 'orange', 'purple', 'cyan', 'magenta', 'yellow']
+    # the floors and stops are drawn once, frames only update the route artists and blit them
+    # the colony runs in a background thread, see visualize_ant_farm for iterations_per_frame
+    # matplotlib is imported here so the optimizer also runs on machines without it
+    import matplotlib.pyplot as plt
+    from optimizer_thread import OptimizerThread, animate
+    from route_artists import (RoutePanel, route_waypoints, set_footprints, set_legs, set_route,
+                               set_routes)
 
-    def update(frame):
-        if iter_count[0] >= iterations:
-            anim.event_source.stop()
-            return
-
-        result = farm.run_iteration_dual()
-        iter_count[0] += 1
-
-        # Panel 1: Current iteration paths
-        ax1.clear()
-        ax1.imshow(farm.obstacles, cmap='Greys', alpha=0.3)
-        ax1.set_title(f'Iteration {iter_count[0]}: All Routes', fontsize=12)
-
-        # plot people routes in blue
-        for route in result['people']:
-            if route:
-                ra = np.array(route)
-                ax1.plot(ra[:, 1], ra[:, 0], 'b-', alpha=0.2, linewidth=0.5, label='People' if 'People' not in ax1.get_legend_handles_labels()[1] else '')
-
-        # plot cart routes in orange
-        for route in result['carts']:
-            if route:
-                ra = np.array(route)
-                ax1.plot(ra[:, 1], ra[:, 0], 'orange', alpha=0.2, linewidth=0.5, label='Carts' if 'Carts' not in ax1.get_legend_handles_labels()[1] else '')
-
-        ax1.plot(farm.start[1], farm.start[0], 'go', markersize=12, label='Start')
-        for idx, e in enumerate(farm.ends):
-            ax1.plot(e[1], e[0], 'ro', markersize=10, label=f'Stop {idx+1}' if idx == 0 else '')
-        ax1.legend(fontsize=8)
-        ax1.grid(True, alpha=0.2)
-
-        # Panel 2: Best paths comparison
-        ax2.clear()
-        ax2.imshow(farm.obstacles, cmap='Greys', alpha=0.3)
-        ax2.set_title('Best Paths Comparison', fontsize=12)
-
-        if farm.best_route_people:
-            ba = np.array(farm.best_route_people)
-            ax2.plot(ba[:, 1], ba[:, 0], 'b-', linewidth=3,
-                    label=f'People: {farm.best_route_length_people:.0f} steps')
-
-        if farm.best_route_carts:
-            ba = np.array(farm.best_route_carts)
-            ax2.plot(ba[:, 1], ba[:, 0], 'orange', linewidth=3,
-                    label=f'Carts: {farm.best_route_length_carts:.0f} steps')
-            # show cart footprint at key positions
-            for i in [0, len(ba)//3, 2*len(ba)//3, -1]:
-                if i < len(ba):
-                    pos = ba[i]
-                    cart_rect = Rectangle((pos[1], pos[0]), farm.cart_size[1], farm.cart_size[0],
-                                        fill=False, edgecolor='yellow', linewidth=1, alpha=0.5)
-                    ax2.add_patch(cart_rect)
-
-        ax2.plot(farm.start[1], farm.start[0], 'go', markersize=12)
-        for idx, e in enumerate(farm.ends):
-            ax2.plot(e[1], e[0], 'ro', markersize=10)
-            ax2.text(e[1]+2, e[0]+2, str(idx+1), color='white', fontsize=10, fontweight='bold')
-        ax2.legend(fontsize=8)
-        ax2.grid(True, alpha=0.2)
-
-        # Panel 3: Pheromone heatmap for people
-        ax3.clear()
-        ax3.imshow(farm.obstacles, cmap='Greys', alpha=0.3)
-        ax3.set_title(f'People Route', fontsize=12)
-        if farm.best_route_people:
-            waypoints = farm.ends.copy()
-            if farm.return_to_start:
-                waypoints.append(farm.start)
-            segments = split_route_into_segments(farm.best_route_people, waypoints)
-
-            for seg_idx, segment in enumerate(segments):
-                if len(segment) > 1:
-                    seg_array = np.array(segment)
-                    color = colors[seg_idx % len(colors)]
-                    ax3.plot(seg_array[:, 1], seg_array[:, 0], color=color,
-                            linewidth=2, label=f'Seg {seg_idx+1}')
-        ax3.plot(farm.start[1], farm.start[0], 'go', markersize=12)
-        for idx, e in enumerate(farm.ends):
-            ax3.plot(e[1], e[0], 'ro', markersize=10)
-            ax3.text(e[1]+2, e[0]+2, str(idx+1), color='white', fontsize=10, fontweight='bold')
-        ax3.legend(fontsize=8)
-        ax3.grid(True, alpha=0.2)
-
-        # Panel 4: Cart route
-        ax4.clear()
-        ax4.imshow(farm.obstacles, cmap='Greys', alpha=0.3)
-        ax4.set_title(f'Cart Route', fontsize=12)
-        if farm.best_route_carts:
-            waypoints = farm.ends.copy()
-            if farm.return_to_start:
-                waypoints.append(farm.start)
-            segments = split_route_into_segments(farm.best_route_carts, waypoints)
-
-            for seg_idx, segment in enumerate(segments):
-                if len(segment) > 1:
-                    seg_array = np.array(segment)
-                    color = colors[seg_idx % len(colors)]
-                    ax4.plot(seg_array[:, 1], seg_array[:, 0], color=color,
-                            linewidth=2, label=f'Seg {seg_idx+1}')
-        ax4.plot(farm.start[1], farm.start[0], 'go', markersize=12)
-        for idx, e in enumerate(farm.ends):
-            ax4.plot(e[1], e[0], 'ro', markersize=10)
-            ax4.text(e[1]+2, e[0]+2, str(idx+1), color='white', fontsize=10, fontweight='bold')
-        ax4.legend(fontsize=8)
-        ax4.grid(True, alpha=0.2)
-
-        plt.tight_layout()
-
-    anim = animation.FuncAnimation(fig, update, frames=iterations,
-                                  interval=100, repeat=False)
-    plt.show()
+    fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(18, 14))
+    if farm.optimize_order:
+        # settle the visiting order first so the stop numbers drawn below stay right
+        farm.apply_visit_order()
+    waypoints = route_waypoints(farm.ends, farm.start, farm.return_to_start)
+
+    # Panel 1: Current iteration paths, people in blue and carts in orange
+    routes = RoutePanel(ax1, farm.obstacles, 'All Routes')
+    people_routes = routes.add_routes('b', alpha=0.2, linewidth=0.5, label='People')
+    cart_routes = routes.add_routes('orange', alpha=0.2, linewidth=0.5, label='Carts')
+    routes.draw_stops(farm.start, farm.ends, end_label=lambda idx: 'Stop 1' if idx == 0 else None)
+    routes.legend()
+
+    # Panel 2: Best paths comparison, with the cart footprint at key positions
+    compare = RoutePanel(ax2, farm.obstacles, 'Best Paths Comparison')
+    people_best = compare.add_route('b', 3, 'People')
+    cart_best = compare.add_route('orange', 3, 'Carts')
+    carts = compare.add_footprints(4, farm.cart_size)
+    compare.draw_stops(farm.start, farm.ends, offset=2, start_label=None)
+    compare.legend()
+
+    # Panel 3: People route
+    people = RoutePanel(ax3, farm.obstacles, 'People Route')
+    people_legs = people.add_legs(len(waypoints), linewidth=2, label='Seg')
+    people.draw_stops(farm.start, farm.ends, offset=2, start_label=None)
+    people.legend()
+
+    # Panel 4: Cart route
+    cart = RoutePanel(ax4, farm.obstacles, 'Cart Route')
+    cart_legs = cart.add_legs(len(waypoints), linewidth=2, label='Seg')
+    cart.draw_stops(farm.start, farm.ends, offset=2, start_label=None)
+    cart.legend()
+
+    artists = routes.artists + compare.artists + people.artists + cart.artists
+    plt.tight_layout()
+
+    # runs in the optimizer thread after each iteration, copies what a frame shows
+    def capture(result):
+        return {'iteration': farm.iteration,
+                'routes': {k: list(v) for k, v in result.items()},
+                'people': farm.best_route_people, 'carts': farm.best_route_carts,
+                'people_length': farm.best_route_length_people,
+                'carts_length': farm.best_route_length_carts}
+
+    def draw(snapshot):
+        routes.set_status(f"Iteration {snapshot['iteration']}")
+        set_routes(people_routes, snapshot['routes']['people'])
+        set_routes(cart_routes, snapshot['routes']['carts'])
+
+        compare.set_status(f"People: {snapshot['people_length']:.0f} steps, "
+                           f"Carts: {snapshot['carts_length']:.0f} steps")
+        set_route(people_best, snapshot['people'])
+        set_route(cart_best, snapshot['carts'])
+        set_footprints(carts, snapshot['carts'])
+
+        set_legs(people_legs, snapshot['people'], waypoints)
+        set_legs(cart_legs, snapshot['carts'], waypoints)
+
+    worker = OptimizerThread(farm, iterations, capture, iterations_per_frame)
+    animate(fig, artists, worker, draw, interval)
 
     return farm
 
-
 def print_dual_analysis(farm):
     # Print comparison analysis
     print("\nDual Pathfinding Analysis")
+    if farm.stop_reason:
+        print(f"Stopped early: {farm.stop_reason}")
 
-    print(f"\nPeople (no size constraints):")
+    print("\nPeople (no size constraints):")
     if farm.best_route_people:
         print(f"Best route: {farm.best_route_length_people:.0f} steps")
         print(f"Distance: ~{farm.best_route_length_people * 0.5:.1f} ft")
@@ -486,7 +566,7 @@ def print_dual_analysis(farm):
     if farm.best_route_people and farm.best_route_carts:
         diff = farm.best_route_length_carts - farm.best_route_length_people
         pct = (diff / farm.best_route_length_people) * 100
-        print(f"\nDifference:")
+        print("\nDifference:")
         print(f"Carts require {diff:.0f} extra steps ({pct:.1f}% longer)")
         print(f"Extra distance: ~{diff * 0.5:.1f} ft")
 
@@ -497,14 +577,31 @@ if __name__ == "__main__":
     # Higher values (100-200) = slower but more optimized
     ITERATIONS = 150
 
+    # File that keeps best legs between runs so legs already solved skip the ants, e.g.
+    # 'leg_cache.sqlite'. None to start from scratch every run
+    LEG_CACHE = None
+
+    # File progress is saved to when the window is closed and picked up from on the next run,
+    # e.g. 'dual_checkpoint.npz'. Delete it after changing the layout. With a leg cache as well,
+    # the legs restored from the checkpoint win and the cache only fills legs it has no route for
+    CHECKPOINT = None
+
     print("Dual Pathfinding: People vs Carts")
 
     farm = create_warehouse_dual(scale=2)
+    farm.convergence = ConvergenceMonitor(patience=25)
+    if LEG_CACHE:
+        farm.leg_cache = LegCache(LEG_CACHE)
+    if CHECKPOINT and os.path.exists(CHECKPOINT):
+        farm.load_checkpoint(CHECKPOINT)
+        print(f"Resuming from {CHECKPOINT} after {farm.iteration} iterations")
 
     print("\nOptimizing paths for both people and carts...")
     print("Blue = People paths | Orange = Cart paths\n")
 
     farm = visualize_dual_paths(farm, iterations=ITERATIONS)
+    if CHECKPOINT:
+        farm.save_checkpoint(CHECKPOINT)
 
     print_dual_analysis(farm)
 
@@ -0,0 +1,233 @@
+# Benchmark suite: runs the shipped layouts headlessly with fixed seeds and writes JSON
+#
+# usage examples:
+#   python -m benchmark --output bench_new.json
+#   python -m benchmark --layouts template warehouse --iterations 20 --engine batch
+#   python -m benchmark --output bench_new.json --compare bench_old.json
+#
+# Every layout runs in its own process so the memory peak belongs to that layout alone.
+# Save one file per commit and pass the older one to --compare to see what a change did.
+
+import argparse
+import json
+import multiprocessing
+import platform
+import queue as queue_module
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+from ant_farm import Profiler
+from headless import is_fleet, json_length, load_template
+
+try:
+    import resource
+except ImportError: # not available on windows, peak memory is reported as null there
+    resource = None
+
+
+# templates benchmarked by default, names as in headless.TEMPLATES
+LAYOUTS = ['template', 'production', 'warehouse', 'dual', 'dual-template']
+
+
+# returns peak resident memory of this process in MB, None where it cannot be read
+def peak_memory_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    return round(peak / (2**20 if sys.platform == 'darwin' else 2**10), 1)
+
+
+# returns commit hash of the checkout, None outside a git repository
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                             text=True, timeout=10)
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+
+# runs one layout for iterations with a fixed seed, returns its metrics as a json dict
+def bench_layout(name, iterations, seed=0, engine=None, ants=None):
+    farm = load_template(name, quiet=True)
+    if engine:
+        farm.engine = engine
+    if ants:
+        farm.num_ants = ants
+    farm.rng = np.random.default_rng(seed)
+    random.seed(seed)
+    farm.profiler = Profiler()
+
+    started = time.perf_counter()
+    optimal = farm.optimal_length()
+    exact_seconds = time.perf_counter() - started
+
+    iteration_seconds = []
+    history = []
+    try:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            farm.run_iteration()
+            iteration_seconds.append(time.perf_counter() - started)
+            history.append(json_length(farm.current_best_length()))
+    finally:
+        farm.close_pool()
+
+    elapsed = sum(iteration_seconds)
+    profile = farm.profiler.summary()
+    gaps = [None if length is None or optimal in (0, float('inf')) else round(length / optimal - 1, 4)
+            for length in history]
+    return {
+        'grid_size': [int(v) for v in farm.grid_size],
+        'classes': len(farm.vehicles) if is_fleet(farm) else 1,
+        'num_ants': farm.num_ants,
+        'engine': farm.engine,
+        'iterations': len(history),
+        'elapsed_seconds': round(elapsed, 4),
+        'seconds_per_iteration': round(elapsed / len(history), 4) if history else None,
+        'median_seconds_per_iteration': round(float(np.median(iteration_seconds)), 4) if history else None,
+        'iteration_seconds': [round(s, 4) for s in iteration_seconds],
+        'ants_per_second': round(profile['ants'] / elapsed, 2) if elapsed > 0 else None,
+        'steps_per_second': round(profile['steps'] / elapsed, 2) if elapsed > 0 else None,
+        'success_rate': round(profile['success_rate'], 4) if profile['ants'] else None,
+        'phase_seconds': {name: round(spent, 4) for name, spent in profile['phases'].items()},
+        'exact_seconds': round(exact_seconds, 4),
+        'optimal_length': json_length(optimal),
+        'best_length': history[-1] if history else None,
+        'best_length_history': history,
+        'gap_history': gaps,
+        'final_gap': gaps[-1] if gaps else None,
+        'peak_memory_mb': peak_memory_mb(),
+    }
+
+
+# process entry point, sends the metrics (or the error) of one layout back through queue
+def _bench_child(queue, name, iterations, seed, engine, ants):
+    try:
+        queue.put(bench_layout(name, iterations, seed, engine, ants))
+    except Exception as exc:
+        queue.put({'error': f'{type(exc).__name__}: {exc}'})
+
+
+# runs bench_layout in a fresh process, so memory peaks and caches do not carry over
+# a child that dies without a result (killed for memory, crashed) or runs longer than timeout
+# seconds gives an error entry instead of blocking the whole benchmark
+def bench_isolated(name, iterations, seed=0, engine=None, ants=None, timeout=None):
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    child = context.Process(target=_bench_child, args=(queue, name, iterations, seed, engine, ants))
+    child.start()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    result = None
+    while result is None:
+        try:
+            result = queue.get(timeout=1)
+        except queue_module.Empty:
+            if not child.is_alive():
+                # the child may have put its result just before it exited
+                try:
+                    result = queue.get(timeout=1)
+                except queue_module.Empty:
+                    result = {'error': f'benchmark process exited with code {child.exitcode} '
+                                       f'without a result'}
+            elif deadline is not None and time.monotonic() > deadline:
+                child.terminate()
+                result = {'error': f'benchmark process took longer than {timeout}s, stopped'}
+    child.join()
+    return result
+
+
+# runs every layout in layouts, returns the full benchmark report
+# timeout limits the seconds of each layout, isolated runs only
+def run_benchmark(layouts=LAYOUTS, iterations=10, seed=0, engine=None, ants=None, isolate=True,
+                  log=None, timeout=None):
+    report = {
+        'commit': git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.platform(),
+        'settings': {'iterations': iterations, 'seed': seed, 'engine': engine, 'ants': ants},
+        'layouts': {},
+    }
+    for name in layouts:
+        if log:
+            log(f"{name}: running {iterations} iterations")
+        if isolate:
+            result = bench_isolated(name, iterations, seed, engine, ants, timeout)
+        else:
+            result = bench_layout(name, iterations, seed, engine, ants)
+        report['layouts'][name] = result
+        if log:
+            log(f"{name}: " + (result['error'] if 'error' in result else
+                               f"{result['seconds_per_iteration']}s/iteration, "
+                               f"{result['ants_per_second']} ants/s, best {result['best_length']} "
+                               f"of optimum {result['optimal_length']}"))
+    return report
+
+
+# returns lines comparing two reports layout by layout, old values first
+def compare_reports(old, new):
+    lines = [f"{'layout':<15}{'s/iteration':>24}{'ants/s':>24}{'final gap':>20}",
+             f"{'':<15}{old.get('commit') or '?':>12}{new.get('commit') or '?':>12}"]
+    for name, result in new['layouts'].items():
+        before = old['layouts'].get(name)
+        if before is None or 'error' in before or 'error' in result:
+            lines.append(f"{name:<15}  not comparable")
+            continue
+        cells = []
+        for key, width in (('seconds_per_iteration', 12), ('ants_per_second', 12), ('final_gap', 10)):
+            cells.append(f"{str(before[key]):>{width}}{str(result[key]):>{width}}")
+        speedup = ''
+        if before['seconds_per_iteration'] and result['seconds_per_iteration']:
+            speedup = f"  x{before['seconds_per_iteration'] / result['seconds_per_iteration']:.2f} speed"
+        lines.append(f"{name:<15}" + ''.join(cells) + speedup)
+    return lines
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmark',
+        description='Benchmark the optimizer on the shipped layouts and write the metrics as JSON.')
+    parser.add_argument('--layouts', nargs='+', choices=LAYOUTS, default=LAYOUTS,
+                        help='layouts to run (default all)')
+    parser.add_argument('--iterations', type=int, default=10, help='iterations per layout (default 10)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default 0)')
+    parser.add_argument('--engine', choices=['serial', 'batch', 'process'],
+                        help='override the engine the layouts ship with')
+    parser.add_argument('--ants', type=int, help='override number of ants per iteration')
+    parser.add_argument('--output', default='benchmark.json', help='json output file (default benchmark.json)')
+    parser.add_argument('--compare', metavar='FILE', help='print a comparison with an earlier report')
+    parser.add_argument('--no-isolate', action='store_true',
+                        help='run all layouts in this process (faster start, shared memory peak)')
+    parser.add_argument('--timeout', type=float, metavar='SECONDS',
+                        help='stop a layout that runs longer than SECONDS and record an error')
+    parser.add_argument('--quiet', action='store_true', help='no progress output on stderr')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    log = None if args.quiet else (lambda msg: print(msg, file=sys.stderr))
+
+    report = run_benchmark(args.layouts, args.iterations, args.seed, args.engine, args.ants,
+                           isolate=not args.no_isolate, log=log, timeout=args.timeout)
+    with open(args.output, 'w') as fh:
+        fh.write(json.dumps(report, indent=2) + '\n')
+    if log:
+        log(f"results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as fh:
+            old = json.load(fh)
+        print('\n'.join(compare_reports(old, report)))
+
+    return 1 if any('error' in result for result in report['layouts'].values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,7 @@
 # Cart route visualization for 3ft x 5ft warehouse carts
 
-import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle
 from ant_farm import AntFarm, visualize_ant_farm, split_route_into_segments
+from leg_cache import LegCache
 
 
 def create_warehouse_with_carts(scale=2):
@@ -12,7 +10,7 @@ def create_warehouse_with_carts(scale=2):
     cart_h = 3 * scale
     cart_w = 5 * scale
 
-    print(f"\nWarehouse layout:")
+    print("\nWarehouse layout:")
     print(f"Grid size: {h} x {w} (each unit = {12/scale} inches)")
     print(f"Cart size: {cart_h} x {cart_w} units (3ft x 5ft)")
     print(f"Actual warehouse: {h/(2*scale)}ft x {w/(2*scale)}ft")
@@ -43,83 +41,62 @@ def create_warehouse_with_carts(scale=2):
     return farm
 
 
-def visualize_cart_routes(farm, iterations=150):
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(18, 8))
-    iter_count = [0]
-    colors = ['red', 'blue', 'green', 'orange', 'purple', 'cyan', 'magenta', 'yellow']
-
-    def update(frame):
-        if iter_count[0] >= iterations:
-            anim.event_source.stop()
-            return
-
-        result = farm.run_iteration()
-        iter_count[0] += 1
-
-        # Left panel: Current routes being tested
-        ax1.clear()
-        ax1.imshow(farm.obstacles, cmap='Greys', alpha=0.3)
-        ax1.set_title(f'Iteration {iter_count[0]}: Cart Routes Being Tested', fontsize=12)
-        for route in result:
-            if route:
-                ra = np.array(route)
-                ax1.plot(ra[:, 1], ra[:, 0], 'b-', alpha=0.3, linewidth=1)
-        ax1.plot(farm.start[1], farm.start[0], 'go', markersize=12, label='Start')
-        for idx, e in enumerate(farm.ends):
-            ax1.plot(e[1], e[0], 'ro', markersize=10, label=f'Stop {idx+1}')
-        cart_rect = Rectangle((farm.start[1], farm.start[0]), farm.cart_size[1], farm.cart_size[0],
-                              fill=False, edgecolor='green', linewidth=2)
-        ax1.add_patch(cart_rect)
-        ax1.legend(fontsize=8)
-        ax1.grid(True, alpha=0.2)
-
-        # Right panel: Best route found
-        ax2.clear()
-        ax2.imshow(farm.obstacles, cmap='Greys', alpha=0.3)
-        ax2.set_title(f'Best Route Found: {farm.best_route_length:.0f} steps (~{farm.best_route_length * 0.5:.1f}ft)', fontsize=12)
-
-        if farm.best_route:
-            # split route into colored segments
-            waypoints = farm.ends.copy()
-            if farm.return_to_start:
-                waypoints.append(farm.start)
-            segments = split_route_into_segments(farm.best_route, waypoints)
-
-            for seg_idx, segment in enumerate(segments):
-                if len(segment) > 1:
-                    seg_array = np.array(segment)
-                    color = colors[seg_idx % len(colors)]
-                    ax2.plot(seg_array[:, 1], seg_array[:, 0], color=color,
-                            linewidth=3, label=f'Segment {seg_idx+1}')
-
-            # show cart footprint at key positions
-            ba = np.array(farm.best_route)
-            for i in [0, len(ba)//3, 2*len(ba)//3, -1]:
-                if i < len(ba):
-                    pos = ba[i]
-                    cart_rect = Rectangle((pos[1], pos[0]), farm.cart_size[1], farm.cart_size[0],
-                                         fill=False, edgecolor='yellow', linewidth=1, alpha=0.5)
-                    ax2.add_patch(cart_rect)
-
-        ax2.plot(farm.start[1], farm.start[0], 'go', markersize=12, label='Start')
-        for idx, e in enumerate(farm.ends):
-            ax2.plot(e[1], e[0], 'ro', markersize=10, label=f'Stop {idx+1}' if idx == 0 else '')
-            ax2.text(e[1]+2, e[0]+2, str(idx+1), color='white', fontsize=10, fontweight='bold')
-        if farm.return_to_start:
-            ax2.text(farm.start[1]+2, farm.start[0]+2, 'S/E', color='white', fontsize=10, fontweight='bold')
-        ax2.legend(fontsize=8)
-        ax2.grid(True, alpha=0.2)
-
-        plt.tight_layout()
+# draws the floor once and blits only the changing route artists each frame
+# the colony runs in a background thread, see visualize_ant_farm for iterations_per_frame
+def visualize_cart_routes(farm, iterations=150, iterations_per_frame=None, interval=50):
+    # matplotlib is imported here so the optimizer also runs on machines without it
+    import matplotlib.pyplot as plt
+    from optimizer_thread import OptimizerThread, animate
+    from route_artists import RoutePanel, route_waypoints, set_footprints, set_legs, set_routes
 
-    anim = plt.matplotlib.animation.FuncAnimation(fig, update, frames=iterations, interval=100, repeat=False)
-    plt.show()
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(18, 8))
+    if farm.optimize_order:
+        # settle the visiting order first so the stop numbers drawn below stay right
+        farm.apply_visit_order()
+
+    # Left panel: Current routes being tested
+    tested = RoutePanel(ax1, farm.obstacles, 'Cart Routes Being Tested')
+    candidates = tested.add_routes('b', alpha=0.3, linewidth=1)
+    tested.draw_stops(farm.start, farm.ends, end_label=lambda idx: f'Stop {idx+1}')
+    start_cart = tested.add_footprints(1, farm.cart_size, color='green', linewidth=2, alpha=1)
+    set_footprints(start_cart, [farm.start])
+    tested.legend()
+
+    # Right panel: Best route found, split into colored segments with the cart footprint at key positions
+    best = RoutePanel(ax2, farm.obstacles, 'Best Route Found')
+    waypoints = route_waypoints(farm.ends, farm.start, farm.return_to_start)
+    legs = best.add_legs(len(waypoints))
+    carts = best.add_footprints(4, farm.cart_size)
+    best.draw_stops(farm.start, farm.ends, offset=2, return_to_start=farm.return_to_start,
+                    end_label=lambda idx: 'Stop 1' if idx == 0 else None)
+    best.legend()
+
+    artists = tested.artists + best.artists
+    plt.tight_layout()
+
+    # runs in the optimizer thread after each iteration, copies what a frame shows
+    def capture(result):
+        return {'iteration': farm.iteration, 'candidates': list(result),
+                'best_route': farm.best_route, 'best_length': farm.best_route_length}
+
+    def draw(snapshot):
+        tested.set_status(f"Iteration {snapshot['iteration']}")
+        set_routes(candidates, snapshot['candidates'])
+
+        length = snapshot['best_length']
+        best.set_status(f'{length:.0f} steps (~{length * 0.5:.1f}ft)')
+        set_legs(legs, snapshot['best_route'], waypoints)
+        set_footprints(carts, snapshot['best_route'])
+
+    worker = OptimizerThread(farm, iterations, capture, iterations_per_frame)
+    animate(fig, artists, worker, draw, interval)
 
     return farm
 
-
 def print_route_summary(farm):
     print("\nRoute summary")
+    if farm.stop_reason:
+        print(f"Stopped early: {farm.stop_reason}")
     print(f"Cart: 3ft x 5ft ({farm.cart_size[0]}x{farm.cart_size[1]} units)")
     print(f"Routes tested: {len(farm.all_routes)}")
 
@@ -144,15 +121,23 @@ if __name__ == "__main__":
     # Higher values (100-200) = slower but more optimized
     ITERATIONS = 10
 
+    # File that keeps best legs between runs so legs already solved skip the ants, e.g.
+    # 'leg_cache.sqlite'. None to start from scratch every run
+    LEG_CACHE = None
+
     print("Warehouse cart route visualization")
     print("3ft x 5ft carts\n")
 
     farm = create_warehouse_with_carts(scale=2)
+    if LEG_CACHE:
+        farm.leg_cache = LegCache(LEG_CACHE)
 
     print("Finding optimal routes\n")
 
     farm = visualize_cart_routes(farm, iterations=ITERATIONS)
 
     print_route_summary(farm)
+    if farm.leg_cache is not None:
+        print(f"\nLeg cache: {farm.leg_cache.hits} legs reused, {len(farm.leg_cache)} stored")
 
     print("\nComplete")
@@ -1,8 +1,8 @@
 # custom layout examples for ant colony optimization
 
 import numpy as np
-import matplotlib.pyplot as plt
 from ant_farm import AntFarm, visualize_ant_farm
+from leg_cache import LegCache
 
 
 # creates layout from 2d array where 0 = free, 1 = obstacle, 2 = start, 3 = ends
@@ -108,6 +108,9 @@ def create_from_csv_file(fn='floor_layout.csv', sequential=True, return_to_start
 
 # builds layout interactively by clicking on grid positions
 def create_interactive_layout():
+    # matplotlib is imported here so the optimizer also runs on machines without it
+    import matplotlib.pyplot as plt
+
     print("\n4: Interactive Builder")
     print("click to add obstacles")
     print("press 't' for start, 'e' for end, numbers '3-9' for additional ends")
@@ -175,6 +178,10 @@ if __name__ == "__main__":
     # Set number of iterations here
     ITERATIONS = 200
 
+    # File that keeps best legs between runs so legs already solved skip the ants, e.g.
+    # 'leg_cache.sqlite'. Only used segment by segment, None to start from scratch every run
+    LEG_CACHE = None
+
     print("custom layout examples")
     print("\nchoose a method:")
     print("1. array layout")
@@ -194,6 +201,12 @@ if __name__ == "__main__":
     else:
         f = create_my_production_floor()
 
+    if LEG_CACHE:
+        if f.sequential and f.segment_by_segment:
+            f.leg_cache = LegCache(LEG_CACHE)
+        else:
+            print(f"warning: leg cache {LEG_CACHE} only works segment by segment, running without it")
+
     print("\nrunning optimization")
     if f.sequential:
         print("sequential mode: visiting endpoints in order")
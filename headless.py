@@ -0,0 +1,380 @@
+# Headless batch runner: optimizes a layout without plotting and writes results as JSON
+#
+# usage examples:
+#   python -m headless --template warehouse --iterations 150 --output routes.json
+#   python -m headless --layout floor_layout.csv --return-to-start --engine batch --seed 1
+#
+# matplotlib is never imported, so this runs on servers and from cron.
+
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+from ant_farm import AntFarm, ConvergenceMonitor, Profiler, RouteWriter
+from leg_cache import LegCache
+from recording import SnapshotRecorder
+from tiled_pheromone import TiledPheromone
+
+
+# template layouts that can be run by name, as (module, factory function)
+TEMPLATES = {
+    'template': ('ant_farm', 'create_template_layout'),
+    'array': ('custom_layout', 'create_custom_array_layout'),
+    'production': ('custom_layout', 'create_my_production_floor'),
+    'warehouse': ('cart_visualization', 'create_warehouse_with_carts'),
+    'dual': ('ants_and_carts', 'create_warehouse_dual'),
+    'dual-template': ('ants_and_carts_templates', 'create_template_dual'),
+    'fleet': ('ants_and_carts', 'create_warehouse_fleet'),
+}
+
+
+# builds a farm from one of the named template functions
+def load_template(name, quiet=False):
+    module_name, func_name = TEMPLATES[name]
+    module = importlib.import_module(module_name)
+    # templates print layout details, keep them off stdout so JSON output stays clean
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull if quiet else sys.stderr):
+            return getattr(module, func_name)()
+
+
+# builds a farm from a layout csv (0 = free, 1 = obstacle, 2 = start, 3-9 = ends)
+def load_csv(fn, cart_size=None, sequential=True, return_to_start=False):
+    layout = np.loadtxt(fn, delimiter=',', dtype=int)
+    farm = AntFarm(grid_size=layout.shape, cart_size=cart_size)
+    farm.sequential = sequential
+    farm.load_custom_layout(layout)
+    farm.return_to_start = return_to_start
+    return farm
+
+
+# True for farms that optimize several vehicle classes side by side
+def is_fleet(farm):
+    return hasattr(farm, 'vehicles')
+
+
+# streams every tested route to json-lines files, fleets get one file per vehicle class
+def attach_route_log(farm, fn):
+    if not is_fleet(farm):
+        farm.all_routes = RouteWriter(fn)
+        return [farm.all_routes]
+    root, ext = os.path.splitext(fn)
+    for name in farm.vehicles:
+        farm.all_routes[name] = RouteWriter(f'{root}_{name}{ext}')
+    return list(farm.all_routes.values())
+
+
+# converts lengths to json numbers, inf becomes null
+def json_length(length):
+    return None if length == float('inf') else int(length)
+
+
+# converts a route to a json list of [y, x]
+def json_route(route):
+    return np.asarray(route).tolist() if route else None
+
+
+# converts a position to a json [y, x]
+def json_pos(pos):
+    return [int(pos[0]), int(pos[1])]
+
+
+# footprint of every vehicle class of a fleet farm as json, None for people
+def json_footprints(farm):
+    return {name: [int(v) for v in footprint] if footprint else None
+            for name, footprint in farm.vehicles.items()}
+
+
+# collects best routes of a single-class farm
+def summarize_farm(farm):
+    if not farm.sequential:
+        return {
+            'mode': 'parallel',
+            'paths': [{'end': json_pos(e),
+                       'length': json_length(farm.best_path_lengths[e]),
+                       'path': json_route(farm.best_paths[e])} for e in farm.ends],
+            'routes_tested': len(farm.all_routes),
+        }
+
+    summary = {
+        'mode': 'segment_by_segment' if farm.segment_by_segment else 'sequential',
+        'best_route_length': json_length(farm.best_route_length),
+        'best_route': json_route(farm.best_route),
+        'routes_tested': len(farm.all_routes),
+    }
+    if farm.segment_by_segment:
+        summary['segments'] = [{'length': json_length(length), 'path': json_route(seg)}
+                               for seg, length in zip(farm.best_segments, farm.best_segment_lengths)]
+    return summary
+
+
+# collects best routes of every vehicle class of a fleet farm
+def summarize_fleet(farm):
+    summary = {'mode': 'segment_by_segment' if farm.segment_by_segment else 'sequential'}
+    for name, footprint in farm.vehicles.items():
+        summary[name] = {
+            'footprint': [int(v) for v in footprint] if footprint else None,
+            'best_route_length': json_length(farm.best_route_lengths[name]),
+            'best_route': json_route(farm.best_routes[name]),
+            'routes_tested': len(farm.all_routes[name]),
+        }
+        if farm.segment_by_segment:
+            segments = farm.best_segments[name]
+            lengths = farm.best_segment_lengths[name]
+            summary[name]['segments'] = [{'length': json_length(length), 'path': json_route(seg)}
+                                         for seg, length in zip(segments, lengths)]
+    return summary
+
+
+# runs up to iterations as fast as possible and returns a json-ready result dictionary
+# stops early when farm.convergence says the routes have settled or after time_limit seconds
+# coarse is the history filled by run_coarse_to_fine, its fine iterations lead best_length_history
+def run_headless(farm, iterations, log=None, time_limit=None, recorder=None, coarse=None):
+    refined = [json_length(length) for length in coarse['fine']] if coarse else []
+    history = []
+    started = time.perf_counter()
+
+    for i in range(iterations):
+        if time_limit is not None and time.perf_counter() - started >= time_limit:
+            farm.stop_reason = f"time limit of {time_limit:g}s reached"
+            if log:
+                log(f"stopped early: {farm.stop_reason}")
+            break
+        farm.run_iteration()
+        history.append(json_length(farm.current_best_length()))
+        if recorder is not None:
+            recorder.capture(farm)
+        if log:
+            log(f"iteration {i + 1}/{iterations}: best {history[-1]}")
+        if farm.check_convergence():
+            if log:
+                log(f"stopped early: {farm.stop_reason}")
+            break
+
+    elapsed = time.perf_counter() - started
+    result = {
+        'grid_size': [int(v) for v in farm.grid_size],
+        'start': json_pos(farm.start),
+        'ends': [json_pos(e) for e in farm.ends],
+        'return_to_start': farm.return_to_start,
+        'num_ants': farm.num_ants,
+        'engine': farm.engine,
+        'heuristic': farm.heuristic,
+        'iterations': iterations,
+        'iterations_run': len(history),
+        'iterations_total': farm.iteration,
+        'stop_reason': farm.stop_reason,
+        'elapsed_seconds': round(elapsed, 4),
+        'iterations_per_second': round(len(history) / elapsed, 4) if elapsed > 0 else None,
+        'best_length_history': refined + history,
+        'optimal_length': json_length(farm.optimal_length()),
+    }
+    # a fleet's cart_size is unused, each class has its own footprint
+    if is_fleet(farm):
+        result['footprints'] = json_footprints(farm)
+    else:
+        result['cart_size'] = [int(v) for v in farm.cart_size]
+    if coarse:
+        result['coarse_to_fine'] = {
+            'coarse_best_length_history': [json_length(length) for length in coarse['coarse']],
+            'fine_iterations_run': len(refined),
+        }
+    if farm.leg_cache is not None:
+        result['leg_cache_hits'] = farm.leg_cache.hits
+    result.update(summarize_fleet(farm) if is_fleet(farm) else summarize_farm(farm))
+    return result
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m headless',
+        description='Optimize a floor layout without plotting and write routes as JSON.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--layout', help='layout csv (0 free, 1 obstacle, 2 start, 3-9 ends)')
+    source.add_argument('--template', choices=sorted(TEMPLATES), help='run a built-in layout')
+
+    parser.add_argument('--iterations', type=int, default=100, help='iterations to run (default 100)')
+    parser.add_argument('--output', default='-', help='json output file, - for stdout (default)')
+    parser.add_argument('--ants', type=int, help='override number of ants per iteration')
+    parser.add_argument('--engine', choices=['serial', 'batch', 'process'], help='ant engine')
+    parser.add_argument('--workers', type=int, help='worker processes for --engine process')
+    parser.add_argument('--heuristic', choices=['euclidean', 'geodesic'], help='distance heuristic')
+    parser.add_argument('--seed', type=int, help='random seed for repeatable runs')
+    parser.add_argument('--quiet', action='store_true', help='no progress output on stderr')
+    parser.add_argument('--profile', action='store_true',
+                        help='time the phases of each iteration and count ants, report on stderr')
+    parser.add_argument('--profile-detail', action='store_true',
+                        help='like --profile and also split walking by function (slower)')
+    parser.add_argument('--route-log', metavar='FILE',
+                        help='stream every tested route to FILE as json lines')
+    parser.add_argument('--checkpoint', metavar='FILE',
+                        help='resume from FILE (.npz) if it exists and save progress there when done')
+    parser.add_argument('--warm-start', metavar='FILE',
+                        help='start from the pheromone field saved in checkpoint FILE')
+    parser.add_argument('--time-limit', type=float, metavar='SECONDS',
+                        help='stop starting new iterations after this many seconds')
+    parser.add_argument('--float32', action='store_true',
+                        help='store pheromone and heuristic grids as float32 (half the memory)')
+    parser.add_argument('--pheromone-tile', type=int, metavar='N',
+                        help='store pheromone in N x N tiles allocated where ants go (large sparse floors '
+                             'only, slower than the dense grid otherwise)')
+    parser.add_argument('--record', metavar='FILE',
+                        help='save a snapshot of every iteration to FILE, render it with python -m recording')
+    parser.add_argument('--record-routes', type=int, default=20, metavar='N',
+                        help='walked routes kept per class and snapshot (default 20)')
+    parser.add_argument('--record-pheromone', action='store_true',
+                        help='also record the pheromone grids')
+    parser.add_argument('--leg-cache', metavar='FILE',
+                        help='reuse best legs stored in FILE by earlier runs (segment by segment)')
+
+    parser.add_argument('--optimize-order', action='store_true',
+                        help='visit the stops in the shortest order instead of the given one')
+    parser.add_argument('--exact', action='store_true',
+                        help='write exact shortest routes instead of running the colony')
+    parser.add_argument('--seed-exact', action='store_true',
+                        help='start the colony with pheromone laid along the exact shortest routes')
+
+    coarse_opts = parser.add_argument_group('coarse to fine')
+    coarse_opts.add_argument('--coarse', type=int, metavar='FACTOR',
+                             help='first solve the floor shrunk by FACTOR, '
+                                  'then refine around the coarse routes')
+    coarse_opts.add_argument('--coarse-iterations', type=int, default=50,
+                             help='iterations on the shrunk floor (default 50)')
+    coarse_opts.add_argument('--fine-iterations', type=int, default=20,
+                             help='refining iterations around the coarse routes (default 20), '
+                                  '--iterations more follow on the whole floor')
+
+    stop_opts = parser.add_argument_group('early stopping')
+    stop_opts.add_argument('--patience', type=int,
+                           help='stop after this many iterations without a shorter route')
+    stop_opts.add_argument('--min-entropy', type=float,
+                           help='stop once pheromone entropy (0-1) over visited cells falls below this')
+    stop_opts.add_argument('--min-diversity', type=float,
+                           help='stop once ant routes overlap so much that their diversity (0-1) falls below this')
+
+    csv_opts = parser.add_argument_group('csv layout options')
+    csv_opts.add_argument('--cart-size', type=int, nargs=2, metavar=('H', 'W'),
+                          help='cart footprint in grid units')
+    csv_opts.add_argument('--parallel', action='store_true',
+                          help='independent paths to each endpoint instead of one ordered route')
+    csv_opts.add_argument('--return-to-start', action='store_true', help='route back to the start')
+    csv_opts.add_argument('--segment-by-segment', action='store_true',
+                          help='optimize each leg of the route independently')
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.layout:
+        farm = load_csv(args.layout, cart_size=args.cart_size, sequential=not args.parallel,
+                        return_to_start=args.return_to_start)
+        farm.segment_by_segment = args.segment_by_segment
+    else:
+        farm = load_template(args.template, quiet=args.quiet)
+
+    if args.ants:
+        farm.num_ants = args.ants
+    if args.engine:
+        farm.engine = args.engine
+    if args.workers:
+        farm.workers = args.workers
+    if args.heuristic:
+        farm.heuristic = args.heuristic
+    if args.seed is not None:
+        farm.rng = np.random.default_rng(args.seed)
+        random.seed(args.seed)
+    if args.patience or args.min_entropy is not None or args.min_diversity is not None:
+        farm.convergence = ConvergenceMonitor(patience=args.patience, min_entropy=args.min_entropy,
+                                              min_diversity=args.min_diversity)
+
+    if args.float32:
+        farm.set_dtype(np.float32)
+    if args.pheromone_tile:
+        if is_fleet(farm):
+            parser.error('--pheromone-tile works for single class layouts only')
+        farm.pheromone = TiledPheromone.from_dense(farm.pheromone, tile=args.pheromone_tile)
+    if args.warm_start:
+        farm.load_checkpoint(args.warm_start, warm_start=True)
+    if args.checkpoint and os.path.exists(args.checkpoint):
+        farm.load_checkpoint(args.checkpoint)
+    if args.leg_cache:
+        if farm.segment_by_segment and (is_fleet(farm) or farm.sequential):
+            farm.leg_cache = LegCache(args.leg_cache)
+        else:
+            print(f"warning: --leg-cache only works segment by segment, running without {args.leg_cache}",
+                  file=sys.stderr)
+    if args.optimize_order:
+        farm.optimize_order = True
+        farm.apply_visit_order()
+
+    iterations = args.iterations
+    if args.exact:
+        farm.solve_exact()
+        iterations = 0
+    elif args.seed_exact:
+        farm.seed_pheromone_exact()
+
+    sinks = attach_route_log(farm, args.route_log) if args.route_log else []
+    recorder = None
+    if args.record:
+        recorder = SnapshotRecorder(args.record, sample_routes=args.record_routes,
+                                    pheromone=args.record_pheromone, seed=args.seed or 0)
+        sinks.append(recorder)
+    if args.profile or args.profile_detail:
+        farm.profiler = Profiler(detail=args.profile_detail)
+
+    log = None if args.quiet else (lambda msg: print(msg, file=sys.stderr))
+    estimate = farm.memory_estimate()
+    if log:
+        parts = ', '.join(f"{name} {size / 2**20:.1f}" for name, size in estimate.items()
+                          if name != 'total' and size)
+        log(f"estimated memory {estimate['total'] / 2**20:.1f} MB ({parts})")
+    coarse = None
+    try:
+        if args.coarse and not args.exact:
+            coarse = {}
+            farm.run_coarse_to_fine(args.coarse, args.coarse_iterations, args.fine_iterations,
+                                    log=log, history=coarse)
+        result = run_headless(farm, iterations, log=log, time_limit=args.time_limit,
+                              recorder=recorder, coarse=coarse)
+        if args.checkpoint:
+            farm.save_checkpoint(args.checkpoint)
+    finally:
+        farm.close_pool()
+        if farm.leg_cache is not None:
+            farm.leg_cache.close()
+        for sink in sinks:
+            sink.close()
+    result['layout'] = args.layout if args.layout else args.template
+    result['dtype'] = farm.dtype.name
+    if recorder is not None:
+        result['recording'] = {'file': args.record, 'snapshots': recorder.frames}
+    result['memory_estimate_bytes'] = estimate
+    if farm.profiler is not None:
+        result['profile'] = farm.profiler.summary()
+        if log:
+            log(farm.profiler.report())
+
+    text = json.dumps(result, indent=2)
+    if args.output == '-':
+        print(text)
+    else:
+        with open(args.output, 'w') as fh:
+            fh.write(text + '\n')
+        if log:
+            log(f"results written to {args.output}")
+
+    # non-zero exit lets cron jobs notice when no complete route was found
+    return 0 if farm.current_best_length() != float('inf') else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+# On-disk cache of the best path found for each leg
+#
+# Legs are keyed by a fingerprint of the obstacle grid, the footprint that has to fit
+# through, and the leg's start and target (legs are directional). A later run on the same
+# layout picks up finished legs instead of sending ants again, even when the pick list
+# only partly overlaps. The least recently used legs are evicted once the cache grows
+# past max_entries legs or max_bytes of path data.
+
+import sqlite3
+import time
+
+import numpy as np
+from ant_farm import Route
+
+
+class LegCache:
+    # best leg paths stored in a small sqlite file
+
+    def __init__(self, filename='leg_cache.sqlite', max_entries=10000, max_bytes=64 * 2**20):
+        self.filename = filename
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(filename)
+        self.db.execute('CREATE TABLE IF NOT EXISTS legs ('
+                        'key TEXT PRIMARY KEY, length INTEGER, width INTEGER, '
+                        'cells BLOB, used REAL)')
+        self.db.commit()
+
+    # returns cache key of the leg from start to target for the layout and footprint
+    def key(self, layout, start, target, check_cart):
+        footprint = layout.footprint(check_cart)
+        return (f'{layout.layout_fingerprint()}:{footprint}:'
+                f'{int(start[0])},{int(start[1])}->{int(target[0])},{int(target[1])}')
+
+    # returns cached Route for the leg or None, a hit marks the leg as recently used
+    def get(self, layout, start, target, check_cart):
+        key = self.key(layout, start, target, check_cart)
+        row = self.db.execute('SELECT width, cells FROM legs WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.db.execute('UPDATE legs SET used = ? WHERE key = ?', (time.time(), key))
+        self.db.commit()
+        return Route(np.frombuffer(row[1], dtype=np.int32), row[0])
+
+    # stores route for the leg unless an equally short one is cached already
+    def put(self, layout, start, target, check_cart, route):
+        key = self.key(layout, start, target, check_cart)
+        row = self.db.execute('SELECT length FROM legs WHERE key = ?', (key,)).fetchone()
+        if row is not None and row[0] <= len(route):
+            return
+        self.db.execute('INSERT OR REPLACE INTO legs VALUES (?, ?, ?, ?, ?)',
+                        (key, len(route), route.width, route.flat.tobytes(), time.time()))
+        self.evict()
+        self.db.commit()
+
+    # drops least recently used legs until both size limits hold
+    def evict(self):
+        count, size = self.db.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(cells)), 0) '
+                                      'FROM legs').fetchone()
+        while count > self.max_entries or size > self.max_bytes:
+            key, nbytes = self.db.execute('SELECT key, LENGTH(cells) FROM legs '
+                                          'ORDER BY used LIMIT 1').fetchone()
+            self.db.execute('DELETE FROM legs WHERE key = ?', (key,))
+            count -= 1
+            size -= nbytes
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM legs').fetchone()[0]
+
+    # removes every cached leg
+    def clear(self):
+        self.db.execute('DELETE FROM legs')
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
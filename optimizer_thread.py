@@ -0,0 +1,150 @@
+# Runs the optimizer in a background thread while the visualizers draw
+#
+# The animation used to run one iteration per frame, so the window froze during slow
+# iterations and the optimizer sat idle while frames were drawn. OptimizerThread runs
+# farm.run_iteration() back to back in a worker thread. After every iteration it calls
+# capture(result) in the worker and publishes the returned snapshot. The window picks up the
+# newest snapshot on its own timer and skips the ones it missed. Numpy releases the
+# GIL in its grid work and Python switches threads every few milliseconds during the rest,
+# so the window keeps handling events while ants walk.
+#
+# capture runs in the worker between iterations, so it is the only safe place to read the
+# farm. It should return new lists and dicts rather than the farm's own, which the next
+# iteration changes while the window draws.
+
+import threading
+
+
+class OptimizerThread:
+    # runs iterations of farm in a daemon thread and publishes capture(result) after each
+    # iterations_per_frame: None runs freely, K lets the colony get at most K iterations ahead
+    # of the window before it waits for a redraw, so no displayed frame skips more than K
+
+    def __init__(self, farm, iterations, capture, iterations_per_frame=None):
+        self.farm = farm
+        self.iterations = iterations
+        self.capture = capture
+        self.iterations_per_frame = iterations_per_frame
+        self.completed = 0 # iterations run so far
+        self.finished = False # True once the worker has stopped, for whatever reason
+        self.error = None # exception that ended the worker, animate raises it again
+        self._snapshot = None
+        self._fresh = False # a snapshot was published that take() has not returned yet
+        self._pending = 0 # iterations since the window last took a snapshot
+        self._stop = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='optimizer', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    # asks the worker to stop after the iteration it is running
+    def stop(self):
+        with self._condition:
+            self._stop = True
+            self._condition.notify_all()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    def _run(self):
+        try:
+            for _ in range(self.iterations):
+                with self._condition:
+                    if self.iterations_per_frame:
+                        while self._pending >= self.iterations_per_frame and not self._stop:
+                            self._condition.wait()
+                    if self._stop:
+                        break
+
+                result = self.farm.run_iteration()
+                snapshot = self.capture(result)
+                converged = self.farm.check_convergence()
+
+                with self._condition:
+                    self.completed += 1
+                    self._pending += 1
+                    self._snapshot = snapshot
+                    self._fresh = True
+                if converged:
+                    break
+        except Exception as exc:
+            self.error = exc
+        finally:
+            with self._condition:
+                self.finished = True
+                self._condition.notify_all()
+
+    # returns the newest snapshot not returned before, None if nothing new was published
+    def take(self):
+        with self._condition:
+            if not self._fresh:
+                return None
+            self._fresh = False
+            self._pending = 0
+            self._condition.notify_all()
+            return self._snapshot
+
+    # True once the worker has stopped and its last snapshot was taken
+    def drained(self):
+        with self._condition:
+            return self.finished and not self._fresh
+
+
+# shows fig until the optimizer is done, handing each new snapshot to draw(snapshot)
+# every interval ms a timer checks for a new snapshot and blits the artists only when there is
+# one, so a window waiting on a slow iteration costs the optimizer nothing. interval no longer
+# limits how fast the optimizer runs. Closing the window stops the optimizer after its
+# current iteration.
+def animate(fig, artists, worker, draw, interval=50):
+    # matplotlib is imported here so the optimizer also runs on machines without it
+    import matplotlib.pyplot as plt
+
+    canvas = fig.canvas
+    background = [None] # figure without the artists, saved on every full redraw
+    for artist in artists:
+        # animated artists are left out of full redraws, they are blitted over the background
+        artist.set_animated(True)
+
+    def draw_artists():
+        for artist in artists:
+            fig.draw_artist(artist)
+
+    # the window was drawn in full (first show, resize): keep it as background, add the artists
+    def on_draw(event):
+        background[0] = canvas.copy_from_bbox(fig.bbox)
+        draw_artists()
+
+    def tick():
+        if worker.error is not None:
+            timer.stop()
+            plt.close(fig)
+            return
+        snapshot = worker.take()
+        if snapshot is None:
+            if worker.drained():
+                timer.stop()
+            return
+        draw(snapshot)
+        if background[0] is None:
+            canvas.draw_idle()
+            return
+        canvas.restore_region(background[0])
+        draw_artists()
+        canvas.blit(fig.bbox)
+
+    canvas.mpl_connect('draw_event', on_draw)
+    canvas.mpl_connect('close_event', lambda event: worker.stop())
+    timer = canvas.new_timer(interval=interval)
+    timer.add_callback(tick)
+    worker.start()
+    timer.start()
+    try:
+        plt.show()
+    finally:
+        timer.stop()
+        worker.stop()
+        worker.join()
+    if worker.error is not None:
+        raise worker.error
@@ -0,0 +1,396 @@
+# Record a run now, render it later
+#
+# SnapshotRecorder captures each iteration of a farm (best routes, a sample of the routes the
+# ants walked and optionally the pheromone) into one compact file while the optimizer runs
+# at full speed, e.g. from the headless runner with --record. render_recording() turns that
+# file into PNG frames, a GIF or an MP4 afterwards, splitting the frames over worker
+# processes.
+#
+# usage examples:
+#   python -m headless --template dual --iterations 150 --record dual.rec --record-pheromone
+#   python -m recording dual.rec --output dual.mp4 --fps 10 --workers 4
+#   python -m recording dual.rec --output frames/
+#
+# A recording is a zip archive: layout.npz with the floor and stops, then one npz per
+# iteration. Pheromone is stored as fixed point log values, a full grid every
+# keyframe_every frames and only the change since the previous frame in between, which
+# zlib squeezes well because evaporation changes most cells by the same step.
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import zipfile
+
+import numpy as np
+from ant_farm import pack_routes, unpack_routes
+
+# pheromone is stored as int16 round(log(pheromone / PHEROMONE_FLOOR) * PHEROMONE_SCALE), a
+# step of under 2 % which a heat map cannot show, the floor is the value
+# update_pheromone_grid clamps evaporation to
+PHEROMONE_FLOOR = 0.1
+PHEROMONE_SCALE = 64
+
+# line colors of the vehicle classes in rendered frames, repeated for larger fleets
+CLASS_COLORS = ['blue', 'orange', 'green', 'purple', 'red', 'cyan', 'magenta', 'brown']
+
+
+# returns {class name: check_cart} of a farm, single class farms route one class 'ants'
+def farm_classes(farm):
+    if hasattr(farm, 'vehicles'):
+        return {name: farm.vehicle_check(name) for name in farm.vehicles}
+    return {'ants': True}
+
+
+# returns (routes, joined) with the best routes of one class of farm: joined is True for a
+# single complete sequential route, otherwise routes holds one entry per leg or end (None
+# where nothing was found yet)
+def best_routes(farm, name):
+    if hasattr(farm, 'vehicles'):
+        if farm.best_routes[name]:
+            return [farm.best_routes[name]], True
+        return list(farm.best_segments[name]), False
+    if not farm.sequential:
+        return [farm.best_paths.get(e) for e in farm.ends], False
+    if farm.best_route:
+        return [farm.best_route], True
+    return list(farm.best_segments), False
+
+
+# returns length of the best complete route of one class of farm, inf while there is none
+def best_length(farm, name):
+    if hasattr(farm, 'vehicles'):
+        return farm.best_route_lengths[name]
+    return farm.current_best_length()
+
+
+# returns successful routes of one class walked in farm's last iteration
+def walked_routes(farm, name):
+    if hasattr(farm, 'vehicles'):
+        return farm.last_class_routes.get(name, [])
+    return [route for group in farm.last_routes for route in group]
+
+
+# returns pheromone grid as int16 fixed point log values
+def pheromone_fixed(pheromone):
+    grid = np.maximum(np.asarray(pheromone, dtype=np.float64), PHEROMONE_FLOOR)
+    return np.minimum(np.rint(np.log(grid / PHEROMONE_FLOOR) * PHEROMONE_SCALE), 2**14).astype(np.int16)
+
+
+# pack_routes with every cell stored as the move from the cell before, routes step to
+# neighbors so the moves take few distinct values and compress about 4 times better
+def pack_moves(name, routes):
+    packed = pack_routes(name, routes)
+    packed[f'{name}_cells'] = np.diff(packed[f'{name}_cells'], prepend=0).astype(np.int32)
+    return packed
+
+
+# returns routes stored by pack_moves under name
+def unpack_moves(data, name, width):
+    data = dict(data)
+    data[f'{name}_cells'] = np.cumsum(data[f'{name}_cells'], dtype=np.int64).astype(np.int32)
+    return unpack_routes(data, name, width)
+
+
+class SnapshotRecorder:
+    # writes one snapshot per capture(farm) call to filename
+    # sample_routes: routes the ants walked kept per class and iteration, 0 for none
+    # pheromone: also store the pheromone grids, keyframe_every sets how often in full
+
+    def __init__(self, filename, sample_routes=20, pheromone=False, keyframe_every=25, seed=0):
+        self.filename = filename
+        self.sample_routes = sample_routes
+        self.pheromone = pheromone
+        self.keyframe_every = keyframe_every
+        self.rng = random.Random(seed) # own stream, sampling must not change the farm's run
+        self.frames = 0
+        self.archive = zipfile.ZipFile(filename, 'w', zipfile.ZIP_STORED)
+        self._previous = None # fixed point pheromone of the last frame, deltas are taken to it
+
+    # writes arrays as a compressed npz entry of the archive
+    def _write(self, entry, arrays):
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        self.archive.writestr(entry, buffer.getvalue())
+
+    # stores the floor, the stops and the vehicle classes, called on the first capture
+    def _write_layout(self, farm):
+        classes = farm_classes(farm)
+        footprints = [farm.footprint(check) or (0, 0) for check in classes.values()]
+        self._write('layout.npz', {
+            'obstacles': farm.obstacles,
+            'start': np.array(farm.start),
+            'ends': np.array(farm.ends).reshape(-1, 2),
+            'return_to_start': farm.return_to_start,
+            'sequential': farm.sequential,
+            'classes': json.dumps(list(classes)),
+            'footprints': np.array(footprints).reshape(-1, 2),
+            'pheromone': self.pheromone,
+        })
+
+    # records the state of farm after an iteration
+    def capture(self, farm):
+        if self.frames == 0:
+            self._write_layout(farm)
+
+        arrays = {'iteration': farm.iteration}
+        for k, name in enumerate(farm_classes(farm)):
+            routes, joined = best_routes(farm, name)
+            arrays.update(pack_moves(f'best{k}', routes))
+            arrays[f'joined{k}'] = joined
+
+            walked = walked_routes(farm, name)
+            if len(walked) > self.sample_routes:
+                walked = self.rng.sample(walked, self.sample_routes)
+            arrays.update(pack_moves(f'walked{k}', walked))
+
+        arrays['lengths'] = np.array([best_length(farm, name) for name in farm_classes(farm)], dtype=float)
+
+        if self.pheromone:
+            fixed = np.stack([pheromone_fixed(pher) for pher in farm.pheromone_maps()])
+            keyframe = self.frames % self.keyframe_every == 0
+            arrays['keyframe'] = keyframe
+            arrays['pheromone'] = fixed if keyframe else fixed - self._previous
+            self._previous = fixed
+
+        self._write(f'frames/{self.frames:06d}.npz', arrays)
+        self.frames += 1
+
+    def close(self):
+        self.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Recording:
+    # reads a file written by SnapshotRecorder
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.archive = zipfile.ZipFile(filename)
+        self.entries = sorted(name for name in self.archive.namelist() if name.startswith('frames/'))
+        if 'layout.npz' not in self.archive.namelist():
+            # the layout is written with the first snapshot, a recorder closed before it has none
+            self.archive.close()
+            raise RuntimeError(f"{filename} holds no snapshots, nothing to render")
+        layout = self._read('layout.npz')
+        self.obstacles = layout['obstacles']
+        self.width = self.obstacles.shape[1]
+        self.start = tuple(layout['start'].tolist())
+        self.ends = [tuple(e) for e in layout['ends'].tolist()]
+        self.return_to_start = bool(layout['return_to_start'])
+        self.sequential = bool(layout['sequential'])
+        self.classes = json.loads(str(layout['classes']))
+        self.footprints = [tuple(fp) if any(fp) else None for fp in layout['footprints'].tolist()]
+        self.has_pheromone = bool(layout['pheromone'])
+
+    def _read(self, entry):
+        with np.load(io.BytesIO(self.archive.read(entry))) as data:
+            return dict(data)
+
+    def __len__(self):
+        return len(self.entries)
+
+    # yields decoded snapshots start..stop-1 as dicts, pheromone rebuilt from the last keyframe
+    def frames(self, start=0, stop=None):
+        stop = len(self) if stop is None else min(stop, len(self))
+        pheromone = None
+        first = start
+        if self.has_pheromone:
+            # walk back to the keyframe the requested frames build on
+            while first > 0 and not bool(self._read(self.entries[first])['keyframe']):
+                first -= 1
+        for index in range(first, stop):
+            data = self._read(self.entries[index])
+            if self.has_pheromone:
+                pheromone = data['pheromone'] if bool(data['keyframe']) else pheromone + data['pheromone']
+            if index < start:
+                continue
+            snapshot = {'index': index, 'iteration': int(data['iteration']),
+                        'lengths': data['lengths'].tolist(),
+                        'best': [], 'joined': [], 'walked': []}
+            for k in range(len(self.classes)):
+                snapshot['best'].append(unpack_moves(data, f'best{k}', self.width))
+                snapshot['joined'].append(bool(data[f'joined{k}']))
+                snapshot['walked'].append(unpack_moves(data, f'walked{k}', self.width))
+            if pheromone is not None:
+                snapshot['pheromone'] = PHEROMONE_FLOOR * np.exp(pheromone / PHEROMONE_SCALE)
+            yield snapshot
+
+    def close(self):
+        self.archive.close()
+
+
+class FrameRenderer:
+    # draws snapshots of a Recording onto one figure whose artists are created once
+    # one column per vehicle class: routes on top, the pheromone below when it was recorded
+
+    def __init__(self, recording, dpi=80):
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        from route_artists import RoutePanel, route_waypoints
+
+        rec = recording
+        self.recording = rec
+        self.dpi = dpi
+        rows = 2 if rec.has_pheromone else 1
+        columns = len(rec.classes)
+        self.fig, axes = plt.subplots(rows, columns, figsize=(7 * columns, 5 * rows), squeeze=False)
+        self.waypoints = route_waypoints(rec.ends, rec.start, rec.return_to_start)
+        legs = len(self.waypoints) if rec.sequential else len(rec.ends)
+
+        self.panels = []
+        for k, name in enumerate(rec.classes):
+            color = CLASS_COLORS[k % len(CLASS_COLORS)]
+            panel = RoutePanel(axes[0][k], rec.obstacles, name.capitalize())
+            panel.walked = panel.add_routes(color, alpha=0.25, linewidth=0.6)
+            panel.legs = panel.add_legs(legs, label='Seg' if rec.sequential else 'Path')
+            panel.carts = panel.add_footprints(4, rec.footprints[k]) if rec.footprints[k] else []
+            panel.draw_stops(rec.start, rec.ends, offset=2, return_to_start=rec.return_to_start)
+            panel.legend()
+            if rec.has_pheromone:
+                ax = axes[1][k]
+                panel.heat = ax.imshow(np.zeros(rec.obstacles.shape), cmap='hot', origin='upper')
+                ax.imshow(np.ma.masked_where(~rec.obstacles, rec.obstacles), cmap='Greys',
+                          vmin=0, vmax=2, alpha=0.6)
+                ax.set_title(f'{name.capitalize()} Pheromone', fontsize=12)
+            self.panels.append(panel)
+        plt.tight_layout()
+
+    # updates every artist to show snapshot
+    def draw(self, snapshot):
+        from route_artists import set_footprints, set_legs, set_route, set_routes
+
+        for k, panel in enumerate(self.panels):
+            best = snapshot['best'][k]
+            set_routes(panel.walked, snapshot['walked'][k])
+            if snapshot['joined'][k]:
+                set_legs(panel.legs, best[0], self.waypoints)
+            else:
+                for line, route in zip(panel.legs, best + [None] * len(panel.legs)):
+                    set_route(line, route)
+            set_footprints(panel.carts, best[0] if snapshot['joined'][k] else None)
+
+            length = snapshot['lengths'][k]
+            best_text = f'best {int(length)} steps' if np.isfinite(length) else 'no complete route yet'
+            panel.set_status(f"Iteration {snapshot['iteration']}: {best_text}")
+            if 'pheromone' in snapshot:
+                grid = np.log10(snapshot['pheromone'][k])
+                panel.heat.set_data(grid)
+                panel.heat.set_clim(grid.min(), max(grid.max(), grid.min() + 1e-6))
+
+    def save(self, filename):
+        self.fig.savefig(filename, dpi=self.dpi)
+
+
+# renders frames start..stop-1 of recording filename as numbered PNGs into directory
+# returns the number of frames written; every keeps only every n-th frame
+def render_frames(filename, directory, start=0, stop=None, dpi=80, every=1):
+    recording = Recording(filename)
+    renderer = FrameRenderer(recording, dpi)
+    count = 0
+    for snapshot in recording.frames(start, stop):
+        if snapshot['index'] % every:
+            continue
+        renderer.draw(snapshot)
+        renderer.save(os.path.join(directory, f"frame_{snapshot['index'] // every:06d}.png"))
+        count += 1
+    recording.close()
+    return count
+
+
+# worker entry point for render_recording
+def _render_chunk(args):
+    return render_frames(*args)
+
+
+# turns a recording into output: a directory of PNG frames, a .gif or an .mp4 (needs ffmpeg)
+# workers > 1 renders chunks of frames in parallel processes; returns the frames written
+def render_recording(filename, output, fps=10, workers=1, dpi=80, every=1, log=None):
+    recording = Recording(filename)
+    total = len(recording)
+    recording.close()
+    if total == 0:
+        raise RuntimeError(f"{filename} holds no snapshots, nothing to render")
+
+    extension = os.path.splitext(output)[1].lower()
+    if extension == '.mp4' and shutil.which('ffmpeg') is None:
+        raise RuntimeError("ffmpeg was not found, render to a .gif or a folder of PNG frames instead")
+    if extension in ('.gif', '.mp4'):
+        workdir = tempfile.TemporaryDirectory()
+        directory = workdir.name
+    else:
+        workdir = None
+        directory = output
+        os.makedirs(directory, exist_ok=True)
+
+    try:
+        workers = max(1, min(workers or os.cpu_count(), total))
+        size = -(-total // workers) if total else 0
+        # chunks start on multiples of every so frame numbers stay continuous
+        size = -(-size // every) * every
+        chunks = [(filename, directory, begin, begin + size, dpi, every)
+                  for begin in range(0, total, size or 1)]
+        if log:
+            log(f"rendering {total} snapshots on {workers} worker(s)")
+        if workers > 1:
+            with multiprocessing.get_context('spawn').Pool(workers) as pool:
+                count = sum(pool.map(_render_chunk, chunks))
+        else:
+            count = sum(_render_chunk(chunk) for chunk in chunks)
+
+        frames = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                        if name.startswith('frame_') and name.endswith('.png'))
+        if extension == '.gif':
+            from PIL import Image
+            images = [Image.open(frame) for frame in frames]
+            images[0].save(output, save_all=True, append_images=images[1:],
+                           duration=int(1000 / fps), loop=0)
+        elif extension == '.mp4':
+            subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-framerate', str(fps),
+                            '-i', os.path.join(directory, 'frame_%06d.png'),
+                            '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p', output],
+                           check=True)
+    finally:
+        if workdir is not None:
+            workdir.cleanup()
+    if log:
+        log(f"{count} frames written to {output}")
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m recording',
+        description='Render a run recorded with headless --record to frames, a GIF or an MP4.')
+    parser.add_argument('recording', help='file written by headless --record')
+    parser.add_argument('--output', required=True,
+                        help='.mp4 (needs ffmpeg), .gif or a directory for PNG frames')
+    parser.add_argument('--fps', type=float, default=10, help='frames per second (default 10)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='render in this many processes, 0 for one per core (default 1)')
+    parser.add_argument('--dpi', type=int, default=80, help='frame resolution (default 80)')
+    parser.add_argument('--every', type=int, default=1, help='render only every n-th iteration')
+    args = parser.parse_args(argv)
+
+    try:
+        render_recording(args.recording, args.output, args.fps, args.workers, args.dpi, args.every,
+                         log=lambda msg: print(msg, file=sys.stderr))
+    except RuntimeError as exc:
+        parser.error(str(exc))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+# Persistent matplotlib artists for the route visualizers
+#
+# Each panel draws the floor, the stops and the legend once. Later frames only hand new
+# routes to artists that already exist (LineCollection.set_segments, Line2D.set_data), so
+# optimizer_thread.animate can blit them over the cached floor and frame time stays the same
+# no matter how many routes a frame shows. Text that changes every frame sits inside the axes
+# so blitting redraws it. Only the visualizers import this module, the optimizer never needs
+# matplotlib.
+
+import numpy as np
+from matplotlib.collections import LineCollection
+from matplotlib.patches import Rectangle
+
+from ant_farm import split_route_into_segments
+
+# colors of the legs of a best route, repeated when a route has more legs
+SEGMENT_COLORS = ['red', 'blue', 'green', 'orange', 'purple', 'cyan', 'magenta', 'yellow']
+
+
+# returns (n, 2) plot vertices (x, y) of a Route or a list of (y, x) positions
+def route_xy(route):
+    return np.asarray(route, dtype=float).reshape(-1, 2)[:, ::-1]
+
+
+class RoutePanel:
+    # one axes with the floor and stops drawn once, plus the artists each frame updates
+
+    def __init__(self, ax, obstacles, title, fontsize=12, grid_alpha=0.2):
+        self.ax = ax
+        ax.imshow(obstacles, cmap='Greys', alpha=0.3)
+        ax.set_title(title, fontsize=fontsize)
+        ax.grid(True, alpha=grid_alpha)
+        ax.set_autoscale_on(False)
+        self.status = ax.text(0.01, 0.99, '', transform=ax.transAxes, ha='left', va='top',
+                              fontsize=10, bbox=dict(facecolor='white', alpha=0.8, edgecolor='none'))
+        self.artists = [self.status] # artists frames change, blitted over the floor by animate
+
+    # draws the start and every end, end_colors gives one color per end (default red)
+    # numbers the ends offset cells away and marks the start 'S/E' when routes return to it
+    def draw_stops(self, start, ends, start_size=12, end_size=10, end_colors=None, offset=None,
+                   return_to_start=False, start_label='Start', end_label=None):
+        ax = self.ax
+        ax.plot(start[1], start[0], 'go', markersize=start_size, label=start_label)
+        for idx, e in enumerate(ends):
+            color = end_colors[idx % len(end_colors)] if end_colors else 'red'
+            label = end_label(idx) if end_label else None
+            ax.plot(e[1], e[0], 'o', color=color, markersize=end_size, label=label)
+            if offset is not None:
+                ax.text(e[1] + offset, e[0] + offset, str(idx + 1), color='white',
+                        fontsize=10, fontweight='bold')
+        if offset is not None and return_to_start:
+            ax.text(start[1] + offset, start[0] + offset, 'S/E', color='white',
+                    fontsize=10, fontweight='bold')
+
+    # returns LineCollection showing many thin routes at once, filled by set_routes
+    def add_routes(self, color, alpha=0.3, linewidth=0.5, label=None):
+        lines = LineCollection([], colors=color, alpha=alpha, linewidths=linewidth)
+        self.ax.add_collection(lines, autolim=False)
+        if label:
+            # a collection with no segments gets no legend entry, an empty line stands in
+            self.ax.plot([], [], color=color, linewidth=2, label=label)
+        self.artists.append(lines)
+        return lines
+
+    # returns Line2D for one highlighted route, filled by set_route
+    def add_route(self, color, linewidth=3, label=None):
+        line, = self.ax.plot([], [], color=color, linewidth=linewidth, label=label)
+        self.artists.append(line)
+        return line
+
+    # returns one Line2D per leg of a best route, colored by SEGMENT_COLORS, filled by set_legs
+    def add_legs(self, count, linewidth=3, label='Segment'):
+        return [self.add_route(SEGMENT_COLORS[k % len(SEGMENT_COLORS)], linewidth, f'{label} {k + 1}')
+                for k in range(count)]
+
+    # returns count cart outlines of size (height, width), placed by set_footprints
+    def add_footprints(self, count, size, color='yellow', linewidth=1, alpha=0.5):
+        rects = []
+        for _ in range(count):
+            rect = Rectangle((0, 0), size[1], size[0], fill=False, edgecolor=color,
+                             linewidth=linewidth, alpha=alpha, visible=False)
+            self.ax.add_patch(rect)
+            rects.append(rect)
+        self.artists.extend(rects)
+        return rects
+
+    def legend(self, fontsize=8):
+        if self.ax.get_legend_handles_labels()[1]:
+            self.ax.legend(fontsize=fontsize)
+
+    def set_status(self, text):
+        self.status.set_text(text)
+
+
+# shows routes on a LineCollection, None entries are skipped
+def set_routes(lines, routes):
+    lines.set_segments([route_xy(route) for route in routes if route])
+
+
+# shows route on a Line2D, None clears it
+def set_route(line, route):
+    xy = route_xy(route) if route else np.empty((0, 2))
+    line.set_data(xy[:, 0], xy[:, 1])
+
+
+# shows the legs of route between waypoints, one per line, None clears them all
+def set_legs(lines, route, waypoints):
+    legs = split_route_into_segments(route, waypoints) if route else []
+    for k, line in enumerate(lines):
+        set_route(line, legs[k] if k < len(legs) and len(legs[k]) > 1 else None)
+
+
+# places the outlines evenly along route from its start to its end, None hides them
+def set_footprints(rects, route):
+    if not route:
+        for rect in rects:
+            rect.set_visible(False)
+        return
+    xy = route_xy(route)
+    for rect, i in zip(rects, np.linspace(0, len(xy) - 1, len(rects)).astype(int)):
+        rect.set_xy(xy[i])
+        rect.set_visible(True)
+
+
+# returns the stops a sequential route passes in order, the legs end at these
+def route_waypoints(ends, start, return_to_start):
+    return list(ends) + [start] if return_to_start else list(ends)
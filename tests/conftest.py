@@ -0,0 +1,26 @@
+# the modules live in the repository root, next to this directory
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+from ant_farm import AntFarm
+
+
+# builds the small floor several tests share: a block in the middle of a 30 x 40 grid and a
+# round trip through two stops; farm_class and cart_size pick the farm, settings are set on it
+@pytest.fixture
+def small_farm():
+    def build(farm_class=AntFarm, cart_size=None, **settings):
+        farm = farm_class(grid_size=(30, 40), cart_size=cart_size)
+        farm.obstacles[10:20, 15:25] = True
+        farm.set_start_end((2, 2), [(25, 35), (2, 35)], sequential=True, return_to_start=True)
+        farm.num_ants = 5
+        farm.rng = np.random.default_rng(0)
+        for name, value in settings.items():
+            setattr(farm, name, value)
+        return farm
+    return build
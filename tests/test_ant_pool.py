@@ -0,0 +1,33 @@
+import random
+
+import numpy as np
+
+from ant_farm import AntFarm, Profiler
+
+
+# the process engine reports the steps and failure reasons of every ant, arrived or not,
+# exactly as the same ants walked in this process with their seeded streams would
+def test_process_engine_counts_failed_ants():
+    farm = AntFarm(grid_size=(20, 30))
+    farm.obstacles[3:17, 3] = farm.obstacles[3, 3:10] = farm.obstacles[16, 3:10] = True
+    farm.set_start_end((10, 5), [(2, 2)], sequential=True)
+    farm.engine = 'process'
+    farm.workers = 2
+    farm.max_steps = 40
+    farm.rng = np.random.default_rng(0)
+    farm.profiler = Profiler()
+    try:
+        routes = farm.walk_pool(farm.start, [(2, 2)], 12, False, farm.pheromone)
+    finally:
+        farm.close_pool()
+    counts = dict(farm.profiler.counts)
+
+    seeds = np.random.default_rng(0).integers(2**63, size=12).tolist()
+    farm.profiler = Profiler()
+    expected = [farm.walk_route(farm.start, [(2, 2)], False, farm.pheromone, random.Random(seed))
+                for seed in seeds]
+    assert [r.flat.tolist() if r else None for r in routes] == \
+           [r.flat.tolist() if r else None for r in expected]
+    for key in ('steps', 'dead_ends', 'out_of_steps'):
+        assert counts[key] == farm.profiler.counts[key]
+    assert counts['out_of_steps'] + counts['dead_ends'] > 0
@@ -0,0 +1,7 @@
+from benchmark import bench_isolated
+
+
+# a layout that runs past its time limit is stopped and reported, not waited on
+def test_bench_isolated_reports_timeout():
+    result = bench_isolated('warehouse', 1000, timeout=2)
+    assert result == {'error': 'benchmark process took longer than 2s, stopped'}
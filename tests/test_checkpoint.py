@@ -0,0 +1,51 @@
+import pytest
+
+from ants_and_carts import DualPathFarm
+from leg_cache import LegCache
+
+
+def test_checkpoint_resumes_same_cart(tmp_path, small_farm):
+    farm = small_farm(DualPathFarm, (2, 3))
+    farm.run_iteration()
+    farm.save_checkpoint(tmp_path / 'run.npz')
+
+    resumed = small_farm(DualPathFarm, (2, 3))
+    resumed.load_checkpoint(tmp_path / 'run.npz')
+    assert resumed.best_route_length_carts == farm.best_route_length_carts
+
+
+# routes found for a small cart must not be restored for a larger one
+def test_checkpoint_rejects_other_cart_size(tmp_path, small_farm):
+    farm = small_farm(DualPathFarm, (2, 3))
+    farm.run_iteration()
+    farm.save_checkpoint(tmp_path / 'run.npz')
+
+    with pytest.raises(ValueError, match='footprints'):
+        small_farm(DualPathFarm, (4, 5)).load_checkpoint(tmp_path / 'run.npz')
+
+
+def test_antfarm_checkpoint_rejects_other_cart_size(tmp_path, small_farm):
+    small_farm(cart_size=(2, 3)).save_checkpoint(tmp_path / 'run.npz')
+    with pytest.raises(ValueError, match='footprints'):
+        small_farm(cart_size=(4, 5)).load_checkpoint(tmp_path / 'run.npz')
+
+
+# legs restored from a checkpoint win, the leg cache only fills the legs it has no route for
+def test_checkpoint_legs_win_over_leg_cache(tmp_path, small_farm):
+    cache = LegCache(str(tmp_path / 'legs.sqlite'))
+    solved = small_farm(segment_by_segment=True, leg_cache=cache)
+    solved.solve_exact()
+    exact = solved.best_segments
+
+    farm = small_farm(segment_by_segment=True)
+    farm.run_iteration()
+    farm.best_segments[1] = None
+    farm.best_segment_lengths[1] = float('inf')
+    farm.save_checkpoint(tmp_path / 'run.npz')
+
+    resumed = small_farm(segment_by_segment=True, leg_cache=cache)
+    resumed.load_checkpoint(tmp_path / 'run.npz')
+    resumed.run_iteration()
+    assert cache.hits == 1
+    assert resumed.cached_segments == [False, True, False]
+    assert resumed.best_segments[1].flat.tolist() == exact[1].flat.tolist()
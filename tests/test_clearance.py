@@ -0,0 +1,24 @@
+import numpy as np
+
+from ant_farm import build_cart_clearance
+
+
+# marks an anchor blocked the slow way: any obstacle under the footprint or off the grid
+def brute_force_clearance(obstacles, cart_size):
+    h, w = obstacles.shape
+    cart_h, cart_w = cart_size
+    blocked = np.ones((h, w), dtype=bool)
+    for y in range(h):
+        for x in range(w):
+            if y + cart_h <= h and x + cart_w <= w:
+                blocked[y, x] = obstacles[y:y + cart_h, x:x + cart_w].any()
+    return blocked
+
+
+def test_clearance_matches_brute_force():
+    rng = np.random.default_rng(0)
+    for density in (0.02, 0.1, 0.3):
+        obstacles = rng.random((23, 31)) < density
+        for cart_size in ((1, 1), (2, 3), (3, 2), (5, 5), (23, 31), (24, 2)):
+            np.testing.assert_array_equal(build_cart_clearance(obstacles, cart_size),
+                                          brute_force_clearance(obstacles, cart_size))
@@ -0,0 +1,83 @@
+import numpy as np
+
+from ant_farm import DIRECTIONS, AntFarm, downsample_footprint, downsample_obstacles
+
+
+# the visiting order is solved once on the full floor, not again on the corridor or afterwards
+def test_coarse_to_fine_keeps_visit_order(monkeypatch):
+    farm = AntFarm(grid_size=(40, 60))
+    farm.obstacles[12:28, 20:40] = True
+    farm.set_start_end((2, 2), [(35, 55), (2, 55), (35, 2), (20, 10)], sequential=True)
+    farm.optimize_order = True
+    farm.num_ants = 5
+    farm.rng = np.random.default_rng(0)
+
+    solved = []
+    shortest_visit_order = AntFarm.shortest_visit_order
+    def counting(self, *args, **kwargs):
+        solved.append(self is farm)
+        return shortest_visit_order(self, *args, **kwargs)
+    monkeypatch.setattr(AntFarm, 'shortest_visit_order', counting)
+
+    farm.run_coarse_to_fine(factor=2, coarse_iterations=3, fine_iterations=3)
+    order = list(farm.ends)
+    farm.run_iteration()
+    assert solved.count(True) == 1
+    assert farm.ends == order
+
+
+# True if a fine cart can get from anchor a to anchor b without leaving their bounding box
+def fine_path_exists(fine, a, b):
+    (y0, y1), (x0, x1) = sorted((a[0], b[0])), sorted((a[1], b[1]))
+    seen, frontier = {a}, [a]
+    while frontier:
+        nxt = []
+        for y, x in frontier:
+            for dy, dx in DIRECTIONS:
+                p = (y + dy, x + dx)
+                if y0 <= p[0] <= y1 and x0 <= p[1] <= x1 and p not in seen and fine[p]:
+                    seen.add(p)
+                    nxt.append(p)
+        frontier = nxt
+    return b in seen
+
+
+# every coarse move of a cart must have a fine path where the fine cart fits
+def test_coarse_cart_never_opens_a_blocked_passage():
+    rng = np.random.default_rng(0)
+    for shape in ((48, 60), (50, 63)):
+        for factor in (2, 3, 4):
+            for cart_size in ((2, 2), (3, 5), (6, 10)):
+                farm = AntFarm(grid_size=shape, cart_size=cart_size)
+                farm.obstacles[...] = rng.random(shape) < 0.01
+                fine = farm.get_enterable(True)
+                coarse = AntFarm(grid_size=(-(-shape[0] // factor), -(-shape[1] // factor)),
+                                 cart_size=downsample_footprint(cart_size, factor))
+                coarse.obstacles[...] = downsample_obstacles(farm.obstacles, factor)
+                table = coarse.get_neighbor_table(True)
+                for cell in np.flatnonzero(coarse.get_enterable(True)).tolist():
+                    a = tuple(factor * v for v in divmod(cell, table.width))
+                    assert fine[a]
+                    for nbr in table.neighbors(cell):
+                        b = tuple(factor * v for v in divmod(nbr, table.width))
+                        assert fine_path_exists(fine, a, b)
+
+
+# a corridor without a complete route falls back to refining on the whole floor
+def test_coarse_to_fine_falls_back_to_whole_floor(monkeypatch):
+    farm = AntFarm(grid_size=(40, 60), cart_size=(3, 3))
+    farm.obstacles[12:28, 20:40] = True
+    farm.set_start_end((2, 2), [(35, 55)], sequential=True)
+    farm.num_ants = 10
+    farm.rng = np.random.default_rng(0)
+    # coarse routes that cover nothing leave a corridor without any route
+    monkeypatch.setattr(AntFarm, 'found_routes', lambda self: [])
+
+    messages, history = [], {}
+    farm.run_coarse_to_fine(factor=2, coarse_iterations=3, fine_iterations=5, log=messages.append,
+                            history=history)
+    assert any('whole floor' in message for message in messages)
+    assert len(history['coarse']) == 3 and len(history['fine']) == 10
+    assert history['fine'][-1] == farm.current_best_length()
+    assert farm.current_best_length() < float('inf')
+    assert farm.obstacles.sum() == 16 * 20
@@ -0,0 +1,48 @@
+import random
+
+import numpy as np
+
+from ant_farm import ConvergenceMonitor, create_template_layout, pheromone_entropy, route_diversity
+
+
+# template with ants that follow pheromone strongly enough to settle on one corridor per leg
+def converging_farm(monitor):
+    farm = create_template_layout()
+    farm.alpha = 3.0
+    farm.rng = np.random.default_rng(0)
+    random.seed(0)
+    farm.convergence = monitor
+    return farm
+
+
+def run_until_stopped(farm, iterations=60):
+    for i in range(iterations):
+        farm.run_iteration()
+        if farm.check_convergence():
+            return i + 1
+    return None
+
+
+def test_min_entropy_stops_converging_run():
+    farm = converging_farm(ConvergenceMonitor(patience=None, min_entropy=0.8))
+    stopped = run_until_stopped(farm)
+    assert stopped is not None and stopped < 60
+    assert 'entropy' in farm.stop_reason
+
+
+def test_min_diversity_stops_converging_run():
+    farm = converging_farm(ConvergenceMonitor(patience=None, min_diversity=0.4))
+    stopped = run_until_stopped(farm)
+    assert stopped is not None and stopped < 60
+    assert 'diversity' in farm.stop_reason
+
+
+def test_measures_fall_as_run_converges():
+    farm = converging_farm(None)
+    farm.run_iteration()
+    entropy = pheromone_entropy(farm.pheromone, farm.obstacles)
+    diversity = route_diversity(farm.last_routes)
+    for _ in range(20):
+        farm.run_iteration()
+    assert pheromone_entropy(farm.pheromone, farm.obstacles) < entropy - 0.1
+    assert route_diversity(farm.last_routes) < diversity - 0.2
@@ -0,0 +1,34 @@
+import json
+
+import numpy as np
+
+import headless
+from ants_and_carts import FleetFarm
+
+
+# fleets report the footprint of every class, not the unused farm.cart_size
+def test_fleet_reports_footprints_per_class():
+    farm = FleetFarm((30, 40), [('people', None), ('cart', (3, 5))])
+    farm.set_start_end((2, 2), [(25, 35)], sequential=True)
+    farm.num_ants = 3
+    farm.rng = np.random.default_rng(0)
+    result = headless.run_headless(farm, 1)
+    assert result['footprints'] == {'people': None, 'cart': [3, 5]}
+    assert 'cart_size' not in result
+
+
+# the fine iterations of --coarse lead best_length_history, the coarse ones are kept apart
+def test_coarse_iterations_in_history(tmp_path, capsys):
+    layout = np.zeros((30, 40), dtype=int)
+    layout[10:20, 15:25] = 1
+    layout[2, 2], layout[25, 35] = 2, 3
+    np.savetxt(tmp_path / 'layout.csv', layout, fmt='%d', delimiter=',')
+
+    headless.main(['--layout', str(tmp_path / 'layout.csv'), '--iterations', '2', '--ants', '5',
+                   '--seed', '0', '--quiet', '--coarse', '2', '--coarse-iterations', '3',
+                   '--fine-iterations', '4'])
+    result = json.loads(capsys.readouterr().out)
+    assert len(result['coarse_to_fine']['coarse_best_length_history']) == 3
+    assert result['coarse_to_fine']['fine_iterations_run'] == 4
+    assert len(result['best_length_history']) == 4 + result['iterations_run']
+    assert result['iterations_total'] == len(result['best_length_history'])
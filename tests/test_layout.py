@@ -0,0 +1,52 @@
+import random
+
+import numpy as np
+
+from ant_farm import AntFarm, FloorLayout
+from cart_visualization import create_warehouse_with_carts
+
+
+# float32 grids must not lose the geodesic heuristic of far cells to underflow
+def test_geodesic_heuristic_float32_keeps_far_cells():
+    nonzero = {}
+    for dtype in (np.float64, np.float32):
+        farm = create_warehouse_with_carts()
+        farm.heuristic = 'geodesic'
+        farm.set_dtype(dtype)
+        for check_cart in (False, True):
+            enterable = farm.get_enterable(check_cart).reshape(-1)
+            heur = farm.get_heuristic(farm.ends[0], check_cart)
+            nonzero[dtype, check_cart] = int(np.count_nonzero(heur[enterable]))
+    for check_cart in (False, True):
+        assert nonzero[np.float32, check_cart] == nonzero[np.float64, check_cart]
+        assert nonzero[np.float64, check_cart] > 0
+
+
+# cells cut off from the target get no pull at all, reachable ones decay with walking distance
+def test_geodesic_heuristic_zero_where_target_unreachable():
+    farm = AntFarm(grid_size=(20, 30))
+    farm.heuristic = 'geodesic'
+    farm.obstacles[5:15, 10] = farm.obstacles[5:15, 20] = True
+    farm.obstacles[5, 10:21] = farm.obstacles[14, 10:21] = True
+    pocket = np.zeros(farm.obstacles.shape, dtype=bool)
+    pocket[6:14, 11:20] = True
+    for target, cut_off in (((2, 2), pocket), ((10, 15), ~pocket & ~farm.obstacles)):
+        heur = farm.get_heuristic(target, False).reshape(farm.obstacles.shape)
+        reachable = ~farm.obstacles & ~cut_off
+        assert (heur[cut_off] == 0).all()
+        assert (heur[reachable] > 0).all()
+        assert heur[target] == heur.max() == 1
+
+    # on open floor the walking distance of 8-connected moves is the chebyshev distance
+    dist = farm.get_distance_field((2, 2), False)
+    assert dist[0, 0] == 2 and dist[2, 8] == 6 and dist[18, 4] == 16
+
+
+# a bare FloorLayout, as the process workers build it, has the settings its methods read
+def test_floor_layout_defaults():
+    layout = FloorLayout(grid_size=(20, 30))
+    assert layout.heuristic_targets() == 0
+    assert layout.memory_estimate()['total'] > 0
+    route = layout.walk_route((2, 2), [(15, 25)], False, layout.new_pheromone_grid(),
+                              random.Random(0))
+    assert route is None or route.flat[-1] == 15 * 30 + 25
@@ -0,0 +1,46 @@
+from ant_farm import Route
+from leg_cache import LegCache
+
+
+def segment_farm(small_farm, cache):
+    return small_farm(segment_by_segment=True, post_optimize=False, leg_cache=cache)
+
+
+def cached_lengths(farm):
+    legs = zip([farm.start] + farm.ends, farm.ends + [farm.start])
+    return [len(farm.leg_cache.get(farm, start, target, True)) for start, target in legs]
+
+
+# a later run that beats a cached leg must write the shorter leg back
+def test_shorter_legs_replace_cached_ones(tmp_path, small_farm):
+    cache = LegCache(str(tmp_path / 'legs.sqlite'))
+    farm = segment_farm(small_farm, cache)
+    legs = list(zip([farm.start] + farm.ends, farm.ends + [farm.start]))
+    # cache a detour for the first leg: out one cell and back before the shortest path
+    start, target = legs[0]
+    shortest = farm.shortest_path(start, target)
+    detour = Route.join([Route.from_positions([start, (3, 3), start], shortest.width), shortest])
+    cache.put(farm, start, target, True, detour)
+    assert len(cache.get(farm, start, target, True)) == len(shortest) + 2
+
+    later = segment_farm(small_farm, cache)
+    later.solve_exact()
+    assert cached_lengths(later) == [len(leg) for leg in later.best_segments]
+    assert cached_lengths(later)[0] == len(shortest)
+
+
+# with refine_cached_legs the ants keep walking cached legs and shorter ones are stored
+def test_refine_cached_legs_walks_cached_legs(tmp_path, small_farm):
+    cache = LegCache(str(tmp_path / 'legs.sqlite'))
+    segment_farm(small_farm, cache).solve_exact()
+
+    skipping = segment_farm(small_farm, cache)
+    skipping.run_iteration()
+    assert skipping.last_routes == []
+    assert cache.hits == 3
+
+    refining = segment_farm(small_farm, cache)
+    refining.refine_cached_legs = True
+    refining.run_iteration()
+    assert len(refining.last_routes) == 3
+    assert cached_lengths(refining) == refining.best_segment_lengths
@@ -0,0 +1,60 @@
+import numpy as np
+
+from ant_farm import DIRECTIONS, AntFarm, NeighborTable, build_cart_clearance
+
+
+def random_floor(seed=0, shape=(20, 27), density=0.2):
+    return np.random.default_rng(seed).random(shape) < density
+
+
+# flat indices of the enterable cells one step away, found by trying every move
+def brute_force_neighbors(enterable, idx):
+    h, w = enterable.shape
+    y, x = divmod(idx, w)
+    return [(y + dy) * w + x + dx for dy, dx in DIRECTIONS
+            if 0 <= y + dy < h and 0 <= x + dx < w and enterable[y + dy, x + dx]]
+
+
+def assert_table_matches(table, enterable):
+    for idx in range(enterable.size):
+        expected = brute_force_neighbors(enterable, idx)
+        assert table.neighbors(idx) == expected
+        row = table.padded[idx]
+        assert row[row >= 0].tolist() == expected
+        assert table.indices[table.indptr[idx]:table.indptr[idx + 1]].tolist() == expected
+
+
+def test_neighbor_table_matches_brute_force():
+    enterable = ~random_floor()
+    assert_table_matches(NeighborTable(enterable), enterable)
+
+
+def test_farm_neighbors_respect_cart_footprint():
+    farm = AntFarm(grid_size=(20, 27), cart_size=(2, 3))
+    farm.obstacles[...] = random_floor(1, density=0.05)
+    enterable = farm.get_enterable(True)
+    assert_table_matches(farm.get_neighbor_table(True), enterable)
+    assert_table_matches(farm.get_neighbor_table(False), ~farm.obstacles)
+
+
+# tables patched by edit_obstacles must equal tables built from scratch on the edited floor
+def test_patched_table_matches_fresh_table_after_edits():
+    farm = AntFarm(grid_size=(20, 27), cart_size=(2, 3))
+    farm.obstacles[...] = random_floor(2, density=0.05)
+    tables = {check_cart: farm.get_neighbor_table(check_cart) for check_cart in (False, True)}
+
+    rng = np.random.default_rng(3)
+    for _ in range(12):
+        y, x = rng.integers(0, 20), rng.integers(0, 27)
+        h, w = rng.integers(1, 6, size=2)
+        farm.edit_obstacles((y, x), (y + h, x + w), bool(rng.integers(2)))
+        np.testing.assert_array_equal(farm.get_cart_clearance(), build_cart_clearance(farm.obstacles, (2, 3)))
+        for check_cart in (False, True):
+            patched = farm.get_neighbor_table(check_cart)
+            assert patched is tables[check_cart]
+            fresh = NeighborTable(farm.get_enterable(check_cart))
+            np.testing.assert_array_equal(patched.padded, fresh.padded)
+            np.testing.assert_array_equal(patched.indptr, fresh.indptr)
+            np.testing.assert_array_equal(patched.indices, fresh.indices)
+            assert patched._indices == fresh._indices and patched._indptr == fresh._indptr
+            np.testing.assert_array_equal(patched.enterable, fresh.enterable)
@@ -0,0 +1,38 @@
+import numpy as np
+
+from ant_farm import Route, update_pheromone_grid
+
+
+# the per-cell loop update_pheromone_grid replaced
+def loop_update(pheromone, routes, evaporation_rate, deposit):
+    pheromone = np.maximum(pheromone * (1 - evaporation_rate), 0.1)
+    for route in routes:
+        if route:
+            for pos in route:
+                pheromone[pos] += deposit / len(route)
+    return pheromone
+
+
+def random_routes(rng, shape, count):
+    routes = []
+    for _ in range(count):
+        steps = rng.integers(-1, 2, size=(rng.integers(1, 40), 2))
+        cells = np.clip(np.cumsum(steps, axis=0) + (shape[0] // 2, shape[1] // 2), 0,
+                        np.array(shape) - 1)
+        routes.append([tuple(cell) for cell in cells.tolist()])
+    return routes + [None, []]
+
+
+# one scatter-add over all routes gives the loop's result, including cells a route revisits
+def test_single_pass_deposit_matches_loop():
+    rng = np.random.default_rng(0)
+    shape = (25, 35)
+    pheromone = rng.random(shape) * 2
+    routes = random_routes(rng, shape, 30)
+    expected = loop_update(pheromone, routes, 0.1, 100.0)
+
+    for as_routes in (False, True):
+        grid = pheromone.copy()
+        given = [Route.from_positions(r, shape[1]) if r and as_routes else r for r in routes]
+        update_pheromone_grid(grid, given, 0.1, 100.0)
+        np.testing.assert_allclose(grid, expected, rtol=1e-12)
@@ -0,0 +1,13 @@
+import pytest
+
+from recording import SnapshotRecorder, render_recording
+
+
+# a recording closed before the first iteration has nothing to render, say so up front
+def test_empty_recording_is_refused(tmp_path):
+    filename = str(tmp_path / 'empty.rec')
+    SnapshotRecorder(filename).close()
+    for output in ('run.gif', 'frames'):
+        with pytest.raises(RuntimeError, match='no snapshots'):
+            render_recording(filename, str(tmp_path / output))
+    assert not (tmp_path / 'frames').exists()
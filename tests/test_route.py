@@ -0,0 +1,28 @@
+import numpy as np
+
+from ant_farm import Route, as_route, pack_routes, unpack_routes
+
+
+def test_route_round_trips_positions():
+    positions = [(0, 0), (0, 1), (1, 2), (2, 2), (3, 49), (39, 0)]
+    route = Route.from_positions(positions, 50)
+    assert route.flat.dtype == np.int32
+    assert list(route) == positions
+    assert [route[i] for i in range(len(route))] == positions
+    assert route[-1] == (39, 0)
+    assert np.asarray(route).tolist() == [list(p) for p in positions]
+    assert list(route[1:3]) == positions[1:3]
+    assert as_route(positions, 50) == route
+    assert as_route(route, 50) is route
+    assert Route.from_positions(list(route), 50) == route
+
+
+# joined legs share the cell where they meet once, packed routes come back equal
+def test_route_join_and_pack():
+    first = Route.from_positions([(0, 0), (1, 1), (2, 2)], 10)
+    second = Route.from_positions([(2, 2), (2, 3)], 10)
+    assert list(Route.join([first, second])) == [(0, 0), (1, 1), (2, 2), (2, 3)]
+
+    routes = [first, None, second]
+    assert unpack_routes(pack_routes('legs', routes), 'legs', 10) == routes
+    assert unpack_routes(pack_routes('legs', []), 'legs', 10) == []
@@ -0,0 +1,19 @@
+from ant_farm import RecentRoutes, RouteSink
+
+
+# segment mode must hand its routes to all_routes like the whole-route mode does
+def test_segment_mode_records_routes(small_farm):
+    for segment_by_segment in (False, True):
+        farm = small_farm(segment_by_segment=segment_by_segment, num_ants=10)
+        farm.all_routes = RecentRoutes(1000)
+        farm.run_iteration()
+        walked = sum(len(group) for group in farm.last_routes)
+        assert walked > 0
+        assert len(farm.all_routes) == walked
+        assert len(list(farm.all_routes)) == walked
+
+
+def test_legacy_class_route_lists_are_bounded(small_farm):
+    farm = small_farm(segment_by_segment=True)
+    assert isinstance(farm.all_routes_people, RouteSink)
+    assert isinstance(farm.all_routes_carts, RouteSink)
@@ -0,0 +1,74 @@
+from collections import deque
+
+import numpy as np
+
+from ant_farm import AntFarm, NeighborTable, shortest_path_tree, trace_path
+
+
+# steps from source to every flat cell by a plain breadth-first search, -1 where unreachable
+def bfs_steps(table, source):
+    dist = [-1] * table.size
+    dist[source] = 0
+    queue = deque([source])
+    while queue:
+        cell = queue.popleft()
+        for nbr in table.neighbors(cell):
+            if dist[nbr] < 0:
+                dist[nbr] = dist[cell] + 1
+                queue.append(nbr)
+    return dist
+
+
+def test_shortest_path_tree_matches_bfs():
+    enterable = np.random.default_rng(0).random((25, 30)) > 0.3
+    table = NeighborTable(enterable)
+    for source in (0, 377, table.size - 1):
+        dist, parent = shortest_path_tree(table, source)
+        assert dist.tolist() == bfs_steps(table, source)
+        for target in np.flatnonzero(dist >= 0)[::7].tolist():
+            path = trace_path(dist, parent, target).tolist()
+            assert path[0] == source and path[-1] == target
+            assert len(path) == dist[target] + 1
+            assert all(b in table.neighbors(a) for a, b in zip(path, path[1:]))
+        assert all(trace_path(dist, parent, t) is None for t in np.flatnonzero(dist < 0).tolist())
+
+
+def layout_farm(sequential):
+    farm = AntFarm(grid_size=(30, 40), cart_size=(2, 2))
+    farm.obstacles[10:20, 15:25] = True
+    farm.obstacles[0:25, 30] = True
+    farm.set_start_end((2, 2), [(25, 35), (2, 35), (27, 5)], sequential=sequential,
+                       return_to_start=sequential)
+    farm.num_ants = 10
+    farm.rng = np.random.default_rng(0)
+    return farm
+
+
+# the optimal length adds up breadth-first leg steps, and no ant route beats it
+def test_optimal_length_matches_bfs_legs():
+    for sequential in (True, False):
+        farm = layout_farm(sequential)
+        table = farm.get_neighbor_table(True)
+        if sequential:
+            stops = [farm.start] + farm.ends + [farm.start]
+            steps = [bfs_steps(table, table.to_flat(a))[table.to_flat(b)]
+                     for a, b in zip(stops, stops[1:])]
+            expected = sum(steps) + 1
+        else:
+            start = bfs_steps(table, table.to_flat(farm.start))
+            expected = sum(start[table.to_flat(e)] + 1 for e in farm.ends)
+        assert farm.optimal_length() == expected
+
+        for _ in range(3):
+            farm.run_iteration()
+        assert farm.current_best_length() >= expected
+        farm.solve_exact()
+        assert farm.current_best_length() == expected
+
+
+def test_optimal_length_is_inf_for_unreachable_stop():
+    farm = layout_farm(True)
+    farm.obstacles[26:, 0:10] = True
+    farm.obstacles[27, 5] = False
+    farm.invalidate_layout_cache()
+    assert farm.optimal_length() == float('inf')
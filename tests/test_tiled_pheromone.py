@@ -0,0 +1,53 @@
+import numpy as np
+
+from ant_farm import update_pheromone_grid
+from tiled_pheromone import TiledPheromone
+
+
+def random_route(rng, shape, corner):
+    steps = rng.integers(-1, 2, size=(rng.integers(5, 30), 2))
+    cells = np.clip(np.cumsum(steps, axis=0) + corner, 0, np.array(shape) - 1)
+    return [tuple(cell) for cell in cells.tolist()]
+
+
+# deposits, evaporation and compaction give the dense grid within rounding, and tiles the
+# ants stop visiting fade back to the floor and are released
+def test_tiled_matches_dense_grid():
+    rng = np.random.default_rng(0)
+    shape = (70, 90) # not a multiple of the tile size
+    dense = np.full(shape, 0.1)
+    tiled = TiledPheromone(shape, tile=16, compact_every=5)
+    peak = 0
+
+    for iteration in range(120):
+        # ants roam one corner first, then only the other one, so the first corner fades
+        corner = (10, 10) if iteration < 40 else (55, 75)
+        routes = [random_route(rng, shape, corner) for _ in range(4)]
+        update_pheromone_grid(dense, routes, 0.1, 100.0)
+        update_pheromone_grid(tiled, routes, 0.1, 100.0)
+        if iteration in (39, 119):
+            np.testing.assert_allclose(np.asarray(tiled), dense, rtol=1e-9)
+            cells = rng.integers(0, dense.size, size=200)
+            np.testing.assert_allclose(tiled.reshape(-1)[cells], dense.reshape(-1)[cells], rtol=1e-9)
+            y, x = routes[0][-1]
+            assert np.isclose(tiled[y, x], dense[y, x], rtol=1e-9)
+        peak = max(peak, tiled.allocated_tiles)
+
+    assert tiled.allocated_tiles < peak
+    assert tiled.allocated_tiles < tiled._slot.size // 4
+    assert tiled.nbytes < dense.nbytes
+
+
+def test_tiled_from_dense_and_region_writes():
+    rng = np.random.default_rng(1)
+    dense = np.full((40, 50), 0.1)
+    dense[5:12, 30:45] = rng.random((7, 15)) + 0.2
+    tiled = TiledPheromone.from_dense(dense, tile=16)
+    np.testing.assert_array_equal(np.asarray(tiled), dense)
+    assert tiled.allocated_tiles == 2
+
+    tiled[20:40, 0:10] = 0.1
+    assert tiled.allocated_tiles == 2
+    tiled[20:25, 0:10] = 3.0
+    dense[20:25, 0:10] = 3.0
+    np.testing.assert_array_equal(np.asarray(tiled), dense)
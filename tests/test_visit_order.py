@@ -0,0 +1,48 @@
+from itertools import permutations
+
+import numpy as np
+
+from ant_farm import held_karp_order, improve_order, nearest_neighbor_order, order_length, solve_visit_order
+
+
+def brute_force_length(dist, return_to_start):
+    return min(order_length(dist, order, return_to_start)
+               for order in permutations(range(1, len(dist))))
+
+
+def random_costs(rng, n, symmetric):
+    points = rng.integers(0, 50, size=(n + 1, 2))
+    dist = np.abs(points[:, None] - points[None]).max(axis=2).astype(float)
+    if not symmetric:
+        dist += rng.integers(0, 10, size=dist.shape) * (1 - np.eye(n + 1))
+    return dist
+
+
+def test_held_karp_matches_brute_force():
+    rng = np.random.default_rng(0)
+    for n in range(1, 8):
+        for symmetric in (True, False):
+            dist = random_costs(rng, n, symmetric)
+            for return_to_start in (False, True):
+                order = held_karp_order(dist, return_to_start)
+                assert sorted(order) == list(range(1, n + 1))
+                assert order_length(dist, order, return_to_start) == brute_force_length(dist, return_to_start)
+
+
+# stops that cannot be reached make every order infinite, each stop is still visited once
+def test_held_karp_with_unreachable_stop():
+    dist = random_costs(np.random.default_rng(1), 4, True)
+    dist[:, 2] = dist[2, :] = np.inf
+    dist[2, 2] = 0
+    assert sorted(held_karp_order(dist)) == [1, 2, 3, 4]
+
+
+# longer lists use the heuristic path, which must visit every stop and never beat the exact one
+def test_heuristic_order_is_a_permutation_and_not_shorter():
+    rng = np.random.default_rng(2)
+    dist = random_costs(rng, 9, True)
+    exact = order_length(dist, held_karp_order(dist))
+    heuristic = improve_order(dist, nearest_neighbor_order(dist))
+    assert sorted(heuristic) == list(range(1, 10))
+    assert order_length(dist, heuristic) >= exact
+    assert solve_visit_order(dist, exact_limit=5) == heuristic
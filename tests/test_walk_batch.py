@@ -0,0 +1,59 @@
+import numpy as np
+
+from ant_farm import AntFarm, walk_batch
+
+
+def walk(rng, num_ants=200):
+    farm = AntFarm(grid_size=(30, 40))
+    farm.obstacles[5:25, 12:14] = True
+    farm.obstacles[5:7, 12:30] = True
+    farm.obstacles[0:20, 26:28] = True
+    table = farm.get_neighbor_table(False)
+    targets = [(28, 38), (2, 20)]
+    flat_targets = [table.to_flat(t) for t in targets]
+    heuristics = [farm.get_heuristic(t, False) for t in targets]
+    start = table.to_flat((2, 2))
+    paths = walk_batch(table, farm.pheromone, heuristics, start, flat_targets, num_ants,
+                       1.0, table.size, rng)
+    return table, start, flat_targets, paths
+
+
+# every step is a legal move, cells are only revisited when all neighbors were visited on the
+# same leg, and every route ends on the last target after passing the earlier ones in order
+def assert_valid_walks(table, start, targets, paths):
+    assert any(path is not None for path in paths)
+    for path in paths:
+        if path is None:
+            continue
+        path = path.tolist()
+        assert path[0] == start and path[-1] == targets[-1]
+        leg, visited = 0, {start}
+        for here, there in zip(path, path[1:]):
+            nbrs = table.neighbors(here)
+            assert there in nbrs
+            if there in visited:
+                assert all(n in visited for n in nbrs)
+            visited.add(there)
+            if there == targets[leg] and leg < len(targets) - 1:
+                leg, visited = leg + 1, {there}
+        assert leg == len(targets) - 1
+
+
+def test_walk_batch_routes_are_valid():
+    assert_valid_walks(*walk(np.random.default_rng(0)))
+
+
+# draws exactly at the top of the range, where a scaled draw equals the total weight
+class TopDraws:
+    def random(self, n):
+        return np.ones(n)
+
+
+# a draw equal to the total must still pick the last neighbor with weight, not a padded slot
+def test_walk_batch_draw_at_total_stays_on_neighbors():
+    farm = AntFarm(grid_size=(10, 10))
+    table = farm.get_neighbor_table(False)
+    start, target = table.to_flat((2, 2)), table.to_flat((3, 3))
+    paths = walk_batch(table, farm.pheromone, [farm.get_heuristic((3, 3), False)], start, [target],
+                       3, 1.0, 100, TopDraws())
+    assert [path.tolist() for path in paths] == [[start, target]] * 3